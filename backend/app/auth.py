@@ -1,6 +1,7 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
+from .core.logs import user_id_var
 from .database import get_database
 import logging
 from jose import JWTError, jwt
@@ -43,17 +44,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         
         # Buscar o usuário no banco de dados
         db = get_database()
-        user = db.users.find_one({"_id": user_id})
+        user = await db.users.find_one({"_id": user_id})
         
         if not user:
-            logger.error(f"Usuário não encontrado para o ID: {user_id}")
+            logger.warning("Usuário do token não encontrado", extra={"fields": {"token_user_id": user_id}})
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Usuário não encontrado",
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        logger.info(f"Usuário encontrado: {user}")
+        user_id_var.set(str(user["_id"]))
         return {
             "id": str(user["_id"]),
             "phone": user["phone"]
@@ -65,7 +66,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     except Exception as e:
-        logger.error(f"Erro ao buscar usuário: {str(e)}")
+        logger.error("Erro ao buscar usuário: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Erro ao processar autenticação"
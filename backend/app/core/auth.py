@@ -1,27 +1,27 @@
 from fastapi import HTTPException, status, Request
 import uuid
+from .logs import user_id_var
+from .sessions import SESSION_TTL_SECONDS, get_session_backend
 
-# Armazenamento de sessões em memória (em produção, use Redis ou banco de dados)
-sessions = {}
-
-def get_current_user(request: Request):
+async def get_current_user(request: Request):
     session_id = request.cookies.get("session_id")
-    if not session_id or session_id not in sessions:
+    session = await get_session_backend().get(session_id) if session_id else None
+    if not session:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuário não autenticado"
         )
-    return sessions[session_id]
+    user_id_var.set(session["id"])
+    return session
 
-def create_session(user_data: dict) -> str:
+async def create_session(user_data: dict) -> str:
     session_id = str(uuid.uuid4())
-    sessions[session_id] = {
+    await get_session_backend().set(session_id, {
         "id": str(user_data["_id"]),
         "first_name": user_data["first_name"],
         "phone": user_data["phone"]
-    }
+    }, SESSION_TTL_SECONDS)
     return session_id
 
-def delete_session(session_id: str):
-    if session_id in sessions:
-        del sessions[session_id] 
\ No newline at end of file
+async def delete_session(session_id: str):
+    await get_session_backend().delete(session_id)
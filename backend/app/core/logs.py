@@ -0,0 +1,230 @@
+"""Logging da aplicação: fila em memória, JSON estruturado e redação de dados.
+
+O handler do logger raiz só coloca o registro em uma fila limitada; a
+formatação e a escrita no terminal acontecem em uma thread separada
+(QueueListener), então um stdout lento não trava o event loop. Com a fila
+cheia o registro é descartado e contado, em vez de bloquear a requisição.
+
+Use os argumentos do logging em vez de f-strings (`logger.info("x %s", y)`):
+a mensagem só é montada se o nível estiver ativo, e já na thread de escrita.
+Campos estruturados vão em `extra={"fields": {...}}`.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Configurações de logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.01))
+LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", 1000))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Contexto da requisição atual, preenchido pelo middleware e pela autenticação
+request_id_var = contextvars.ContextVar("request_id", default=None)
+user_id_var = contextvars.ContextVar("user_id", default=None)
+
+# --- redação ---
+
+# Campos que nunca vão para o log com o valor original
+REDACTED_FIELDS = {"password", "hashed_password", "message", "body", "recipient_phone", "phone", "to"}
+_BCRYPT_RE = re.compile(r"\$2[aby]?\$\d{2}\$[./A-Za-z0-9]{53}")
+_PHONE_RE = re.compile(r"(?<!\w)\+?\d[\d\s().-]{8,16}\d(?!\w)")
+_URI_PASSWORD_RE = re.compile(r"(://[^:/@\s]+:)[^@/\s]+@")
+
+
+def _mask_phone(match) -> str:
+    digits = re.sub(r"\D", "", match.group(0))
+    if len(digits) < 10 or len(digits) > 13:
+        return match.group(0)
+    return "*" * (len(digits) - 2) + digits[-2:]
+
+
+def redact_text(text: str) -> str:
+    text = _BCRYPT_RE.sub("[hash]", text)
+    text = _URI_PASSWORD_RE.sub(r"\1***@", text)
+    return _PHONE_RE.sub(_mask_phone, text)
+
+
+def redact(value, key: str = None):
+    """Remove telefones, corpos de mensagem e hashes de um valor qualquer."""
+    if key is not None and key.lower() in REDACTED_FIELDS and value is not None:
+        if key.lower() in ("phone", "recipient_phone", "to"):
+            return _PHONE_RE.sub(_mask_phone, str(value))
+        return "[redacted]"
+    if isinstance(value, dict):
+        return {k: redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+# --- filtros e formatadores ---
+
+class ContextFilter(logging.Filter):
+    # Roda na thread de quem loga: é o único lugar em que o contexto existe
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.user_id = user_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar só uma fração dos registros de DEBUG (os de maior volume)."""
+
+    def __init__(self, rate: float = LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact_text(record.getMessage()),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "user_id", None):
+            entry["user_id"] = record.user_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(redact(fields))
+        if record.exc_info:
+            entry["exc"] = redact_text(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in redact(fields).items())
+        return redact_text(text)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Só enfileira; formatação e escrita ficam com o QueueListener."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # O QueueHandler padrão formata aqui, na thread da requisição; como o
+        # listener está no mesmo processo, o registro segue como está
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_handler = None
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream=None):
+    """Configura o logger raiz com a fila; chamadas repetidas não duplicam handlers."""
+    global _listener, _handler
+    if _listener is not None:
+        return _handler
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    _handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _handler.addFilter(SamplingFilter())
+    _handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, output)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _handler
+
+
+def shutdown_logging():
+    # Escreve o que ainda está na fila antes de o processo sair
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# --- contexto por requisição ---
+
+class RequestContextMiddleware:
+    """Middleware ASGI que dá um id a cada requisição e registra as lentas.
+
+    O id vem do cabeçalho X-Request-ID (ou é gerado) e volta na resposta.
+    Requisições com erro 5xx ou acima de LOG_SLOW_REQUEST_MS viram INFO/ERROR
+    com a latência; as demais só aparecem como DEBUG amostrado.
+    """
+
+    def __init__(self, app, slow_ms: float = LOG_SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.logger = logging.getLogger("app.requests")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        user_token = user_id_var.set(None)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            level = logging.ERROR if status_code >= 500 else (
+                logging.INFO if latency_ms >= self.slow_ms else logging.DEBUG
+            )
+            if self.logger.isEnabledFor(level):
+                self.logger.log(level, "%s %s %s", scope["method"], scope["path"], status_code, extra={"fields": {
+                    "status": status_code,
+                    "latency_ms": round(latency_ms, 2),
+                }})
+            request_id_var.reset(token)
+            user_id_var.reset(user_token)
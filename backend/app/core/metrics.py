@@ -0,0 +1,256 @@
+"""Métricas no formato texto do Prometheus, sem dependências externas.
+
+Só o necessário para /metrics: contadores, gauges (com valor fixo ou lido
+na hora da coleta) e histogramas com labels. Cada série guarda seus números
+em uma lista protegida por um lock, então observar um valor custa uma busca
+binária e dois incrementos, inclusive a partir das threads do driver do
+MongoDB e do publicador do RabbitMQ.
+"""
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pymongo import monitoring
+
+# Buckets padrão em segundos, de 1ms a 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("METRICS_EVENT_LOOP_LAG_INTERVAL_SECONDS", 0.5))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Sem labels, o valor pode vir de uma função lida na hora da coleta
+        self.function = function
+        self._lock = threading.Lock()
+        self._series = {}
+        if registry is not None:
+            registry.register(self)
+
+    def samples(self):
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                return []
+            return [f"{self.name} {_number(value)}"] if value is not None else []
+        with self._lock:
+            series = list(self._series.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in series]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._series[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        # Série = [contagem por bucket..., +Inf, soma]
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        lines = []
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+# --- métricas compartilhadas ---
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Duração das requisições HTTP por rota e status",
+    ("method", "route", "status"),
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds", "Duração dos comandos do MongoDB por coleção e operação",
+    ("collection", "command", "outcome"),
+)
+RABBITMQ_CONFIRM_DURATION = Histogram(
+    "rabbitmq_publish_confirm_seconds", "Tempo entre a publicação e a confirmação do broker",
+    ("outcome",),
+)
+RABBITMQ_PUBLISH_DURATION = Histogram(
+    "rabbitmq_publish_many_seconds", "Duração de uma chamada publish_many (publicação e confirmações)",
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Atraso do event loop em relação ao intervalo esperado",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mede cada requisição HTTP.
+
+    A rota é o caminho declarado (ex.: /api/messages), descoberto pelo
+    endpoint que o roteador gravou no scope, para não criar uma série por URL.
+    """
+
+    def __init__(self, app, histogram: Histogram = HTTP_REQUEST_DURATION):
+        self.app = app
+        self.histogram = histogram
+        self._routes = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.histogram.observe(
+                time.perf_counter() - started,
+                scope["method"], self._route(scope), status_code,
+            )
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "<unmatched>"
+        path = self._routes.get(endpoint)
+        if path is None:
+            app = scope.get("app")
+            path = next(
+                (route.path for route in getattr(app, "routes", []) if getattr(route, "endpoint", None) is endpoint),
+                "<unmatched>",
+            )
+            self._routes[endpoint] = path
+        return path
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Listener do pymongo que mede cada comando por coleção e operação."""
+
+    def __init__(self, histogram: Histogram = MONGO_COMMAND_DURATION):
+        self.histogram = histogram
+        self._collections = {}
+
+    def started(self, event):
+        # O nome da coleção só vem no comando; guarda até a resposta chegar
+        collection = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else "-"
+        )
+
+    def succeeded(self, event):
+        self._observe(event, "ok")
+
+    def failed(self, event):
+        self._observe(event, "error")
+
+    def _observe(self, event, outcome):
+        collection = self._collections.pop((event.connection_id, event.request_id), "-")
+        self.histogram.observe(event.duration_micros / 1_000_000, collection, event.command_name, outcome)
+
+
+async def watch_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL_SECONDS, histogram: Histogram = EVENT_LOOP_LAG):
+    # Dorme um intervalo fixo e registra quanto a volta passou do esperado
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        histogram.observe(max(0.0, loop.time() - started - interval))
+
+
+def serve(port: int, registry: Registry = REGISTRY):
+    """Expõe /metrics em uma thread, para os processos sem FastAPI (agendador, worker)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,69 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from .security import pwd_context
+
+# Configurações do pool de hashing de senhas
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_MAX_QUEUE = int(os.getenv("PASSWORD_MAX_QUEUE", 64))
+
+
+class PasswordPoolBusy(Exception):
+    """Fila do pool de senhas cheia; a requisição deve ser recusada com 503."""
+
+
+_executor = None
+_in_flight = 0
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn evita herdar por fork as threads do motor e do publicador
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str):
+    return pwd_context.verify_and_update(password, hashed)
+
+
+async def _run(fn, *args):
+    # Até PASSWORD_WORKERS tarefas rodam ao mesmo tempo e até PASSWORD_MAX_QUEUE
+    # esperam na fila; além disso a carga é descartada
+    global _in_flight
+    if _in_flight >= PASSWORD_WORKERS + PASSWORD_MAX_QUEUE:
+        raise PasswordPoolBusy()
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def verify_password(password: str, hashed: str):
+    """Retorna (válida, novo_hash); novo_hash vem preenchido quando o custo mudou."""
+    return await _run(_verify_and_update, password, hashed)
+
+
+def queue_depth() -> int:
+    return max(0, _in_flight - PASSWORD_WORKERS)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo.errors import OperationFailure, PyMongoError
+from .cache import TTLCache
+from .metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Configurações de sessão
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "mongo")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 24 * 60 * 60))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 10000))
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", 5))
+SESSION_WATCH_MAX_RETRY_DELAY_SECONDS = float(os.getenv("SESSION_WATCH_MAX_RETRY_DELAY_SECONDS", 30))
+
+# "$changeStream is only supported on replica sets"
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+class SessionBackend(ABC):
+    """Interface dos armazenamentos de sessão."""
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def set(self, session_id: str, data: dict, ttl_seconds: int):
+        ...
+
+    @abstractmethod
+    async def delete(self, session_id: str):
+        ...
+
+
+class MemorySessionBackend(SessionBackend):
+    # Só serve para um único processo (desenvolvimento e testes)
+    def __init__(self):
+        self._sessions = {}
+
+    async def get(self, session_id):
+        item = self._sessions.get(session_id)
+        if item is None:
+            return None
+        expires_at, data = item
+        if expires_at < time.time():
+            del self._sessions[session_id]
+            return None
+        return data
+
+    async def set(self, session_id, data, ttl_seconds):
+        self._sessions[session_id] = (time.time() + ttl_seconds, data)
+
+    async def delete(self, session_id):
+        self._sessions.pop(session_id, None)
+
+
+class MongoSessionBackend(SessionBackend):
+    """Sessões na coleção `sessions`, compartilhadas entre workers e réplicas.
+
+    O índice TTL em expires_at faz o MongoDB apagar as sessões vencidas; como
+    o monitor de TTL roda a cada ~60s, a expiração também é conferida na leitura.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, session_id):
+        doc = await self.collection.find_one({"_id": session_id})
+        if doc is None or doc["expires_at"] < datetime.utcnow():
+            return None
+        return doc["data"]
+
+    async def set(self, session_id, data, ttl_seconds):
+        await self.collection.insert_one({
+            "_id": session_id,
+            "data": data,
+            "expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds),
+        })
+
+    async def delete(self, session_id):
+        await self.collection.delete_one({"_id": session_id})
+
+
+class CachedSessionBackend(SessionBackend):
+    """Cache LRU local com TTL curto na frente de outro backend.
+
+    A maioria das requisições autenticadas é resolvida sem sair do processo.
+    No logout a sessão sai do cache local e do banco; nos outros processos
+    ela some pelo change stream (quando disponível) ou, no pior caso, quando
+    o TTL do cache vence.
+    """
+
+    def __init__(self, backend: SessionBackend, maxsize: int = SESSION_CACHE_SIZE,
+                 ttl_seconds: float = SESSION_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.cache = TTLCache(maxsize, ttl_seconds)
+
+    async def get(self, session_id):
+        data = self.cache.get(session_id)
+        if data is None:
+            data = await self.backend.get(session_id)
+            if data is not None:
+                self.cache.set(session_id, data)
+        return data
+
+    async def set(self, session_id, data, ttl_seconds):
+        await self.backend.set(session_id, data, ttl_seconds)
+        self.cache.set(session_id, data)
+
+    async def delete(self, session_id):
+        self.cache.pop(session_id)
+        await self.backend.delete(session_id)
+
+    async def watch_invalidations(self):
+        # Remove do cache local as sessões apagadas por outros processos
+        collection = getattr(self.backend, "collection", None)
+        if collection is None:
+            return
+        delay = 1.0
+        retrying = False
+        while True:
+            try:
+                async with collection.watch([{"$match": {"operationType": "delete"}}]) as stream:
+                    if retrying:
+                        # Logouts durante a queda não chegaram: o cache local recomeça do banco
+                        self.cache.clear()
+                    delay, retrying = 1.0, False
+                    async for change in stream:
+                        self.cache.pop(change["documentKey"]["_id"])
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning("Change streams indisponíveis (%s); logout propaga pelo TTL do cache", e)
+                    return
+                logger.error("Erro ao acompanhar invalidações de sessão: %s", e)
+            except PyMongoError as e:
+                logger.error("Erro ao acompanhar invalidações de sessão: %s", e)
+            retrying = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, SESSION_WATCH_MAX_RETRY_DELAY_SECONDS)
+
+
+_backend = None
+
+
+def _cache_stat(name):
+    # Lido na coleta do /metrics; sem cache local não há série
+    def read():
+        if isinstance(_backend, CachedSessionBackend):
+            return getattr(_backend.cache, name)
+        return None
+    return read
+
+
+SESSION_CACHE_HITS = Counter("session_cache_hits_total", "Sessões resolvidas pelo cache local",
+                             function=_cache_stat("hits"))
+SESSION_CACHE_MISSES = Counter("session_cache_misses_total", "Sessões buscadas no banco",
+                               function=_cache_stat("misses"))
+SESSION_CACHE_HIT_RATIO = Gauge("session_cache_hit_ratio", "Taxa de acerto do cache local de sessões",
+                                function=_cache_stat("hit_ratio"))
+
+
+def get_session_backend() -> SessionBackend:
+    global _backend
+    if _backend is None:
+        if SESSION_BACKEND == "memory":
+            _backend = MemorySessionBackend()
+        else:
+            from mongodb_config import get_async_database
+            _backend = CachedSessionBackend(MongoSessionBackend(get_async_database()["sessions"]))
+    return _backend
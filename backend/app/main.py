@@ -1,18 +1,16 @@
-import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from .core.logs import RequestContextMiddleware, setup_logging
+from .core.passwords import PasswordPoolBusy
 from .routes import auth, messages
 
-# Configuração do logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()  # Isso fará os logs aparecerem no terminal
-    ]
-)
+# Configuração do logging (fila + thread de escrita, JSON com redação)
+setup_logging()
 
 app = FastAPI()
+app.add_middleware(RequestContextMiddleware)
+# /api/token recusa com 503 quando o pool de senhas está cheio
+app.add_exception_handler(PasswordPoolBusy, auth.password_pool_busy_handler)
 
 # Configuração do CORS
 app.add_middleware(
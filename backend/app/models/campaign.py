@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationInfo, field_serializer, field_validator
+from .message import check_reminder_days, event_date_to_utc
+
+class CampaignStatus:
+    CRIADA = "Criada"              # aguardando a lista de destinatários
+    IMPORTANDO = "Importando"      # lista sendo recebida
+    PRONTA = "Pronta"              # lista importada; mensagens agendadas
+    INTERROMPIDA = "Interrompida"  # a importação parou; reenviar o mesmo arquivo continua
+
+class CampaignInput(BaseModel):
+    name: str = Field(..., description="Nome da campanha")
+    template: str = Field(..., description="Texto com variáveis entre chaves, ex.: Olá {nome}")
+    event_date: datetime = Field(..., description="Data do evento no formato ISO; a lista pode sobrescrever por destinatário")
+    reminder_days: int = Field(..., description="Número de dias para lembrete")
+
+    @field_validator('name')
+    @classmethod
+    def validate_name(cls, v):
+        if not v or len(v.strip()) == 0:
+            raise ValueError('O nome da campanha não pode estar vazio')
+        return v.strip()
+
+    @field_validator('template')
+    @classmethod
+    def validate_template(cls, v):
+        if not v or len(v.strip()) == 0:
+            raise ValueError('O texto da campanha não pode estar vazio')
+        return v
+
+    @field_validator('event_date')
+    @classmethod
+    def validate_event_date(cls, v):
+        return event_date_to_utc(v)
+
+    @field_validator('reminder_days')
+    @classmethod
+    def validate_reminder_days(cls, v, info: ValidationInfo):
+        return check_reminder_days(v, info.data.get('event_date'))
+
+class CampaignProgress(BaseModel):
+    rows_read: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    duplicates: int = Field(0, description="Linhas já importadas em um envio anterior da mesma lista")
+    bytes_read: int = 0
+    errors: List[str] = Field(default_factory=list, description="Primeiros erros por linha")
+
+class Campaign(CampaignInput):
+    id: str = Field(..., alias="_id", description="ID único da campanha")
+    sender_id: str
+    fields: List[str] = Field(..., description="Variáveis usadas no texto")
+    status: str = CampaignStatus.CRIADA
+    progress: CampaignProgress = Field(default_factory=CampaignProgress)
+    created_at: Optional[datetime] = None
+    imported_at: Optional[datetime] = None
+
+    @field_serializer('event_date', 'created_at', 'imported_at', when_used='json')
+    def serialize_utc(self, value):
+        return value.replace(tzinfo=timezone.utc).isoformat() if value is not None else None
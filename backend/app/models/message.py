@@ -1,29 +1,100 @@
-from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel, Field, field_validator
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field, ValidationInfo, field_serializer, field_validator
 import uuid
 
+# Código do país dos números nacionais (DDD + número)
+COUNTRY_CODE = "55"
+
+# Lembrete mais antecipado aceito (10 anos)
+MAX_REMINDER_DAYS = 3650
+
+def to_utc_naive(value: datetime) -> datetime:
+    # O banco guarda datas em UTC sem fuso; datas sem fuso já são tratadas como UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def normalize_phone(value: str) -> str:
+    # Remove todos os caracteres não numéricos
+    numbers = ''.join(filter(str.isdigit, value))
+    if len(numbers) < 10 or len(numbers) > 11:
+        raise ValueError('O número de telefone deve ter entre 10 e 11 dígitos')
+    return numbers
+
+def phone_number(phone: str) -> int:
+    """Número em E.164 como inteiro: 11987654321, "+55 (11) 98765-4321" -> 5511987654321."""
+    digits = ''.join(filter(str.isdigit, str(phone)))
+    if not digits:
+        raise ValueError(f"Número de telefone inválido: {phone!r}")
+    # Com 10 ou 11 dígitos é um número nacional (DDD + número), mesmo que o DDD seja 55
+    if len(digits) <= 11:
+        digits = COUNTRY_CODE + digits
+    return int(digits)
+
+def event_date_to_utc(value: datetime) -> datetime:
+    # to_utc_naive para datas recebidas: as que não cabem em UTC viram erro de validação
+    try:
+        return to_utc_naive(value)
+    except OverflowError:
+        raise ValueError('A data do evento está fora do intervalo aceito')
+
+def check_reminder_days(reminder_days: int, event_date: Optional[datetime] = None) -> int:
+    if reminder_days < 0:
+        raise ValueError('O número de dias para lembrete não pode ser negativo')
+    if reminder_days > MAX_REMINDER_DAYS:
+        raise ValueError(f'O número de dias para lembrete não pode passar de {MAX_REMINDER_DAYS}')
+    if event_date is not None and event_date - datetime.min < timedelta(days=reminder_days):
+        # O momento de envio (data do evento menos os dias) cairia antes do ano 1
+        raise ValueError('O lembrete cai antes da menor data aceita')
+    return reminder_days
+
+def utc_now() -> datetime:
+    # Truncado em milissegundos, a precisão das datas BSON, para o valor
+    # devolvido na criação ser igual ao que a listagem lê depois
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+class MessageStatus:
+    # Ciclo de vida de uma mensagem agendada
+    PROCESSANDO = "Processando"  # aguardando a data de envio
+    AGENDADA = "Agendada"        # reservada por uma réplica do agendador
+    ENFILEIRADA = "Enfileirada"  # publicada no RabbitMQ
+    ENVIADA = "Enviada"          # aceita pelo provedor de SMS
+    FALHOU = "Falhou"            # rejeitada pelo provedor
+
+    FINAL = (ENVIADA, FALHOU)
+
+# Mensagens finalizadas que saíram da coleção messages (app/services/archive.py)
+ARCHIVE_COLLECTION = "messages_archive"
+
 class MessageInput(BaseModel):
     recipient_phone: str = Field(..., description="Número de telefone do destinatário")
     message: str = Field(..., description="Conteúdo da mensagem")
-    event_date: str = Field(..., description="Data do evento no formato ISO")
+    event_date: datetime = Field(..., description="Data do evento no formato ISO")
     reminder_days: int = Field(..., description="Número de dias para lembrete")
 
     @field_validator('recipient_phone')
     @classmethod
     def validate_phone(cls, v):
-        # Remove todos os caracteres não numéricos
-        numbers = ''.join(filter(str.isdigit, v))
-        if len(numbers) < 10 or len(numbers) > 11:
-            raise ValueError('O número de telefone deve ter entre 10 e 11 dígitos')
-        return numbers
+        # Importado aqui: a lista de bloqueio usa phone_number deste módulo
+        from ..services.blocklist import is_blocked
+
+        phone = normalize_phone(v)
+        # Consulta a cópia em memória da lista de bloqueio, sem ir ao banco
+        if is_blocked(phone):
+            raise ValueError('Este número está bloqueado para envio')
+        return phone
+
+    @field_validator('event_date')
+    @classmethod
+    def validate_event_date(cls, v):
+        return event_date_to_utc(v)
 
     @field_validator('reminder_days')
     @classmethod
-    def validate_reminder_days(cls, v):
-        if v < 0:
-            raise ValueError('O número de dias para lembrete não pode ser negativo')
-        return v
+    def validate_reminder_days(cls, v, info: ValidationInfo):
+        return check_reminder_days(v, info.data.get('event_date'))
 
     @field_validator('message')
     @classmethod
@@ -35,8 +106,13 @@ class MessageInput(BaseModel):
 class Message(MessageInput):
     id: str = Field(..., alias="_id", description="ID único da mensagem")
     sender_id: str = Field(..., description="ID do usuário que enviou a mensagem")
-    status: str = Field(default="Processando", description="Status da mensagem")
-    created_at: Optional[str] = None
+    status: str = Field(default=MessageStatus.PROCESSANDO, description="Status da mensagem")
+    created_at: Optional[datetime] = None
+
+    @field_serializer('event_date', 'created_at', when_used='json')
+    def serialize_utc(self, value):
+        # Com o fuso explícito o navegador não lê a data como horário local
+        return value.replace(tzinfo=timezone.utc).isoformat() if value is not None else None
 
     model_config = {
         "json_schema_extra": {
@@ -49,4 +125,25 @@ class Message(MessageInput):
                 "reminder_days": 1
             }
         }
-    } 
\ No newline at end of file
+    } 
+
+class MessageBatchInput(BaseModel):
+    # Itens sem validação aqui: cada um é validado no endpoint e os erros
+    # voltam por índice, sem derrubar o lote inteiro
+    messages: List[Dict[str, Any]] = Field(..., description="Mensagens no formato de MessageInput")
+
+class MessageBatchItemResult(BaseModel):
+    index: int = Field(..., description="Posição do item no lote enviado")
+    id: Optional[str] = Field(None, description="ID da mensagem criada")
+    error: Optional[str] = Field(None, description="Motivo da rejeição do item")
+
+class MessageBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[MessageBatchItemResult]
+
+class MessageStats(BaseModel):
+    scheduled: int = Field(..., description="Mensagens ainda não enviadas (Processando, Agendada ou Enfileirada)")
+    sent: int = Field(..., description="Mensagens enviadas")
+    failed: int = Field(..., description="Mensagens que falharam")
+    total: int
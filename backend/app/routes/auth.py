@@ -1,20 +1,31 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Request, status, Depends
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from ..database import get_database
-from ..auth import pwd_context, create_access_token
+from ..auth import create_access_token
+from ..core.passwords import PasswordPoolBusy
+from mongodb_config import verify_user
 from datetime import timedelta
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+async def password_pool_busy_handler(request: Request, exc: PasswordPoolBusy):
+    # Pico de logins/cadastros: recusa em vez de enfileirar sem limite.
+    # Registrado nos apps que expõem rotas de senha (main.py e app/main.py)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Servidor ocupado, tente novamente em instantes"},
+        headers={"Retry-After": "1"}
+    )
+
 @router.post("/api/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
-        db = get_database()
-        user = db.users.find_one({"phone": form_data.username})
+        # Busca o usuário e confere a senha fora do event loop
+        user = await verify_user(form_data.username, form_data.password)
         
-        if not user or not pwd_context.verify(form_data.password, user["password"]):
+        if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Telefone ou senha incorretos",
@@ -32,8 +43,10 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             "access_token": access_token,
             "token_type": "bearer"
         }
+    except (HTTPException, PasswordPoolBusy):
+        raise
     except Exception as e:
-        logger.error(f"Erro ao fazer login: {str(e)}", exc_info=True)
+        logger.error("Erro ao fazer login: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Erro ao processar login"
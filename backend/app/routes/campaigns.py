@@ -0,0 +1,90 @@
+from fastapi import APIRouter, HTTPException, Request
+from datetime import datetime
+from typing import List
+import logging
+import uuid
+from ..core.auth import get_current_user
+from ..database import get_database
+from ..models.campaign import Campaign, CampaignInput, CampaignProgress, CampaignStatus
+from ..services.campaigns import (
+    CompiledTemplate, ImportInProgress, TooManyRecipients, ingest_recipients, start_import
+)
+from ..services.listing_cache import get_listing_cache
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Tipos aceitos no corpo do envio da lista
+UPLOAD_KINDS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+async def _get_owned_campaign(campaign_id: str, sender_id: str) -> dict:
+    campaign = await get_database().campaigns.find_one({"_id": campaign_id, "sender_id": sender_id})
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campanha não encontrada")
+    return campaign
+
+@router.post("/campaigns", response_model=Campaign)
+async def create_campaign(campaign: CampaignInput, request: Request):
+    current_user = await get_current_user(request)
+    try:
+        template = CompiledTemplate(campaign.template)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    document = campaign.model_dump()
+    document.update({
+        "_id": str(uuid.uuid4()),
+        "sender_id": current_user["id"],
+        "fields": template.fields,
+        "status": CampaignStatus.CRIADA,
+        "progress": CampaignProgress().model_dump(),
+        "created_at": datetime.utcnow(),
+    })
+    await get_database().campaigns.insert_one(document)
+    return Campaign(**document)
+
+@router.get("/campaigns", response_model=List[Campaign])
+async def list_campaigns(request: Request):
+    current_user = await get_current_user(request)
+    cursor = get_database().campaigns.find({"sender_id": current_user["id"]}).sort("created_at", -1).limit(100)
+    return [Campaign(**doc) async for doc in cursor]
+
+@router.get("/campaigns/{campaign_id}", response_model=Campaign)
+async def get_campaign(campaign_id: str, request: Request):
+    # Também serve para acompanhar o progresso de uma importação em andamento
+    current_user = await get_current_user(request)
+    return Campaign(**await _get_owned_campaign(campaign_id, current_user["id"]))
+
+@router.post("/campaigns/{campaign_id}/recipients", response_model=CampaignProgress)
+async def upload_recipients(campaign_id: str, request: Request):
+    """Recebe a lista de destinatários no corpo, em CSV com cabeçalho ou NDJSON.
+
+    O corpo é lido em streaming (ex.: curl --data-binary @lista.csv -H
+    "Content-Type: text/csv"). Colunas: phone (ou telefone), event_date
+    opcional e uma coluna para cada variável do texto.
+    """
+    current_user = await get_current_user(request)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    kind = UPLOAD_KINDS.get(content_type)
+    if kind is None:
+        raise HTTPException(status_code=415, detail="Envie a lista como text/csv ou application/x-ndjson")
+    campaign = await _get_owned_campaign(campaign_id, current_user["id"])
+
+    db = get_database()
+    try:
+        await start_import(db.campaigns, campaign_id)
+    except ImportInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        totals = await ingest_recipients(campaign, request.stream(), kind, db.messages, db.campaigns, db.message_stats)
+    except TooManyRecipients as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    finally:
+        # Mesmo interrompida, parte da lista já está na listagem
+        get_listing_cache().invalidate(current_user["id"])
+    progress = await db.campaigns.find_one({"_id": campaign_id}, {"progress": 1})
+    return CampaignProgress(**{**progress["progress"], **totals})
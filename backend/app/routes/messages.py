@@ -1,68 +1,221 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from typing import List, Optional
 from datetime import datetime
-from ..models.message import Message, MessageInput
+from ..models.message import (
+    Message, MessageBatchInput, MessageBatchItemResult, MessageBatchResult, MessageInput, MessageStats,
+    MessageStatus, utc_now
+)
 from ..database import get_database
 import logging
+import orjson
+import os
 import uuid
-from mongodb_config import get_messages_by_sender
+from mongodb_config import decode_cursor, find_messages_by_sender, get_messages_page
 from ..core.auth import get_current_user
+from ..services.campaigns import get_template_cache
+from ..services.listing_cache import etag_matches, get_listing_cache
+from ..services.message_events import get_message_events
+from ..services.message_stats import get_sender_stats, increment, transition_delta
+from ..services.scheduler import compute_send_at
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Paginação da listagem de mensagens
+DEFAULT_PAGE_SIZE = int(os.getenv("MESSAGES_DEFAULT_PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("MESSAGES_MAX_PAGE_SIZE", 1000))
+
+# Agendamento em lote
+MAX_BATCH_SIZE = int(os.getenv("MESSAGES_MAX_BATCH_SIZE", 20000))
+INSERT_CHUNK_SIZE = int(os.getenv("MESSAGES_INSERT_CHUNK_SIZE", 5000))
+
+def _build_message_document(message: MessageInput, sender_id: str, created_at: datetime) -> dict:
+    message_dict = message.model_dump()
+    
+    # Gerar um ID único para a mensagem
+    message_dict["_id"] = str(uuid.uuid4())
+    
+    # Usar o ID do usuário atual como sender_id
+    message_dict["sender_id"] = sender_id
+    message_dict["created_at"] = created_at
+    message_dict["status"] = MessageStatus.PROCESSANDO
+
+    # event_date já vem do modelo como datetime UTC e vai para o banco como data BSON.
+    # Momento de envio usado pelo agendador (índice ordenado por tempo)
+    message_dict["send_at"] = compute_send_at(message_dict["event_date"], message_dict["reminder_days"])
+    return message_dict
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in error.errors())
+
 @router.post("/messages", response_model=Message)
 async def create_message(message: MessageInput, request: Request):
+    current_user = await get_current_user(request)
     try:
-        current_user = get_current_user(request)
-        logger.info(f"Recebendo mensagem: {message.model_dump()}")
-        logger.info(f"Usuário atual: {current_user}")
-        
         db = get_database()
-        message_dict = message.model_dump()
-        
-        # Gerar um ID único para a mensagem
-        message_id = str(uuid.uuid4())
-        message_dict["_id"] = message_id
-        
-        # Usar o ID do usuário atual como sender_id
-        message_dict["sender_id"] = current_user["id"]
-        message_dict["created_at"] = datetime.utcnow().isoformat()
-        message_dict["status"] = "Processando"
-        
-        # Garantir que event_date seja uma string ISO
-        if isinstance(message_dict["event_date"], datetime):
-            message_dict["event_date"] = message_dict["event_date"].isoformat()
-        
-        logger.info(f"Mensagem processada: {message_dict}")
-        
+        message_dict = _build_message_document(message, current_user["id"], utc_now())
+        logger.debug("Mensagem recebida", extra={"fields": {
+            "message_id": message_dict["_id"], "send_at": message_dict["send_at"],
+        }})
+
         # Inserir a mensagem com o ID gerado
-        db.messages.insert_one(message_dict)
+        await db.messages.insert_one(message_dict)
+        await increment(db.message_stats, current_user["id"], transition_delta(None, MessageStatus.PROCESSANDO))
+        get_listing_cache().invalidate(current_user["id"])
         
         # Retornar a mensagem com o ID gerado
-        message_dict["id"] = message_id
+        message_dict["id"] = message_dict["_id"]
         return Message(**message_dict)
     except Exception as e:
-        logger.error(f"Erro ao processar mensagem: {str(e)}", exc_info=True)
+        logger.error("Erro ao processar mensagem: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/messages/batch", response_model=MessageBatchResult)
+async def create_messages_batch(batch: MessageBatchInput, request: Request):
+    current_user = await get_current_user(request)
+    if len(batch.messages) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"O lote pode ter no máximo {MAX_BATCH_SIZE} mensagens")
+
+    # Uma passada só: valida cada item e já monta o documento
+    created_at = utc_now()
+    results = [None] * len(batch.messages)
+    documents, positions = [], []
+    for index, item in enumerate(batch.messages):
+        try:
+            message = MessageInput.model_validate(item)
+            document = _build_message_document(message, current_user["id"], created_at)
+        except ValidationError as e:
+            results[index] = MessageBatchItemResult(index=index, error=_format_validation_error(e))
+            continue
+        except (ValueError, OverflowError) as e:
+            results[index] = MessageBatchItemResult(index=index, error=f"event_date: {str(e)}")
+            continue
+        documents.append(document)
+        positions.append(index)
+
+    try:
+        db = get_database()
+        for start in range(0, len(documents), INSERT_CHUNK_SIZE):
+            chunk = documents[start:start + INSERT_CHUNK_SIZE]
+            failed = {}
+            try:
+                # Sem ordem: um documento com erro não interrompe o restante do bloco
+                await db.messages.insert_many(chunk, ordered=False)
+            except BulkWriteError as e:
+                failed = {err["index"]: err.get("errmsg", "Erro ao gravar") for err in e.details.get("writeErrors", [])}
+            await increment(db.message_stats, current_user["id"], transition_delta(None, MessageStatus.PROCESSANDO),
+                            len(chunk) - len(failed))
+            for offset, document in enumerate(chunk):
+                index = positions[start + offset]
+                if offset in failed:
+                    results[index] = MessageBatchItemResult(index=index, error=failed[offset])
+                else:
+                    results[index] = MessageBatchItemResult(index=index, id=document["_id"])
+        get_listing_cache().invalidate(current_user["id"])
+    except Exception as e:
+        logger.error("Erro ao gravar lote de mensagens: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    accepted = sum(1 for result in results if result.id)
+    logger.info("Lote de mensagens gravado", extra={"fields": {"total": len(results), "accepted": accepted}})
+    return MessageBatchResult(accepted=accepted, rejected=len(results) - accepted, results=results)
+
+@router.get("/messages/events")
+async def message_events(request: Request):
+    """Server-Sent Events com as mudanças de status das mensagens do remetente.
+
+    Eventos: `message` ({"id", "status", "created", "error_code"}), `resync`
+    (recarregar a lista com GET /messages) e `unavailable`.
+    """
+    current_user = await get_current_user(request)
+    events = get_message_events()
+    if not events.available:
+        raise HTTPException(status_code=503, detail="Atualizações em tempo real indisponíveis; use GET /api/messages")
+    return StreamingResponse(
+        events.stream(current_user["id"]),
+        media_type="text/event-stream",
+        # Sem cache nem buffer em proxies (nginx), senão os eventos chegam atrasados
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/messages/stats", response_model=MessageStats)
+async def get_messages_stats(request: Request):
+    # Totais mantidos a cada inserção e transição: uma leitura, sem varrer as mensagens
+    current_user = await get_current_user(request)
+    return await get_sender_stats(get_database().message_stats, current_user["id"])
+
 @router.get("/messages", response_model=List[Message])
-async def get_messages(request: Request):
+async def get_messages(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Tamanho da página"),
+    after: Optional[str] = Query(None, description="Cursor devolvido em X-Next-Cursor"),
+    status: Optional[List[str]] = Query(None, description="Filtra por status"),
+    date_from: Optional[datetime] = Query(None, description="Data do evento a partir de"),
+    date_to: Optional[datetime] = Query(None, description="Data do evento até"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="json paginado ou ndjson em streaming"),
+    include_archived: bool = Query(False, description="Inclui as mensagens arquivadas"),
+):
+    current_user = await get_current_user(request)
+    if after:
+        try:
+            decode_cursor(after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        current_user = get_current_user(request)
-        logger.info(f"Buscando mensagens para usuário: {current_user['id']}")
-        messages = get_messages_by_sender(current_user["id"])
-        
-        # Converter os campos datetime para string ISO e garantir que o id esteja presente
+        if format == "ndjson":
+            # Em streaming cada documento é escrito assim que sai do cursor
+            cursor = find_messages_by_sender(current_user["id"], limit, after, status, date_from, date_to,
+                                             include_archived=include_archived)
+            return StreamingResponse(_stream_ndjson(cursor, get_template_cache()), media_type="application/x-ndjson")
+
+        # Sem mudança desde a última resposta: 304 sem consultar as mensagens
+        cache = get_listing_cache()
+        etag = await cache.etag(current_user["id"], limit or DEFAULT_PAGE_SIZE, after, status, date_from, date_to,
+                                include_archived)
+        cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            cache.not_modified += 1
+            return Response(status_code=304, headers=cache_headers)
+        cached = cache.get_body(etag)
+        if cached is not None:
+            body, headers = cached
+            return Response(body, media_type="application/json", headers={**headers, **cache_headers})
+
+        messages, next_cursor = await get_messages_page(
+            current_user["id"], limit or DEFAULT_PAGE_SIZE, after, status, date_from, date_to,
+            include_archived=include_archived
+        )
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        templates = get_template_cache()
         for msg in messages:
-            if isinstance(msg.get("event_date"), datetime):
-                msg["event_date"] = msg["event_date"].isoformat()
-            if isinstance(msg.get("created_at"), datetime):
-                msg["created_at"] = msg["created_at"].isoformat()
-            msg["id"] = msg["_id"]  # Garantir que o campo id esteja presente
-        
-        logger.info(f"Retornando {len(messages)} mensagens")
-        return [Message(**msg) for msg in messages]
+            if "campaign_id" in msg:
+                await templates.expand(msg)
+        logger.debug("Retornando %d mensagens", len(messages))
+        # A resposta já sai pronta: o response_model fica só para a documentação
+        body = encode_messages(messages)
+        cache.set_body(etag, body, headers)
+        return Response(body, media_type="application/json", headers={**headers, **cache_headers})
     except Exception as e:
-        logger.error(f"Erro ao buscar mensagens: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        logger.error("Erro ao buscar mensagens: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def encode_messages(messages: list) -> bytes:
+    """Serializa documentos da listagem no mesmo formato de List[Message].
+
+    Os documentos vêm do banco com MESSAGE_LIST_PROJECTION e foram validados
+    na gravação, então não passam de novo pelo pydantic. As datas saem em ISO
+    com o fuso UTC explícito, como no serializador de Message.
+    """
+    for msg in messages:
+        msg.setdefault("status", MessageStatus.PROCESSANDO)
+        msg.setdefault("created_at", None)
+    return orjson.dumps(messages, default=str, option=orjson.OPT_NAIVE_UTC)
+
+async def _stream_ndjson(cursor, templates):
+    async for msg in cursor:
+        if "campaign_id" in msg:
+            await templates.expand(msg)
+        yield orjson.dumps(msg, default=str, option=orjson.OPT_NAIVE_UTC) + b"\n"
@@ -0,0 +1 @@
+# Este arquivo é necessário para que a pasta services seja reconhecida como um pacote Python
@@ -0,0 +1,197 @@
+"""Arquivamento das mensagens finalizadas.
+
+Mensagens Enviadas ou Falhas com send_at mais antigo que ARCHIVE_AFTER_DAYS
+saem da coleção messages, em lotes com ritmo limitado, para um de dois
+destinos:
+
+- collection: a coleção messages_archive, que a listagem consulta com
+  include_archived=true;
+- file: arquivos NDJSON comprimidos com gzip em ARCHIVE_DIR, fora do banco
+  (e fora da API e dos totais por remetente).
+
+Na coleção, cada lote é copiado antes de ser apagado da coleção principal,
+então uma execução interrompida pode ser repetida: a cópia repetida é
+ignorada pela chave. Uma mensagem que mudou entre a leitura e a remoção
+continua na coleção principal e a cópia dela é desfeita. Em arquivo não há
+como desfazer a cópia: o lote é apagado primeiro e só as mensagens que de
+fato saíram são gravadas, então uma interrupção entre as duas etapas perde
+no máximo esse lote. Mensagens mortas (dead_letter) ficam na coleção
+principal para o reenvio.
+
+Uso (a partir da pasta backend):
+
+    python -m app.services.archive status
+    python -m app.services.archive run --older-than-days 90 --max-rate 2000
+    python -m app.services.archive run --target file --dir /var/backups/mensagens
+"""
+import argparse
+import gzip
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+from bson import json_util
+from ..models.message import ARCHIVE_COLLECTION, MessageStatus
+from .message_stats import add_delta, counter_updates, transition_delta, version_updates
+
+logger = logging.getLogger(__name__)
+
+# Configurações do arquivamento
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 1000))
+ARCHIVE_MAX_DOCS_PER_SECOND = float(os.getenv("ARCHIVE_MAX_DOCS_PER_SECOND", 2000))
+ARCHIVE_TARGET = os.getenv("ARCHIVE_TARGET", "collection")  # collection | file
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+DUPLICATE_KEY = 11000
+
+
+def archivable_query(cutoff: datetime) -> dict:
+    # Usa o índice status_send_at, o mesmo da varredura do agendador
+    return {
+        "status": {"$in": list(MessageStatus.FINAL)},
+        "send_at": {"$lt": cutoff},
+        "dead_letter": {"$ne": True},
+    }
+
+
+class CollectionTarget:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def write(self, docs):
+        try:
+            self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Cópia de uma execução interrompida: o documento já está no arquivo
+            errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+            if errors:
+                raise
+
+    def discard(self, ids):
+        # Cópias de mensagens que não saíram da coleção principal
+        if ids:
+            self.collection.delete_many({"_id": {"$in": ids}})
+
+    def describe(self):
+        return f"coleção {self.collection.name}"
+
+
+class FileTarget:
+    """Um arquivo .ndjson.gz por execução; cada lote é um membro gzip gravado em disco antes da remoção."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"messages-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson.gz")
+
+    def write(self, docs):
+        lines = "".join(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n" for doc in docs)
+        with open(self.path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="ab") as compressed:
+                compressed.write(lines.encode())
+            raw.flush()
+            os.fsync(raw.fileno())
+
+    def describe(self):
+        return f"arquivo {self.path}"
+
+
+def archive_messages(collection, target, cutoff: datetime, batch_size: int = ARCHIVE_BATCH_SIZE,
+                     max_rate: float = ARCHIVE_MAX_DOCS_PER_SECOND, limit: int = 0, stats_collection=None) -> int:
+    """Move as mensagens finalizadas antes de `cutoff` para `target`; devolve quantas saíram.
+
+    Com `stats_collection`, mensagens exportadas para fora do banco saem
+    também dos totais por remetente (as da coleção de arquivo continuam contando)
+    e a versão da listagem dos remetentes afetados muda.
+    """
+    query = archivable_query(cutoff)
+    archived = 0
+    started = time.monotonic()
+    while not limit or archived < limit:
+        batch_started = time.monotonic()
+        size = batch_size if not limit else min(batch_size, limit - archived)
+        docs = list(collection.find(query).sort("send_at", ASCENDING).limit(size))
+        if not docs:
+            break
+        now = datetime.utcnow()
+        for doc in docs:
+            doc["archived_at"] = now
+        if isinstance(target, FileTarget):
+            removed = _delete(collection, docs, query)
+            target.write(removed)
+        else:
+            target.write(docs)
+            removed = _delete(collection, docs, query)
+            if len(removed) < len(docs):
+                kept = {doc["_id"] for doc in removed}
+                target.discard([doc["_id"] for doc in docs if doc["_id"] not in kept])
+        archived += len(removed)
+        if stats_collection is not None and isinstance(target, FileTarget):
+            _remove_from_stats(stats_collection, removed)
+        elif stats_collection is not None:
+            # Os totais não mudam, mas a listagem padrão deixa de mostrar essas mensagens
+            requests = version_updates({doc.get("sender_id") for doc in removed})
+            if requests:
+                stats_collection.bulk_write(requests, ordered=False)
+
+        elapsed = time.monotonic() - started
+        logger.info("%d mensagens arquivadas (%.0f docs/s)", archived, archived / elapsed if elapsed else 0)
+        # Limita o ritmo para o arquivamento não disputar o banco com a API
+        pause = len(docs) / max_rate - (time.monotonic() - batch_started) if max_rate > 0 else 0
+        if pause > 0:
+            time.sleep(pause)
+    logger.info("%d mensagens arquivadas em %s", archived, target.describe())
+    return archived
+
+
+def _delete(collection, docs, query) -> list:
+    """Apaga o lote da coleção principal; devolve os documentos que de fato saíram."""
+    ids = [doc["_id"] for doc in docs]
+    # Só apaga o que continua finalizado; o que mudou nesse meio tempo fica
+    result = collection.delete_many({"_id": {"$in": ids}, **query})
+    if result.deleted_count == len(docs):
+        return docs
+    remaining = {doc["_id"] for doc in collection.find({"_id": {"$in": ids}}, {"_id": 1})}
+    return [doc for doc in docs if doc["_id"] not in remaining]
+
+
+def _remove_from_stats(stats_collection, docs):
+    totals = {}
+    for doc in docs:
+        add_delta(totals, doc.get("sender_id"), transition_delta(doc.get("status"), None))
+    requests = counter_updates(totals)
+    if requests:
+        stats_collection.bulk_write(requests, ordered=False)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--older-than-days", type=float, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--target", choices=["collection", "file"], default=ARCHIVE_TARGET)
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="pasta dos arquivos com --target file")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--max-rate", type=float, default=ARCHIVE_MAX_DOCS_PER_SECOND,
+                        help="documentos por segundo; 0 = sem limite")
+    parser.add_argument("--limit", type=int, default=0, help="0 = todas")
+    args = parser.parse_args()
+
+    from mongodb_config import get_sync_database
+
+    db = get_sync_database()
+    cutoff = datetime.utcnow() - timedelta(days=args.older_than_days)
+    if args.command == "status":
+        print(f"Prontas para arquivar (send_at < {cutoff:%Y-%m-%d}): "
+              f"{db['messages'].count_documents(archivable_query(cutoff)):,}")
+        print(f"Na coleção {ARCHIVE_COLLECTION}: {db[ARCHIVE_COLLECTION].estimated_document_count():,}")
+        return
+    target = CollectionTarget(db[ARCHIVE_COLLECTION]) if args.target == "collection" else FileTarget(args.dir)
+    archive_messages(db["messages"], target, cutoff, args.batch_size, args.max_rate, args.limit,
+                     stats_collection=db["message_stats"])
+
+
+if __name__ == "__main__":
+    main()
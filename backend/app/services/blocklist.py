@@ -0,0 +1,350 @@
+"""Números bloqueados para envio, consultados em memória.
+
+Os números ficam na coleção phone_blocklist em E.164 (_id "+5511987654321",
+com o mesmo número como inteiro em `number`). Cada processo, API e worker de
+envio, mantém uma cópia em uma tabela hash de endereçamento aberto sobre um
+array de inteiros de 64 bits: com 50% de ocupação são 16 bytes por número
+(~80 MB para 5 milhões, contra ~290 MB de um set de int) e conferir um número
+é uma multiplicação, um resto e a leitura de uma ou duas posições, em torno
+de 0,5µs (benchmarks/blocklist_benchmark.py).
+Assim create_message e o envio não fazem nenhuma consulta ao banco.
+
+A cópia é carregada ao subir o processo e depois só recebe o que mudou: a
+cada BLOCKLIST_REFRESH_SECONDS são lidos os documentos com updated_at
+recente (data do servidor, índice updated_at). Remover um número grava
+active=False em vez de apagar o documento, para a remoção chegar aos outros
+processos. Enquanto a primeira carga não termina nenhum número é tratado
+como bloqueado.
+
+O worker bloqueia sozinho os números que recebem um erro permanente de
+número do provedor (inexistente, não é celular, descadastrado...).
+
+    python -m app.services.blocklist add +5511987654321 --reason "pedido do titular"
+    python -m app.services.blocklist remove 11987654321
+    python -m app.services.blocklist import numeros.txt
+    python -m app.services.blocklist count
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from array import array
+from datetime import timedelta
+from pymongo import UpdateOne
+from ..core.metrics import Counter, Gauge
+from ..models.message import phone_number
+
+logger = logging.getLogger(__name__)
+
+# Configurações da lista de bloqueio
+BLOCKLIST_COLLECTION = "phone_blocklist"
+BLOCKLIST_ENABLED = os.getenv("BLOCKLIST_ENABLED", "true").lower() == "true"
+BLOCKLIST_REFRESH_SECONDS = float(os.getenv("BLOCKLIST_REFRESH_SECONDS", 10))
+# Margem relida a cada atualização, para gravações de outros processos que
+# ficaram visíveis depois da leitura anterior
+BLOCKLIST_REFRESH_OVERLAP_SECONDS = float(os.getenv("BLOCKLIST_REFRESH_OVERLAP_SECONDS", 30))
+BLOCKLIST_LOAD_BATCH_SIZE = int(os.getenv("BLOCKLIST_LOAD_BATCH_SIZE", 10000))
+
+# Código gravado nas mensagens recusadas pelo worker por número bloqueado
+BLOCKED_ERROR_CODE = "BLOCKED"
+# Erros do provedor que indicam problema no próprio número e o bloqueiam:
+# inválido, não é celular, descadastrado, inexistente e fixo/sem rota. Ficam
+# de fora 21608 (restrição da conta de teste), 30003 (aparelho desligado) e
+# 30007 (filtro da operadora sobre o conteúdo)
+AUTO_BLOCK_ERROR_CODES = frozenset(
+    code.strip() for code in os.getenv("BLOCKLIST_AUTO_ERROR_CODES", "21211,21614,30004,30005,30006").split(",")
+    if code.strip()
+)
+
+# Ocupação da tabela: criada com 50%, recarregada maior a partir de 70%
+# (contando posições de números removidos) e crescida na hora em 90%
+TARGET_LOAD = 0.5
+RELOAD_LOAD = 0.7
+MAX_LOAD = 0.9
+MIN_CAPACITY = 1021
+
+# Multiplicador de Knuth (razão áurea em 32 bits): números em sequência, comuns
+# em faixas de operadora, caem longe uns dos outros em vez de formar blocos
+# contíguos que a sondagem linear teria de percorrer
+MIX = 2654435761
+
+# Posições especiais da tabela; nenhum número de telefone vale 0 ou 1
+EMPTY = 0
+REMOVED = 1
+
+
+def _next_prime(value: int) -> int:
+    # Capacidade prima espalha bem os restos de números com o mesmo prefixo
+    value = max(value, 3) | 1
+    while any(value % divisor == 0 for divisor in range(3, int(value ** 0.5) + 1, 2)):
+        value += 2
+    return value
+
+
+class PhoneIndex:
+    """Conjunto de inteiros positivos em uma tabela hash com sondagem linear."""
+
+    def __init__(self, expected: int = 0):
+        self._allocate(_next_prime(max(MIN_CAPACITY, int(expected / TARGET_LOAD))))
+
+    def _allocate(self, capacity: int):
+        self.capacity = capacity
+        self._table = array('Q', bytes(8 * capacity))
+        self._size = 0
+        self._removed = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, number: int) -> bool:
+        table, capacity = self._table, self.capacity
+        slot = number * MIX % capacity
+        while True:
+            value = table[slot]
+            if value == number:
+                return True
+            if value == EMPTY:
+                return False
+            slot += 1
+            if slot == capacity:
+                slot = 0
+
+    def add(self, number: int) -> bool:
+        """Inclui o número; False se já estava."""
+        table, capacity = self._table, self.capacity
+        slot = number * MIX % capacity
+        free = None
+        while True:
+            value = table[slot]
+            if value == number:
+                return False
+            if value == EMPTY:
+                break
+            if value == REMOVED and free is None:
+                free = slot
+            slot += 1
+            if slot == capacity:
+                slot = 0
+        if free is not None:
+            # Reaproveita a posição de um número removido no mesmo caminho
+            slot = free
+            self._removed -= 1
+        table[slot] = number
+        self._size += 1
+        if self.load > MAX_LOAD:
+            self._grow()
+        return True
+
+    def discard(self, number: int) -> bool:
+        """Retira o número; False se não estava."""
+        table, capacity = self._table, self.capacity
+        slot = number * MIX % capacity
+        while True:
+            value = table[slot]
+            if value == number:
+                # A posição continua ocupada para não cortar o caminho de outros números
+                table[slot] = REMOVED
+                self._size -= 1
+                self._removed += 1
+                return True
+            if value == EMPTY:
+                return False
+            slot += 1
+            if slot == capacity:
+                slot = 0
+
+    @property
+    def load(self) -> float:
+        return (self._size + self._removed) / self.capacity
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._table.itemsize * self.capacity
+
+    def __iter__(self):
+        return (value for value in self._table if value > REMOVED)
+
+    def _grow(self):
+        # Último recurso, bloqueia o processo: a atualização periódica recarrega
+        # a tabela em segundo plano bem antes desta ocupação
+        numbers = list(self)
+        self._allocate(_next_prime(int(len(numbers) / TARGET_LOAD)))
+        for number in numbers:
+            self.add(number)
+
+
+class Blocklist:
+    """Cópia local da coleção phone_blocklist, atualizada em segundo plano."""
+
+    def __init__(self, collection, refresh_seconds: float = BLOCKLIST_REFRESH_SECONDS):
+        self.collection = collection
+        self.refresh_seconds = refresh_seconds
+        self.index = PhoneIndex()
+        self.loaded = False
+        self.hits = 0
+        self._since = None
+
+    def contains(self, phone) -> bool:
+        try:
+            number = phone if isinstance(phone, int) else phone_number(phone)
+        except ValueError:
+            return False
+        if number in self.index:
+            self.hits += 1
+            return True
+        return False
+
+    async def load(self):
+        """Carrega todos os números ativos em uma tabela nova e troca a atual."""
+        # Hora do servidor antes da leitura: o que mudar durante a carga é relido depois
+        started = (await self.collection.database.command("hello"))["localTime"]
+        expected = await self.collection.count_documents({"active": True})
+        index = PhoneIndex(expected)
+        cursor = self.collection.find({"active": True}, {"number": 1, "_id": 0}).batch_size(BLOCKLIST_LOAD_BATCH_SIZE)
+        # O cursor devolve o controle ao event loop a cada lote
+        async for doc in cursor:
+            index.add(doc["number"])
+        self.index = index
+        self._since = started
+        self.loaded = True
+        logger.info("Lista de bloqueio carregada: %d números", len(index),
+                    extra={"fields": {"numbers": len(index), "memory_bytes": index.memory_bytes}})
+
+    async def refresh(self) -> int:
+        """Aplica as inclusões e remoções desde a última leitura; devolve quantas leu."""
+        if not self.loaded:
+            await self.load()
+            return len(self.index)
+        since = self._since - timedelta(seconds=BLOCKLIST_REFRESH_OVERLAP_SECONDS)
+        cursor = self.collection.find(
+            {"updated_at": {"$gte": since}}, {"number": 1, "active": 1, "updated_at": 1}
+        ).sort("updated_at", 1)
+        changes = 0
+        async for doc in cursor:
+            if doc.get("active", True):
+                self.index.add(doc["number"])
+            else:
+                self.index.discard(doc["number"])
+            self._since = max(self._since, doc["updated_at"])
+            changes += 1
+        if self.index.load > RELOAD_LOAD:
+            await self.load()
+        return changes
+
+    async def run(self):
+        # Tarefa de fundo da API e do worker; um erro só adia a próxima leitura
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Erro ao atualizar a lista de bloqueio: %s", e)
+            await asyncio.sleep(self.refresh_seconds)
+
+    async def add(self, phone, reason: str = None, source: str = "manual", error_code=None):
+        """Bloqueia o número no banco e na cópia local deste processo."""
+        number = phone_number(phone)
+        await self.collection.update_one(*block_update(number, reason, source, error_code), upsert=True)
+        self.index.add(number)
+
+    async def remove(self, phone):
+        number = phone_number(phone)
+        await self.collection.update_one(*unblock_update(number))
+        self.index.discard(number)
+
+
+def block_update(number: int, reason: str = None, source: str = "manual", error_code=None):
+    # updated_at vem do relógio do servidor, o mesmo usado na atualização incremental
+    return (
+        {"_id": f"+{number}"},
+        {
+            "$set": {"number": number, "active": True, "reason": reason, "source": source,
+                     "error_code": error_code},
+            "$currentDate": {"updated_at": True},
+        },
+    )
+
+
+def unblock_update(number: int):
+    return {"_id": f"+{number}"}, {"$set": {"active": False}, "$currentDate": {"updated_at": True}}
+
+
+_blocklist = None
+
+
+def _blocklist_stat(name):
+    def read():
+        if _blocklist is None:
+            return None
+        return name(_blocklist) if callable(name) else getattr(_blocklist, name)
+    return read
+
+
+BLOCKLIST_NUMBERS = Gauge("blocklist_numbers", "Números bloqueados na cópia local",
+                          function=_blocklist_stat(lambda blocklist: len(blocklist.index)))
+BLOCKLIST_MEMORY = Gauge("blocklist_memory_bytes", "Memória da tabela de números bloqueados",
+                         function=_blocklist_stat(lambda blocklist: blocklist.index.memory_bytes))
+BLOCKLIST_HITS = Counter("blocklist_hits_total", "Números recusados por estarem bloqueados",
+                         function=_blocklist_stat("hits"))
+
+
+def get_blocklist():
+    """Lista do processo; None se desativada por BLOCKLIST_ENABLED."""
+    global _blocklist
+    if _blocklist is None and BLOCKLIST_ENABLED:
+        from mongodb_config import get_async_database
+        _blocklist = Blocklist(get_async_database()[BLOCKLIST_COLLECTION])
+    return _blocklist
+
+
+def is_blocked(phone) -> bool:
+    # Sem lista criada (scripts, benchmarks) nenhum número está bloqueado
+    return _blocklist is not None and _blocklist.contains(phone)
+
+
+def _read_numbers(path):
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with stream:
+        for line in stream:
+            line = line.split(",")[0].strip()
+            if line and any(char.isdigit() for char in line):
+                yield phone_number(line)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["add", "remove", "import", "count"])
+    parser.add_argument("target", nargs="?", help="número (add/remove) ou arquivo com um número por linha (import, - para stdin)")
+    parser.add_argument("--reason", default=None)
+    args = parser.parse_args()
+    if args.command != "count" and not args.target:
+        parser.error(f"{args.command} precisa de um número ou arquivo")
+
+    from mongodb_config import get_sync_database
+
+    collection = get_sync_database()[BLOCKLIST_COLLECTION]
+    if args.command == "add":
+        collection.update_one(*block_update(phone_number(args.target), args.reason), upsert=True)
+        print(f"+{phone_number(args.target)} bloqueado")
+    elif args.command == "remove":
+        result = collection.update_one(*unblock_update(phone_number(args.target)))
+        print(f"+{phone_number(args.target)} {'desbloqueado' if result.modified_count else 'não estava bloqueado'}")
+    elif args.command == "import":
+        total, batch = 0, []
+        for number in _read_numbers(args.target):
+            batch.append(UpdateOne(*block_update(number, args.reason, "import"), upsert=True))
+            if len(batch) >= BLOCKLIST_LOAD_BATCH_SIZE:
+                collection.bulk_write(batch, ordered=False)
+                total += len(batch)
+                batch = []
+        if batch:
+            collection.bulk_write(batch, ordered=False)
+            total += len(batch)
+        print(f"{total} números bloqueados")
+    else:
+        print(f"{collection.count_documents({'active': True})} números bloqueados")
+
+
+if __name__ == "__main__":
+    main()
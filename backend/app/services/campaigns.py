@@ -0,0 +1,327 @@
+"""Campanhas: um texto com variáveis enviado para uma lista de destinatários.
+
+O texto da campanha é compilado uma vez (partes fixas e nomes das
+variáveis). Cada destinatário vira uma mensagem com campaign_id e as suas
+variáveis, sem o texto completo; a mensagem é montada só na hora do envio
+(e na listagem), a partir do texto em cache.
+
+A lista chega como CSV (com cabeçalho) ou NDJSON no corpo da requisição e é
+lida em pedaços conforme chega: as linhas são validadas e gravadas em blocos
+de CAMPAIGN_INSERT_CHUNK_SIZE, então a lista inteira nunca fica em memória.
+O _id de cada mensagem é campanha:linha, então reenviar o mesmo arquivo
+depois de uma interrupção só grava as linhas que faltaram. O progresso fica
+no documento da campanha a cada bloco.
+"""
+import codecs
+import csv
+import io
+import logging
+import os
+import re
+import string
+from datetime import datetime, timedelta
+import orjson
+from pymongo.errors import BulkWriteError
+from ..core.cache import TTLCache
+from ..models.campaign import CampaignStatus
+from ..models.message import MessageStatus, check_reminder_days, event_date_to_utc, normalize_phone, utc_now
+from .blocklist import is_blocked
+from .message_stats import increment, transition_delta
+from .scheduler import compute_send_at
+
+logger = logging.getLogger(__name__)
+
+# Configurações das campanhas
+CAMPAIGN_INSERT_CHUNK_SIZE = int(os.getenv("CAMPAIGN_INSERT_CHUNK_SIZE", 5000))
+CAMPAIGN_MAX_RECIPIENTS = int(os.getenv("CAMPAIGN_MAX_RECIPIENTS", 1_000_000))
+CAMPAIGN_MAX_ERRORS = int(os.getenv("CAMPAIGN_MAX_ERRORS", 100))
+CAMPAIGN_IMPORT_LEASE_SECONDS = float(os.getenv("CAMPAIGN_IMPORT_LEASE_SECONDS", 300))
+CAMPAIGN_TEMPLATE_CACHE_SIZE = int(os.getenv("CAMPAIGN_TEMPLATE_CACHE_SIZE", 1000))
+CAMPAIGN_TEMPLATE_CACHE_TTL_SECONDS = float(os.getenv("CAMPAIGN_TEMPLATE_CACHE_TTL_SECONDS", 3600))
+
+# Colunas da lista com significado próprio; as demais viram variáveis
+PHONE_COLUMNS = ("phone", "recipient_phone", "telefone")
+EVENT_DATE_COLUMN = "event_date"
+
+DUPLICATE_KEY = 11000
+_FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class CompiledTemplate:
+    """Texto quebrado em partes fixas e variáveis; montar uma mensagem é um join."""
+
+    def __init__(self, text: str):
+        self.parts = []
+        self.fields = []
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as e:
+            raise ValueError(f"Texto inválido: {e}")
+        for literal, field, spec, conversion in parsed:
+            if field is not None:
+                if not _FIELD_RE.match(field) or spec or conversion:
+                    raise ValueError(f"Variável inválida no texto: {{{field}}}")
+                if field not in self.fields:
+                    self.fields.append(field)
+            self.parts.append((literal, field))
+
+    def render(self, variables: dict) -> str:
+        return "".join(
+            literal + (str(variables.get(field, "")) if field is not None else "")
+            for literal, field in self.parts
+        )
+
+
+class TemplateCache:
+    """Textos das campanhas já compilados, por id, na frente da coleção campaigns."""
+
+    def __init__(self, collection, maxsize: int = CAMPAIGN_TEMPLATE_CACHE_SIZE,
+                 ttl_seconds: float = CAMPAIGN_TEMPLATE_CACHE_TTL_SECONDS):
+        self.collection = collection
+        self._cache = TTLCache(maxsize, ttl_seconds)
+
+    async def get(self, campaign_id) -> CompiledTemplate:
+        template = self._cache.get(campaign_id)
+        if template is None:
+            doc = await self.collection.find_one({"_id": campaign_id}, {"template": 1})
+            if doc is None:
+                raise LookupError(f"Campanha {campaign_id} não encontrada")
+            template = CompiledTemplate(doc["template"])
+            self._cache.set(campaign_id, template)
+        return template
+
+    async def render(self, campaign_id, variables: dict) -> str:
+        return (await self.get(campaign_id)).render(variables or {})
+
+    async def expand(self, doc: dict) -> dict:
+        # Mensagem de campanha guardada sem texto: monta a partir do template
+        if doc.get("message") is None and doc.get("campaign_id"):
+            try:
+                doc["message"] = await self.render(doc["campaign_id"], doc.get("variables"))
+            except LookupError:
+                doc["message"] = ""
+        doc.pop("variables", None)
+        return doc
+
+
+_template_cache = None
+
+
+def get_template_cache() -> TemplateCache:
+    # Um cache por processo, criado no primeiro uso
+    global _template_cache
+    if _template_cache is None:
+        from ..database import get_database
+        _template_cache = TemplateCache(get_database().campaigns)
+    return _template_cache
+
+
+# --- leitura da lista em streaming ---
+
+def _complete_csv(text: str) -> int:
+    """Posição logo depois da última quebra de linha fora de aspas (0 se não houver)."""
+    position = text.rfind("\n")
+    # Uma quebra dentro de um campo entre aspas tem um número ímpar de aspas antes
+    while position >= 0 and text.count('"', 0, position) % 2:
+        position = text.rfind("\n", 0, position)
+    return position + 1
+
+
+async def iter_rows(chunks, kind: str):
+    """Linhas da lista como dicionários, lidas dos pedaços do corpo conforme chegam.
+
+    `kind` é "csv" ou "ndjson". Produz (número da linha, dados, erro); linhas
+    que não puderem ser lidas vêm com dados None e o motivo em erro.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    header = None
+    number = 0
+    finished = False
+    chunk_iterator = chunks.__aiter__()
+    while not finished:
+        try:
+            chunk = await chunk_iterator.__anext__()
+            buffer += decoder.decode(chunk)
+        except StopAsyncIteration:
+            buffer += decoder.decode(b"", final=True)
+            if buffer and not buffer.endswith("\n"):
+                buffer += "\n"
+            finished = True
+
+        if kind == "ndjson":
+            cut = buffer.rfind("\n") + 1
+            lines, buffer = buffer[:cut], buffer[cut:]
+            for line in lines.splitlines():
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    row = orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    yield number, None, f"JSON inválido: {e}"
+                    continue
+                if not isinstance(row, dict):
+                    yield number, None, "cada linha deve ser um objeto JSON"
+                    continue
+                yield number, row, None
+        else:
+            cut = _complete_csv(buffer)
+            text, buffer = buffer[:cut], buffer[cut:]
+            for values in csv.reader(io.StringIO(text)):
+                if not values or not any(value.strip() for value in values):
+                    continue
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                number += 1
+                if len(values) != len(header):
+                    yield number, None, f"esperadas {len(header)} colunas, encontradas {len(values)}"
+                    continue
+                yield number, dict(zip(header, values)), None
+
+
+def build_recipient_document(campaign: dict, template: CompiledTemplate, number: int, row: dict,
+                             created_at: datetime) -> dict:
+    """Documento da mensagem de um destinatário; levanta ValueError se a linha for inválida."""
+    phone_column = next((column for column in PHONE_COLUMNS if row.get(column) not in (None, "")), None)
+    if phone_column is None:
+        raise ValueError("telefone ausente")
+    phone = normalize_phone(str(row[phone_column]))
+    if is_blocked(phone):
+        raise ValueError("número bloqueado")
+    variables = {
+        key: value for key, value in row.items()
+        if key not in PHONE_COLUMNS and key != EVENT_DATE_COLUMN
+    }
+    missing = [field for field in template.fields if field not in variables]
+    if missing:
+        raise ValueError(f"faltam variáveis: {', '.join(missing)}")
+
+    event_date = campaign["event_date"]
+    if row.get(EVENT_DATE_COLUMN):
+        value = row[EVENT_DATE_COLUMN]
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if not isinstance(value, datetime):
+            raise ValueError(f"data do evento inválida: {value!r}")
+        # Fora do intervalo vira ValueError: a linha é rejeitada e a importação segue
+        event_date = event_date_to_utc(value)
+        check_reminder_days(campaign["reminder_days"], event_date)
+    return {
+        "_id": f"{campaign['_id']}:{number}",
+        "sender_id": campaign["sender_id"],
+        "campaign_id": campaign["_id"],
+        "recipient_phone": phone,
+        "variables": variables,
+        "event_date": event_date,
+        "reminder_days": campaign["reminder_days"],
+        "send_at": compute_send_at(event_date, campaign["reminder_days"]),
+        "status": MessageStatus.PROCESSANDO,
+        "created_at": created_at,
+    }
+
+
+class ImportInProgress(Exception):
+    pass
+
+
+class TooManyRecipients(Exception):
+    pass
+
+
+async def start_import(campaigns, campaign_id):
+    """Marca a campanha como importando; outra importação viva da mesma campanha impede."""
+    now = datetime.utcnow()
+    result = await campaigns.update_one(
+        {"_id": campaign_id, "$or": [
+            {"status": {"$ne": CampaignStatus.IMPORTANDO}},
+            # Importação cujo processo morreu sem atualizar o progresso
+            {"updated_at": {"$lt": now - timedelta(seconds=CAMPAIGN_IMPORT_LEASE_SECONDS)}},
+        ]},
+        {"$set": {"status": CampaignStatus.IMPORTANDO, "updated_at": now, "progress": {
+            "rows_read": 0, "accepted": 0, "rejected": 0, "duplicates": 0, "bytes_read": 0, "errors": [],
+        }}},
+    )
+    if not result.modified_count:
+        raise ImportInProgress("A lista desta campanha já está sendo importada")
+
+
+async def ingest_recipients(campaign: dict, chunks, kind: str, messages, campaigns, stats,
+                            chunk_size: int = CAMPAIGN_INSERT_CHUNK_SIZE,
+                            max_recipients: int = CAMPAIGN_MAX_RECIPIENTS) -> dict:
+    """Lê a lista de destinatários e grava as mensagens da campanha em blocos.
+
+    Devolve o progresso final. O progresso parcial é gravado na campanha a
+    cada bloco; se a leitura falhar no meio, a campanha fica Interrompida.
+    """
+    template = CompiledTemplate(campaign["template"])
+    created_at = utc_now()
+    counted = {"bytes_read": 0}
+
+    async def counting(source):
+        async for chunk in source:
+            counted["bytes_read"] += len(chunk)
+            yield chunk
+
+    totals = {"rows_read": 0, "accepted": 0, "rejected": 0, "duplicates": 0, "bytes_read": 0}
+    documents, errors = [], []
+    status = CampaignStatus.INTERROMPIDA
+    try:
+        async for number, row, error in iter_rows(counting(chunks), kind):
+            if number > max_recipients:
+                raise TooManyRecipients(f"A lista pode ter no máximo {max_recipients} destinatários")
+            if error is None:
+                try:
+                    documents.append(build_recipient_document(campaign, template, number, row, created_at))
+                except (TypeError, ValueError, OverflowError) as e:
+                    error = str(e)
+            if error is not None:
+                errors.append(f"linha {number}: {error}")
+            if len(documents) + len(errors) >= chunk_size:
+                await _flush(campaign, documents, errors, counted, totals, messages, campaigns, stats)
+                documents, errors = [], []
+        await _flush(campaign, documents, errors, counted, totals, messages, campaigns, stats)
+        status = CampaignStatus.PRONTA
+    finally:
+        update = {"status": status, "updated_at": datetime.utcnow()}
+        if status == CampaignStatus.PRONTA:
+            update["imported_at"] = datetime.utcnow()
+        await campaigns.update_one({"_id": campaign["_id"]}, {"$set": update})
+        logger.info("Importação da campanha %s: %s", campaign["_id"], status, extra={"fields": totals})
+    return totals
+
+
+async def _flush(campaign, documents, errors, counted, totals, messages, campaigns, stats):
+    duplicates = 0
+    failed = 0
+    if documents:
+        try:
+            await messages.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") == DUPLICATE_KEY:
+                    # Linha gravada em uma importação anterior do mesmo arquivo
+                    duplicates += 1
+                else:
+                    failed += 1
+                    errors.append(f"linha {documents[error['index']]['_id'].rsplit(':', 1)[1]}: {error.get('errmsg')}")
+    accepted = len(documents) - duplicates - failed
+    await increment(stats, campaign["sender_id"], transition_delta(None, MessageStatus.PROCESSANDO), accepted)
+
+    delta = {
+        "rows_read": len(documents) + len(errors) - failed,
+        "accepted": accepted,
+        "rejected": len(errors),
+        "duplicates": duplicates,
+        "bytes_read": counted["bytes_read"] - totals["bytes_read"],
+    }
+    for key, value in delta.items():
+        totals[key] += value
+    update = {
+        "$inc": {f"progress.{key}": value for key, value in delta.items()},
+        "$set": {"updated_at": datetime.utcnow()},
+    }
+    if errors:
+        update["$push"] = {"progress.errors": {"$each": errors, "$slice": CAMPAIGN_MAX_ERRORS}}
+    await campaigns.update_one({"_id": campaign["_id"]}, update)
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from pika.adapters.asyncio_connection import AsyncioConnection
+from ..models.message import MessageStatus
+from .blocklist import AUTO_BLOCK_ERROR_CODES, BLOCKED_ERROR_CODE, get_blocklist
+from .campaigns import TemplateCache
+from .message_stats import transition_delta
+from .rate_limit import THROTTLE_ERROR_CODES, create_rate_limiter
+from .retry import failure_transition
+from .sms_providers import create_provider
+from .status_buffer import StatusBuffer
+
+logger = logging.getLogger(__name__)
+
+# Configurações do worker de envio
+DISPATCH_PREFETCH = int(os.getenv("DISPATCH_PREFETCH", 100))
+RECONNECT_MAX_DELAY_SECONDS = float(os.getenv("RABBITMQ_RECONNECT_MAX_DELAY_SECONDS", 30))
+THROTTLE_MAX_ATTEMPTS = int(os.getenv("DISPATCH_THROTTLE_MAX_ATTEMPTS", 5))
+METRICS_LOG_INTERVAL_SECONDS = float(os.getenv("DISPATCH_METRICS_LOG_INTERVAL_SECONDS", 60))
+
+
+class ProviderThrottled(Exception):
+    pass
+
+
+class DispatchWorker:
+    """Consome a fila mensagens_futuras e envia os SMS pelo provedor.
+
+    Cada entrega vira uma tarefa no event loop, então até `prefetch`
+    mensagens são enviadas ao mesmo tempo pelo mesmo cliente HTTP. O ack só
+    é dado depois que o envio e a gravação do status deram certo; qualquer
+    exceção no caminho devolve a mensagem para a fila.
+    """
+
+    def __init__(self, provider, update_status, get_status=None, prefetch: int = DISPATCH_PREFETCH,
+                 queue_name: str = "mensagens_futuras", rate_limiter=None, templates=None,
+                 blocklist=None):
+        self.provider = provider
+        self.templates = templates
+        self.blocklist = blocklist
+        self.rate_limiter = rate_limiter
+        self.update_status = update_status
+        self.get_status = get_status
+        self.prefetch = prefetch
+        self.queue_name = queue_name
+        self._connection = None
+        self._channel = None
+        self._consumer_tag = None
+        self._closed = None
+        self._stopping = False
+        self._tasks = set()
+        self.stats = {"sent": 0, "failed": 0, "retried": 0, "dead_lettered": 0, "requeued": 0, "skipped": 0,
+                      "throttled": 0, "blocked": 0}
+
+    async def process(self, payload: dict, redelivered: bool = False) -> bool:
+        """Envia uma mensagem e grava o resultado; True quando pode receber ack."""
+        message_id = payload["id"]
+        if redelivered and self.get_status is not None:
+            # O ack pode ter se perdido depois do envio: não manda o SMS de novo
+            if await self.get_status(message_id) in MessageStatus.FINAL:
+                self.stats["skipped"] += 1
+                return True
+
+        result = None
+        if self.blocklist is not None and self.blocklist.contains(payload["recipient_phone"]):
+            # Bloqueado depois do agendamento: falha permanente sem chamar o provedor
+            self.stats["blocked"] += 1
+            result = {"status": "failed", "error_code": BLOCKED_ERROR_CODE,
+                      "error_message": "Número bloqueado para envio"}
+        elif payload.get("message") is None and payload.get("campaign_id") and self.templates is not None:
+            # Mensagem de campanha: o texto é montado só agora, com o template em cache
+            try:
+                payload["message"] = await self.templates.render(payload["campaign_id"], payload.get("variables"))
+            except LookupError as e:
+                result = {"status": "failed", "error_code": "CAMPAIGN_NOT_FOUND", "error_message": str(e)}
+        result = result or await self._send(payload)
+        sender_id = payload.get("sender_id")
+        if result["status"] == "success":
+            await self.update_status(message_id, MessageStatus.ENVIADA, {
+                "provider_sid": result["message_sid"],
+                "sent_at": datetime.utcnow(),
+            }, counters=(sender_id, transition_delta(MessageStatus.ENFILEIRADA, MessageStatus.ENVIADA)))
+            self.stats["sent"] += 1
+        else:
+            if self.blocklist is not None and str(result["error_code"]) in AUTO_BLOCK_ERROR_CODES:
+                await self._block(payload["recipient_phone"], result)
+            # Falha temporária vira nova tentativa agendada, sem segurar o worker
+            status, fields, history = failure_transition(payload, result)
+            await self.update_status(message_id, status, fields, {"retry_history": history},
+                                     counters=(sender_id, transition_delta(MessageStatus.ENFILEIRADA, status)))
+            if status == MessageStatus.PROCESSANDO:
+                self.stats["retried"] += 1
+            elif fields.get("dead_letter"):
+                self.stats["dead_lettered"] += 1
+            else:
+                self.stats["failed"] += 1
+        return True
+
+    async def _block(self, phone: str, result: dict):
+        # O número não vai aceitar outros envios; a falha aqui não impede gravar o status
+        try:
+            await self.blocklist.add(phone, reason=result["error_message"], source="provider",
+                                     error_code=str(result["error_code"]))
+        except Exception as e:
+            logger.error("Erro ao bloquear número após o erro %s: %s", result["error_code"], e)
+
+    async def _send(self, payload: dict) -> dict:
+        # Respeita os baldes de envio; em throttling o limitador reduz a taxa
+        # de todos os workers e a mesma mensagem tenta de novo no novo ritmo
+        sender = self.provider.from_number
+        for _ in range(THROTTLE_MAX_ATTEMPTS):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(sender)
+            result = await self.provider.send(payload["recipient_phone"], payload["message"])
+            if result["status"] == "success" or result["error_code"] not in THROTTLE_ERROR_CODES:
+                return result
+            self.stats["throttled"] += 1
+            if self.rate_limiter is not None:
+                await self.rate_limiter.report_throttle(sender)
+        # Continua com throttling: volta para a fila em vez de marcar como falha
+        raise ProviderThrottled(f"Throttling persistente no número {sender}")
+
+    def metrics(self) -> dict:
+        metrics = {"in_flight": len(self._tasks), **self.stats}
+        if self.rate_limiter is not None:
+            metrics["rate_limit"] = self.rate_limiter.metrics()
+        return metrics
+
+    # --- consumo do RabbitMQ ---
+
+    async def run(self, connection_parameters):
+        loop = asyncio.get_running_loop()
+        delay = 1.0
+        while not self._stopping:
+            self._closed = loop.create_future()
+            self._connection = AsyncioConnection(
+                connection_parameters,
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_closed,
+                on_close_callback=self._on_connection_closed,
+                custom_ioloop=loop,
+            )
+            await self._closed
+            if self._stopping:
+                break
+            if self._consumer_tag is not None:
+                # Chegou a consumir: a próxima queda volta ao atraso mínimo
+                delay = 1.0
+            self._consumer_tag = None
+            logger.warning("Reconectando ao RabbitMQ em %.0fs", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY_SECONDS)
+        await self.provider.close()
+
+    async def stop(self):
+        # Para de receber, espera os envios em andamento e fecha a conexão
+        self._stopping = True
+        if self._channel is not None and self._channel.is_open and self._consumer_tag:
+            self._channel.basic_cancel(self._consumer_tag)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+        elif self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_closed(self, connection, reason):
+        self._channel = None
+        if not self._stopping:
+            logger.error("Conexão com o RabbitMQ encerrada: %s", reason)
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.basic_qos(prefetch_count=self.prefetch, callback=lambda _frame: channel.queue_declare(
+            queue=self.queue_name, callback=lambda _frame: self._start_consuming(channel)
+        ))
+
+    def _on_channel_closed(self, channel, reason):
+        # Sem canal não há como dar ack: reconecta do zero
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+
+    def _start_consuming(self, channel):
+        self._consumer_tag = channel.basic_consume(self.queue_name, self._on_message)
+        logger.info("Worker consumindo %s com prefetch %d", self.queue_name, self.prefetch)
+
+    def _on_message(self, channel, method, properties, body):
+        task = asyncio.get_running_loop().create_task(
+            self._handle(channel, method.delivery_tag, body, method.redelivered)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, channel, delivery_tag, body, redelivered):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            logger.error("Mensagem com corpo inválido descartada")
+            channel.basic_nack(delivery_tag, requeue=False)
+            return
+        try:
+            await self.process(payload, redelivered)
+        except Exception as e:
+            logger.error("Erro ao processar mensagem %s: %s", payload.get("id"), e)
+            self.stats["requeued"] += 1
+            if channel.is_open:
+                channel.basic_nack(delivery_tag, requeue=True)
+            return
+        if channel.is_open:
+            channel.basic_ack(delivery_tag)
+
+
+async def main():
+    import signal
+    from app.core.logs import setup_logging
+    from mongodb_config import get_async_database, get_message_status
+    from rabbitmq_config import connection_parameters
+
+    setup_logging()
+
+    # Os status vão para o banco em lotes; o ack espera o lote ser gravado
+    db = get_async_database()
+    status_buffer = StatusBuffer(db["messages"], counters_collection=db["message_stats"])
+    status_buffer.start()
+    # Cópia local da lista de bloqueio, atualizada em segundo plano
+    blocklist = get_blocklist()
+    refresher = asyncio.create_task(blocklist.run()) if blocklist else None
+    worker = DispatchWorker(create_provider(), status_buffer.update, get_message_status,
+                            rate_limiter=create_rate_limiter(), templates=TemplateCache(db["campaigns"]),
+                            blocklist=blocklist)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda: asyncio.ensure_future(worker.stop()))
+
+    async def log_metrics():
+        while True:
+            await asyncio.sleep(METRICS_LOG_INTERVAL_SECONDS)
+            logger.info("Métricas do worker: %s status: %s", worker.metrics(), status_buffer.stats)
+
+    reporter = asyncio.create_task(log_metrics())
+    await worker.run(connection_parameters())
+    reporter.cancel()
+    if refresher:
+        refresher.cancel()
+    await status_buffer.close()
+    logger.info("Worker finalizado: %s", worker.stats)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
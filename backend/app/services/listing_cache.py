@@ -0,0 +1,107 @@
+"""Respostas condicionais (ETag / 304) da listagem de mensagens.
+
+A versão da listagem de cada remetente é o campo `version` do documento dele
+em message_stats, incrementado junto com os totais a cada mensagem criada,
+mudança de status, reenvio, arquivamento e reconciliação. A ETag de uma
+página sai da versão e dos parâmetros da requisição; se o navegador mandar a
+mesma ETag em If-None-Match, a rota responde 304 sem ler a coleção messages.
+
+As versões lidas ficam em um cache local por LISTING_VERSION_CACHE_TTL_SECONDS,
+então uma mudança gravada por outro processo pode levar esse tempo para
+aparecer; as gravações da própria API invalidam a versão na hora. Os corpos
+já serializados das páginas mais pedidas ficam em um LRU indexado pela ETag:
+um remetente que recarrega a lista sem mudanças não refaz consulta nem
+serialização.
+
+Se o incremento da versão falhar depois de a mensagem ser gravada, a ETag
+continuaria valendo com dados antigos; por isso ela também muda a cada
+LISTING_ETAG_MAX_AGE_SECONDS.
+"""
+import hashlib
+import os
+import time
+from ..core.cache import TTLCache
+from ..core.metrics import Counter, Gauge
+from .message_stats import get_sender_version
+
+# Configurações do cache da listagem
+LISTING_VERSION_CACHE_SIZE = int(os.getenv("LISTING_VERSION_CACHE_SIZE", 10000))
+LISTING_VERSION_CACHE_TTL_SECONDS = float(os.getenv("LISTING_VERSION_CACHE_TTL_SECONDS", 1))
+# 0 desativa o cache de corpos
+LISTING_BODY_CACHE_SIZE = int(os.getenv("LISTING_BODY_CACHE_SIZE", 256))
+LISTING_BODY_CACHE_TTL_SECONDS = float(os.getenv("LISTING_BODY_CACHE_TTL_SECONDS", 60))
+LISTING_ETAG_MAX_AGE_SECONDS = float(os.getenv("LISTING_ETAG_MAX_AGE_SECONDS", 300))
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    # If-None-Match aceita uma lista e a comparação fraca ignora o prefixo W/
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class ListingCache:
+    def __init__(self, stats_collection, version_cache_size: int = LISTING_VERSION_CACHE_SIZE,
+                 version_ttl_seconds: float = LISTING_VERSION_CACHE_TTL_SECONDS,
+                 body_cache_size: int = LISTING_BODY_CACHE_SIZE,
+                 body_ttl_seconds: float = LISTING_BODY_CACHE_TTL_SECONDS):
+        self.stats_collection = stats_collection
+        self.versions = TTLCache(version_cache_size, version_ttl_seconds)
+        self.bodies = TTLCache(body_cache_size, body_ttl_seconds) if body_cache_size > 0 else None
+        self.not_modified = 0
+
+    async def version(self, sender_id) -> int:
+        version = self.versions.get(sender_id)
+        if version is None:
+            version = await get_sender_version(self.stats_collection, sender_id)
+            self.versions.set(sender_id, version)
+        return version
+
+    def invalidate(self, sender_id):
+        # Chamado depois de gravar a nova versão no banco
+        self.versions.pop(sender_id)
+
+    async def etag(self, sender_id, *params) -> str:
+        version = await self.version(sender_id)
+        window = int(time.time() // LISTING_ETAG_MAX_AGE_SECONDS)
+        digest = hashlib.blake2b(repr((sender_id, window, params)).encode(), digest_size=8).hexdigest()
+        return f'"{version}-{digest}"'
+
+    def get_body(self, etag: str):
+        return self.bodies.get(etag) if self.bodies is not None else None
+
+    def set_body(self, etag: str, body: bytes, headers: dict = None):
+        if self.bodies is not None:
+            self.bodies.set(etag, (body, headers))
+
+
+_cache = None
+
+
+def _cache_stat(read):
+    def collect():
+        return read(_cache) if _cache is not None else None
+    return collect
+
+
+LISTING_NOT_MODIFIED = Counter("listing_not_modified_total", "Listagens respondidas com 304 Not Modified",
+                               function=_cache_stat(lambda cache: cache.not_modified))
+LISTING_VERSION_CACHE_HIT_RATIO = Gauge("listing_version_cache_hit_ratio",
+                                        "Taxa de acerto do cache local de versões da listagem",
+                                        function=_cache_stat(lambda cache: cache.versions.hit_ratio))
+LISTING_BODY_CACHE_HITS = Counter("listing_body_cache_hits_total", "Listagens servidas do cache de corpos",
+                                  function=_cache_stat(lambda cache: cache.bodies.hits if cache.bodies else None))
+LISTING_BODY_CACHE_MISSES = Counter("listing_body_cache_misses_total", "Listagens consultadas no banco",
+                                    function=_cache_stat(lambda cache: cache.bodies.misses if cache.bodies else None))
+LISTING_BODY_CACHE_HIT_RATIO = Gauge("listing_body_cache_hit_ratio", "Taxa de acerto do cache de corpos da listagem",
+                                     function=_cache_stat(lambda cache: cache.bodies.hit_ratio if cache.bodies else None))
+
+
+def get_listing_cache() -> ListingCache:
+    global _cache
+    if _cache is None:
+        from mongodb_config import get_async_database
+        _cache = ListingCache(get_async_database()["message_stats"])
+    return _cache
@@ -0,0 +1,275 @@
+"""Mudanças de status das mensagens enviadas ao navegador por Server-Sent Events.
+
+Cada processo da API abre um único change stream na coleção messages,
+enquanto houver alguém conectado em GET /api/messages/events, e distribui
+cada mudança para as conexões do remetente da mensagem. Nenhuma conexão
+consulta o banco.
+
+O change stream nunca espera por um cliente lento: cada conexão tem um
+buffer com no máximo MESSAGE_EVENTS_BUFFER_SIZE mensagens pendentes, e
+uma nova mudança da mesma mensagem só substitui a anterior (vale o status
+mais recente). Se o buffer enche, os pendentes são descartados e o cliente
+recebe um evento `resync` para recarregar a lista com GET /api/messages.
+
+Change streams exigem replica set; em um MongoDB standalone a rota responde
+503 e o frontend continua recarregando a lista.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+import orjson
+from pymongo.errors import OperationFailure, PyMongoError
+from ..core.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Configurações dos eventos em tempo real
+MESSAGE_EVENTS_BUFFER_SIZE = int(os.getenv("MESSAGE_EVENTS_BUFFER_SIZE", 1000))
+MESSAGE_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("MESSAGE_EVENTS_HEARTBEAT_SECONDS", 15))
+MESSAGE_EVENTS_MAX_RETRY_DELAY_SECONDS = float(os.getenv("MESSAGE_EVENTS_MAX_RETRY_DELAY_SECONDS", 30))
+# Espera sugerida ao EventSource antes de reconectar
+MESSAGE_EVENTS_CLIENT_RETRY_MS = int(os.getenv("MESSAGE_EVENTS_CLIENT_RETRY_MS", 5000))
+
+# "$changeStream is only supported on replica sets"
+CHANGE_STREAMS_UNSUPPORTED = 40573
+# O ponto de retomada saiu do oplog: eventos perdidos
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# Só criações e mudanças de status; o documento vem reduzido aos campos do evento
+CHANGE_PIPELINE = [
+    {"$match": {"$or": [
+        {"operationType": "insert"},
+        {"operationType": "update", "updateDescription.updatedFields.status": {"$exists": True}},
+    ]}},
+    {"$project": {
+        "operationType": 1,
+        "fullDocument._id": 1,
+        "fullDocument.sender_id": 1,
+        "fullDocument.status": 1,
+        "fullDocument.error_code": 1,
+    }},
+]
+
+
+class EventsUnavailable(Exception):
+    pass
+
+
+def format_event(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+class Subscription:
+    """Buffer de uma conexão, com as mudanças agrupadas por mensagem."""
+
+    def __init__(self, maxsize: int = MESSAGE_EVENTS_BUFFER_SIZE):
+        self.maxsize = maxsize
+        self._pending = OrderedDict()  # id da mensagem -> evento
+        self._ready = asyncio.Event()
+        self.overflowed = False
+        self.closed = False
+
+    def push(self, event: dict) -> str:
+        """Guarda o evento sem bloquear; devolve o que aconteceu com ele."""
+        if self.overflowed:
+            return "dropped"
+        self._ready.set()
+        if event["id"] in self._pending:
+            self._pending[event["id"]] = event
+            return "coalesced"
+        if len(self._pending) >= self.maxsize:
+            # Cliente lento demais: ele recarrega a lista em vez de receber tudo
+            self.resync()
+            return "overflowed"
+        self._pending[event["id"]] = event
+        return "queued"
+
+    def resync(self):
+        # Os pendentes deixam de valer: o cliente recarrega a lista inteira
+        self._pending.clear()
+        self.overflowed = True
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def next_events(self, timeout: float):
+        """Eventos pendentes em ordem; [] no tempo limite e None quando fechada."""
+        if not (self._pending or self.overflowed or self.closed):
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        if self.closed:
+            return None
+        if self.overflowed:
+            self.overflowed = False
+            return [("resync", {})]
+        events = [("message", event) for event in self._pending.values()]
+        self._pending.clear()
+        return events
+
+
+class MessageEvents:
+    """Change stream compartilhado pelas conexões de um processo."""
+
+    def __init__(self, collection, buffer_size: int = MESSAGE_EVENTS_BUFFER_SIZE,
+                 heartbeat_seconds: float = MESSAGE_EVENTS_HEARTBEAT_SECONDS):
+        self.collection = collection
+        self.buffer_size = buffer_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.available = True
+        self._subscribers = {}  # sender_id -> set de Subscription
+        self._task = None
+        self.stats = {"changes": 0, "queued": 0, "coalesced": 0, "dropped": 0, "overflowed": 0}
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def subscribe(self, sender_id) -> Subscription:
+        if not self.available:
+            raise EventsUnavailable("Atualizações em tempo real indisponíveis; use GET /api/messages")
+        subscription = Subscription(self.buffer_size)
+        self._subscribers.setdefault(sender_id, set()).add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+        return subscription
+
+    def unsubscribe(self, sender_id, subscription: Subscription):
+        subscriptions = self._subscribers.get(sender_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscribers[sender_id]
+        if not self._subscribers and self._task is not None:
+            # Sem ninguém conectado o processo não acompanha o banco
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, sender_id, event: dict):
+        for subscription in self._subscribers.get(sender_id, ()):
+            self.stats[subscription.push(event)] += 1
+
+    def _broadcast_resync(self):
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                subscription.resync()
+
+    def _close_all(self):
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                subscription.close()
+        self._subscribers.clear()
+
+    async def _watch(self):
+        token = None
+        delay = 1.0
+        while True:
+            try:
+                async with self.collection.watch(CHANGE_PIPELINE, full_document="updateLookup",
+                                                 resume_after=token) as stream:
+                    delay = 1.0
+                    async for change in stream:
+                        token = stream.resume_token
+                        self._dispatch(change)
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning("Change streams indisponíveis (%s); eventos de mensagens desativados", e)
+                    self.available = False
+                    self._close_all()
+                    return
+                logger.error("Erro no change stream de mensagens: %s", e)
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    # Não dá para retomar do ponto salvo: os clientes recarregam a lista
+                    token = None
+                    self._broadcast_resync()
+            except PyMongoError as e:
+                # Retoma do último evento entregue, sem perder mudanças
+                logger.error("Erro no change stream de mensagens: %s", e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MESSAGE_EVENTS_MAX_RETRY_DELAY_SECONDS)
+
+    def _dispatch(self, change: dict):
+        self.stats["changes"] += 1
+        document = change.get("fullDocument")
+        if not document:
+            # Mensagem apagada (arquivada) antes da leitura do documento
+            return
+        event = {"id": document["_id"], "status": document.get("status"),
+                 "created": change["operationType"] == "insert"}
+        if document.get("error_code") is not None:
+            event["error_code"] = document["error_code"]
+        self.publish(document.get("sender_id"), event)
+
+    async def stream(self, sender_id):
+        """Corpo text/event-stream de uma conexão; encerra quando o cliente sai.
+
+        A inscrição só acontece quando a resposta começa a ser enviada, para
+        uma requisição abandonada antes disso não deixar inscrição para trás.
+        """
+        try:
+            subscription = self.subscribe(sender_id)
+        except EventsUnavailable:
+            yield format_event("unavailable", {})
+            return
+        try:
+            yield f"retry: {MESSAGE_EVENTS_CLIENT_RETRY_MS}\n\n".encode()
+            while True:
+                events = await subscription.next_events(self.heartbeat_seconds)
+                if events is None:
+                    yield format_event("unavailable", {})
+                    return
+                if not events:
+                    # Comentário SSE: mantém a conexão viva em proxies
+                    yield b": ping\n\n"
+                    continue
+                yield b"".join(format_event(name, data) for name, data in events)
+        finally:
+            self.unsubscribe(sender_id, subscription)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._close_all()
+
+
+_events = None
+
+
+def _events_stat(name):
+    def read():
+        if _events is None:
+            return None
+        return _events.subscribers if name == "subscribers" else _events.stats[name]
+    return read
+
+
+MESSAGE_EVENTS_SUBSCRIBERS = Gauge("message_events_subscribers", "Conexões abertas em /api/messages/events",
+                                   function=_events_stat("subscribers"))
+MESSAGE_EVENTS_CHANGES = Counter("message_events_changes_total", "Mudanças lidas do change stream de mensagens",
+                                 function=_events_stat("changes"))
+MESSAGE_EVENTS_COALESCED = Counter("message_events_coalesced_total",
+                                   "Eventos que substituíram outro ainda não entregue da mesma mensagem",
+                                   function=_events_stat("coalesced"))
+MESSAGE_EVENTS_OVERFLOWED = Counter("message_events_overflowed_total",
+                                    "Buffers de conexões lentas descartados (cliente recebe resync)",
+                                    function=_events_stat("overflowed"))
+
+
+def get_message_events() -> MessageEvents:
+    global _events
+    if _events is None:
+        from mongodb_config import get_async_database
+        _events = MessageEvents(get_async_database()["messages"])
+    return _events
+
+
+def close_message_events():
+    # Encerra o change stream e as conexões abertas ao desligar a API
+    if _events is not None:
+        _events.close()
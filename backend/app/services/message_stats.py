@@ -0,0 +1,161 @@
+"""Totais de mensagens por remetente, mantidos a cada inserção e transição.
+
+Cada remetente tem um documento em message_stats com três contadores:
+agendadas (Processando, Agendada e Enfileirada), enviadas e falhas, somando
+a coleção principal e a de arquivo. As rotas somam as mensagens criadas, o
+worker move de agendadas para enviadas ou falhas junto com a gravação do
+status e o reenvio de mensagens mortas devolve de falhas para agendadas.
+Ler os totais é um find_one por _id, qualquer que seja o número de mensagens.
+
+O mesmo documento guarda `version`, incrementado em toda gravação dos totais,
+mesmo quando a mudança de status não troca o total (Agendada -> Enfileirada
+ou uma nova tentativa): é a versão da listagem do remetente, usada na ETag
+de GET /api/messages (app/services/listing_cache.py).
+
+Um contador pode se desviar se uma gravação falhar depois do status ou se
+a mesma entrega for processada duas vezes ao mesmo tempo. A reconciliação
+refaz os totais a partir das mensagens com uma agregação:
+
+    python -m app.services.message_stats reconcile
+    python -m app.services.message_stats reconcile --sender-id <id>
+
+Incrementos que chegam durante a reconciliação de um remetente podem ser
+perdidos ou contados duas vezes; rode fora do pico ou repita para o remetente.
+"""
+import argparse
+import logging
+from datetime import datetime
+from pymongo import UpdateOne
+from ..models.message import ARCHIVE_COLLECTION, MessageStatus
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = ("scheduled", "sent", "failed")
+
+# Total em que cada status é contado
+STATUS_BUCKETS = {
+    MessageStatus.PROCESSANDO: "scheduled",
+    MessageStatus.AGENDADA: "scheduled",
+    MessageStatus.ENFILEIRADA: "scheduled",
+    MessageStatus.ENVIADA: "sent",
+    MessageStatus.FALHOU: "failed",
+}
+PENDING_STATUSES = [status for status, bucket in STATUS_BUCKETS.items() if bucket == "scheduled"]
+
+
+def transition_delta(old_status, new_status) -> dict:
+    """Incrementos dos totais para uma mudança de status; vazio se o total não muda."""
+    before, after = STATUS_BUCKETS.get(old_status), STATUS_BUCKETS.get(new_status)
+    if before == after:
+        return {}
+    delta = {}
+    if before:
+        delta[before] = -1
+    if after:
+        delta[after] = 1
+    return delta
+
+
+def add_delta(totals: dict, sender_id, delta: dict, times: int = 1):
+    # Acumula incrementos por remetente antes de gravar tudo de uma vez; sem
+    # incremento o remetente entra assim mesmo, para a versão mudar
+    if not sender_id:
+        return
+    sender_totals = totals.setdefault(sender_id, {})
+    for bucket, amount in (delta or {}).items():
+        sender_totals[bucket] = sender_totals.get(bucket, 0) + amount * times
+
+
+def counter_updates(totals: dict) -> list:
+    now = datetime.utcnow()
+    return [
+        UpdateOne({"_id": sender_id}, {"$inc": {**delta, "version": 1}, "$set": {"updated_at": now}}, upsert=True)
+        for sender_id, delta in totals.items()
+    ]
+
+
+def version_updates(sender_ids) -> list:
+    # Só incrementa a versão: mudanças que aparecem na listagem sem mexer nos totais
+    return counter_updates({sender_id: {} for sender_id in sender_ids if sender_id})
+
+
+async def increment(collection, sender_id, delta: dict, times: int = 1):
+    """Soma um incremento aos totais do remetente; falhas só vão para o log."""
+    totals = {}
+    add_delta(totals, sender_id, delta, times)
+    requests = counter_updates(totals)
+    if not requests:
+        return
+    try:
+        await collection.bulk_write(requests, ordered=False)
+    except Exception as e:
+        # O status já foi gravado; a reconciliação corrige o total depois
+        logger.error("Erro ao atualizar os totais de %s: %s", sender_id, e)
+
+
+async def get_sender_version(collection, sender_id) -> int:
+    doc = await collection.find_one({"_id": sender_id}, {"version": 1})
+    return int(doc.get("version", 0)) if doc else 0
+
+
+async def get_sender_stats(collection, sender_id) -> dict:
+    doc = await collection.find_one({"_id": sender_id}) or {}
+    # Um desvio nunca aparece como total negativo
+    stats = {bucket: max(0, int(doc.get(bucket, 0))) for bucket in BUCKETS}
+    stats["total"] = sum(stats.values())
+    return stats
+
+
+def reconcile(messages, stats, sender_ids=None) -> int:
+    """Refaz os totais a partir das mensagens e grava com $merge; devolve o número de remetentes.
+
+    As mensagens da coleção de arquivo também contam.
+    """
+    started = datetime.utcnow()
+    match = {"sender_id": {"$in": list(sender_ids)}} if sender_ids else {"sender_id": {"$ne": None}}
+    pipeline = [
+        {"$match": match},
+        {"$unionWith": {"coll": ARCHIVE_COLLECTION, "pipeline": [{"$match": match}]}},
+        {"$group": {
+            "_id": "$sender_id",
+            "scheduled": {"$sum": {"$cond": [{"$in": ["$status", PENDING_STATUSES]}, 1, 0]}},
+            "sent": {"$sum": {"$cond": [{"$eq": ["$status", MessageStatus.ENVIADA]}, 1, 0]}},
+            "failed": {"$sum": {"$cond": [{"$eq": ["$status", MessageStatus.FALHOU]}, 1, 0]}},
+        }},
+        {"$set": {"updated_at": started, "reconciled_at": started}},
+        # A versão continua crescendo: voltar a um número antigo repetiria uma ETag já usada
+        {"$merge": {"into": stats.name, "whenNotMatched": "insert", "whenMatched": [{"$set": {
+            **{field: f"$$new.{field}" for field in (*BUCKETS, "updated_at", "reconciled_at")},
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+        }}]}},
+    ]
+    messages.aggregate(pipeline, allowDiskUse=True)
+    query = {"reconciled_at": started}
+    if sender_ids:
+        query["_id"] = {"$in": list(sender_ids)}
+    senders = stats.count_documents(query)
+    if not sender_ids:
+        # Remetentes que não têm mais mensagens: zera em vez de apagar, pela versão
+        stats.update_many(
+            {"updated_at": {"$lt": started}, "$or": [{bucket: {"$ne": 0}} for bucket in BUCKETS]},
+            {"$set": {**{bucket: 0 for bucket in BUCKETS}, "updated_at": started}, "$inc": {"version": 1}},
+        )
+    logger.info("Totais de %d remetentes reconciliados", senders)
+    return senders
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["reconcile"])
+    parser.add_argument("--sender-id", action="append", default=None, help="pode ser repetido; padrão = todos")
+    args = parser.parse_args()
+
+    from mongodb_config import get_sync_database
+
+    db = get_sync_database()
+    print(f"{reconcile(db['messages'], db['message_stats'], args.sender_id)} remetentes reconciliados")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Configurações de ritmo de envio
+SMS_GLOBAL_RATE = float(os.getenv("SMS_GLOBAL_RATE", 100))    # mensagens/s somando todos os workers
+SMS_SENDER_RATE = float(os.getenv("SMS_SENDER_RATE", 100))    # mensagens/s por número de origem
+SMS_BURST_SECONDS = float(os.getenv("SMS_BURST_SECONDS", 1))  # capacidade do balde em segundos de taxa
+SMS_MIN_RATE_FACTOR = float(os.getenv("SMS_MIN_RATE_FACTOR", 0.05))
+SMS_RECOVERY_PER_SECOND = float(os.getenv("SMS_RECOVERY_PER_SECOND", 0.02))  # +2% da taxa por segundo
+# Uma rajada de respostas de throttling conta como um único evento dentro desta janela
+SMS_THROTTLE_COOLDOWN_SECONDS = float(os.getenv("SMS_THROTTLE_COOLDOWN_SECONDS", 1))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "mongo")
+
+# Códigos de throttling do provedor (HTTP 429 e equivalentes do Twilio)
+THROTTLE_ERROR_CODES = {"429", "20429", "14107"}
+
+
+class MemoryBucketStore:
+    """Baldes em memória: só limitam o próprio processo."""
+
+    def __init__(self, recovery_per_second=SMS_RECOVERY_PER_SECOND, min_factor=SMS_MIN_RATE_FACTOR,
+                 cooldown_seconds=SMS_THROTTLE_COOLDOWN_SECONDS):
+        self.recovery = recovery_per_second
+        self.min_factor = min_factor
+        self.cooldown = cooldown_seconds
+        self._buckets = {}
+
+    async def take(self, name, wanted, rate, capacity):
+        now = time.monotonic()
+        bucket = self._buckets.setdefault(name, {"tokens": capacity, "updated_at": now, "factor": 1.0,
+                                                 "throttle_events": 0, "throttled_at": 0.0})
+        elapsed = now - bucket["updated_at"]
+        bucket["factor"] = min(1.0, bucket["factor"] + self.recovery * elapsed)
+        bucket["tokens"] = min(capacity, bucket["tokens"] + elapsed * rate * bucket["factor"])
+        bucket["updated_at"] = now
+        granted = min(wanted, int(bucket["tokens"]))
+        bucket["tokens"] -= granted
+        return granted, bucket["factor"]
+
+    async def throttle(self, name):
+        bucket = self._buckets.get(name)
+        now = time.monotonic()
+        if bucket and now - bucket["throttled_at"] >= self.cooldown:
+            bucket["factor"] = max(self.min_factor, bucket["factor"] * 0.5)
+            bucket["tokens"] = 0
+            bucket["throttle_events"] += 1
+            bucket["throttled_at"] = now
+
+
+class MongoBucketStore:
+    """Baldes na coleção rate_limits, compartilhados por todos os workers.
+
+    Reposição, recuperação do fator e retirada acontecem em um único
+    find_one_and_update com pipeline, usando o relógio do servidor ($$NOW),
+    então processos diferentes nunca concedem o mesmo token.
+    """
+
+    def __init__(self, collection, recovery_per_second=SMS_RECOVERY_PER_SECOND, min_factor=SMS_MIN_RATE_FACTOR,
+                 cooldown_seconds=SMS_THROTTLE_COOLDOWN_SECONDS):
+        self.collection = collection
+        self.recovery = recovery_per_second
+        self.min_factor = min_factor
+        self.cooldown_ms = int(cooldown_seconds * 1000)
+
+    async def take(self, name, wanted, rate, capacity):
+        now = {"$toLong": "$$NOW"}
+        doc = await self.collection.find_one_and_update(
+            {"_id": name},
+            [
+                {"$set": {
+                    "tokens": {"$ifNull": ["$tokens", capacity]},
+                    "updated_at": {"$ifNull": ["$updated_at", now]},
+                    "factor": {"$ifNull": ["$factor", 1.0]},
+                }},
+                {"$set": {
+                    "_elapsed": {"$divide": [{"$subtract": [now, "$updated_at"]}, 1000]},
+                }},
+                {"$set": {
+                    "factor": {"$min": [1.0, {"$add": ["$factor", {"$multiply": ["$_elapsed", self.recovery]}]}]},
+                    "tokens": {"$min": [capacity, {"$add": [
+                        "$tokens", {"$multiply": ["$_elapsed", rate, "$factor"]}
+                    ]}]},
+                    "updated_at": now,
+                }},
+                {"$set": {"_granted": {"$min": [wanted, {"$floor": "$tokens"}]}}},
+                {"$set": {"tokens": {"$subtract": ["$tokens", "$_granted"]}}},
+                {"$unset": "_elapsed"},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return int(doc["_granted"]), doc["factor"]
+
+    async def throttle(self, name):
+        # Só reduz se a última redução (de qualquer worker) já passou da janela
+        now = {"$toLong": "$$NOW"}
+        await self.collection.update_one(
+            {"_id": name, "$expr": {"$gte": [
+                {"$subtract": [now, {"$ifNull": ["$throttled_at", 0]}]}, self.cooldown_ms
+            ]}},
+            [{"$set": {
+                "factor": {"$max": [self.min_factor, {"$multiply": [{"$ifNull": ["$factor", 1.0]}, 0.5]}]},
+                "tokens": 0,
+                "throttle_events": {"$add": [{"$ifNull": ["$throttle_events", 0]}, 1]},
+                "throttled_at": now,
+            }}],
+        )
+
+
+class RateLimiter:
+    """Balde global mais um balde por número de origem, antes de cada envio.
+
+    Os tokens são retirados do armazenamento em pequenos lotes e gastos
+    localmente, para não pagar uma ida ao banco por mensagem. Quando o
+    provedor devolve throttling, a taxa efetiva cai pela metade para todos os
+    workers e volta aos poucos (aumento aditivo, redução multiplicativa).
+    """
+
+    def __init__(self, store, global_rate: float = SMS_GLOBAL_RATE, sender_rate: float = SMS_SENDER_RATE,
+                 burst_seconds: float = SMS_BURST_SECONDS):
+        self.store = store
+        self.global_rate = global_rate
+        self.sender_rate = sender_rate
+        self.burst_seconds = burst_seconds
+        self._local = defaultdict(int)
+        self._factor = defaultdict(lambda: 1.0)
+        self._locks = defaultdict(asyncio.Lock)
+        self.waiting = 0
+        self.acquired = 0
+        self.throttle_events = 0
+        self._window_started = time.monotonic()
+        self._window_acquired = 0
+        self._observed_rate = 0.0
+
+    async def _take_one(self, name, rate):
+        async with self._locks[name]:
+            while self._local[name] <= 0:
+                # Lotes de ~50ms de taxa por ida ao banco
+                lease = max(1, int(rate * self._factor[name] * 0.05))
+                granted, factor = await self.store.take(name, lease, rate, max(1.0, rate * self.burst_seconds))
+                self._factor[name] = factor
+                if granted:
+                    self._local[name] += granted
+                else:
+                    await asyncio.sleep(max(0.005, 1 / (rate * factor)))
+            self._local[name] -= 1
+
+    async def acquire(self, sender: str):
+        self.waiting += 1
+        try:
+            await self._take_one("global", self.global_rate)
+            await self._take_one(f"sender:{sender}", self.sender_rate)
+        finally:
+            self.waiting -= 1
+        self.acquired += 1
+        self._window_acquired += 1
+
+    async def report_throttle(self, sender: str):
+        self.throttle_events += 1
+        logger.warning("Provedor aplicou throttling no número %s; reduzindo a taxa", sender)
+        for name in ("global", f"sender:{sender}"):
+            # Descarta os tokens já retirados para frear imediatamente
+            self._local[name] = 0
+            await self.store.throttle(name)
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        elapsed = now - self._window_started
+        if elapsed >= 1:
+            self._observed_rate = self._window_acquired / elapsed
+            self._window_started, self._window_acquired = now, 0
+        return {
+            "current_rate": round(self._observed_rate, 1),
+            "allowed_rate": round(self.global_rate * self._factor["global"], 1),
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "throttle_events": self.throttle_events,
+        }
+
+
+def create_rate_limiter() -> RateLimiter:
+    if RATE_LIMIT_BACKEND == "memory":
+        return RateLimiter(MemoryBucketStore())
+    from mongodb_config import get_async_database
+    return RateLimiter(MongoBucketStore(get_async_database()["rate_limits"]))
@@ -0,0 +1,159 @@
+"""Novas tentativas de envio e fila de mensagens mortas.
+
+Uma falha temporária não prende o worker: a mensagem volta para
+"Processando" com um novo send_at no futuro e o agendador a publica de novo
+quando vencer, pelo mesmo índice status_send_at das mensagens novas. Erros
+permanentes do provedor não são repetidos. Quem esgota as tentativas fica
+como "Falhou" com dead_letter=True e pode ser reenviado em massa:
+
+    python -m app.services.retry list
+    python -m app.services.retry replay --error-code 30008 --since 2024-05-01
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+from ..models.message import MessageStatus
+from .blocklist import BLOCKED_ERROR_CODE
+from .message_stats import add_delta, counter_updates, reconcile, transition_delta
+
+# Configurações das novas tentativas
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 5))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", 30))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", 3600))
+REPLAY_BATCH_SIZE = int(os.getenv("RETRY_REPLAY_BATCH_SIZE", 1000))
+
+# Erros do provedor que não mudam com uma nova tentativa (número inválido,
+# bloqueado, não é celular...). Os demais, inclusive falhas de rede, são repetidos
+PERMANENT_ERROR_CODES = frozenset({
+    '21211', '21608', '21614', '30003', '30004', '30005', '30006', '30007',
+    'CAMPAIGN_NOT_FOUND', BLOCKED_ERROR_CODE,
+})
+
+
+def is_permanent(error_code) -> bool:
+    return error_code is not None and str(error_code) in PERMANENT_ERROR_CODES
+
+
+def retry_delay(attempt: int, base: float = RETRY_BASE_DELAY_SECONDS, cap: float = RETRY_MAX_DELAY_SECONDS) -> float:
+    """Espera antes da tentativa seguinte: exponencial com jitter entre metade e o total."""
+    delay = min(cap, base * 2 ** max(0, attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def failure_transition(payload: dict, result: dict, now: datetime = None):
+    """Decide o que fazer com um envio que falhou.
+
+    Devolve (status, campos, entrada do histórico). A entrada vai para
+    retry_history no documento, com o número da tentativa e o motivo.
+    """
+    now = now or datetime.utcnow()
+    attempts = int(payload.get("attempts") or 0) + 1
+    fields = {
+        "attempts": attempts,
+        "error_code": result["error_code"],
+        "error_message": result["error_message"],
+    }
+    history = {
+        "attempt": attempts,
+        "error_code": result["error_code"],
+        "error_message": result["error_message"],
+        "at": now,
+    }
+    if is_permanent(result["error_code"]):
+        return MessageStatus.FALHOU, fields, history
+    if attempts >= RETRY_MAX_ATTEMPTS:
+        fields.update({"dead_letter": True, "dead_lettered_at": now})
+        return MessageStatus.FALHOU, fields, history
+    fields["send_at"] = now + timedelta(seconds=retry_delay(attempts))
+    return MessageStatus.PROCESSANDO, fields, history
+
+
+def dead_letter_query(error_code=None, sender_id=None, since=None) -> dict:
+    query = {"dead_letter": True}
+    if error_code:
+        query["error_code"] = error_code
+    if sender_id:
+        query["sender_id"] = sender_id
+    if since:
+        query["dead_lettered_at"] = {"$gte": since}
+    return query
+
+
+def summarize_dead_letters(collection, query: dict) -> list:
+    # Quantidade de mensagens mortas por código de erro
+    return list(collection.aggregate([
+        {"$match": query},
+        {"$group": {"_id": "$error_code", "count": {"$sum": 1}, "last": {"$max": "$dead_lettered_at"}}},
+        {"$sort": {"count": -1}},
+    ]))
+
+
+def replay_dead_letters(collection, query: dict, limit: int = 0, batch_size: int = REPLAY_BATCH_SIZE,
+                        stats_collection=None) -> int:
+    """Devolve mensagens mortas para o agendador, em lotes, com as tentativas zeradas.
+
+    Com `stats_collection`, os totais por remetente passam de falhas para agendadas.
+    """
+    replayed = 0
+    while not limit or replayed < limit:
+        size = batch_size if not limit else min(batch_size, limit - replayed)
+        docs = list(collection.find(query, {"_id": 1, "sender_id": 1}).limit(size))
+        if not docs:
+            break
+        ids = [doc["_id"] for doc in docs]
+        now = datetime.utcnow()
+        result = collection.update_many(
+            {"_id": {"$in": ids}, **query},
+            {
+                "$set": {"status": MessageStatus.PROCESSANDO, "send_at": now, "attempts": 0, "replayed_at": now},
+                "$unset": {"dead_letter": "", "dead_lettered_at": ""},
+                "$inc": {"replays": 1},
+            },
+        )
+        replayed += result.modified_count
+        if stats_collection is not None:
+            _update_stats(collection, stats_collection, docs, result.modified_count)
+    return replayed
+
+
+def _update_stats(collection, stats_collection, docs, modified):
+    senders = {doc.get("sender_id") for doc in docs} - {None}
+    if modified != len(docs):
+        # Parte do lote mudou no meio do caminho: recalcula só esses remetentes
+        reconcile(collection, stats_collection, senders)
+        return
+    totals = {}
+    delta = transition_delta(MessageStatus.FALHOU, MessageStatus.PROCESSANDO)
+    for doc in docs:
+        add_delta(totals, doc.get("sender_id"), delta)
+    requests = counter_updates(totals)
+    if requests:
+        stats_collection.bulk_write(requests, ordered=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["list", "replay"])
+    parser.add_argument("--error-code", default=None)
+    parser.add_argument("--sender-id", default=None)
+    parser.add_argument("--since", default=None, help="data ISO; só mensagens mortas a partir dela")
+    parser.add_argument("--limit", type=int, default=0, help="0 = todas")
+    args = parser.parse_args()
+
+    from mongodb_config import get_sync_database
+
+    db = get_sync_database()
+    messages = db["messages"]
+    since = datetime.fromisoformat(args.since) if args.since else None
+    query = dead_letter_query(args.error_code, args.sender_id, since)
+    if args.command == "list":
+        for row in summarize_dead_letters(messages, query):
+            print(f"{str(row['_id']):<10} {row['count']:>8}   última em {row['last']}")
+    else:
+        replayed = replay_dead_letters(messages, query, args.limit, stats_collection=db["message_stats"])
+        print(f"{replayed} mensagens devolvidas para envio")
+
+
+if __name__ == "__main__":
+    main()
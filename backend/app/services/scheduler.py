@@ -0,0 +1,305 @@
+import heapq
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+from ..models.message import MessageStatus, to_utc_naive
+from .message_stats import version_updates
+
+logger = logging.getLogger(__name__)
+
+# Configurações do agendador
+BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", 1000))
+LOOKAHEAD_SECONDS = float(os.getenv("SCHEDULER_LOOKAHEAD_SECONDS", 60))
+POLL_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_POLL_INTERVAL_SECONDS", 5))
+LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", 300))
+MAX_BUFFERED = int(os.getenv("SCHEDULER_MAX_BUFFERED", 100000))
+METRICS_PORT = int(os.getenv("SCHEDULER_METRICS_PORT", 0))  # 0 = sem /metrics
+
+# Campos necessários para publicar uma mensagem na fila
+DISPATCH_PROJECTION = {
+    "_id": 1,
+    "sender_id": 1,
+    "recipient_phone": 1,
+    "message": 1,
+    "event_date": 1,
+    "reminder_days": 1,
+    "send_at": 1,
+    "attempts": 1,
+    "campaign_id": 1,
+    "variables": 1,
+}
+
+
+def compute_send_at(event_date, reminder_days) -> datetime:
+    """Momento de envio (UTC, sem fuso) = data do evento menos os dias de lembrete."""
+    if isinstance(event_date, str):
+        event_date = datetime.fromisoformat(event_date)
+    return to_utc_naive(event_date) - timedelta(days=reminder_days)
+
+
+def build_payload(doc: dict) -> dict:
+    # Converte o documento do MongoDB em um corpo serializável em JSON
+    payload = {
+        "id": doc["_id"],
+        "sender_id": doc.get("sender_id"),
+        "recipient_phone": doc.get("recipient_phone"),
+        "message": doc.get("message"),
+        "event_date": doc.get("event_date"),
+        "reminder_days": doc.get("reminder_days"),
+        "send_at": doc["send_at"].isoformat(),
+        "attempts": doc.get("attempts", 0),
+    }
+    if isinstance(payload["event_date"], datetime):
+        payload["event_date"] = payload["event_date"].isoformat()
+    if doc.get("campaign_id"):
+        # O worker monta o texto a partir do template da campanha
+        payload["campaign_id"] = doc["campaign_id"]
+        payload["variables"] = doc.get("variables") or {}
+    return payload
+
+
+def claimable_query(horizon: datetime, now: datetime) -> dict:
+    # Pendentes até o horizonte, ou reservadas por uma réplica cuja reserva expirou
+    return {
+        "$or": [
+            {"status": MessageStatus.PROCESSANDO},
+            {"status": MessageStatus.AGENDADA, "lease_until": {"$lt": now}},
+        ],
+        "send_at": {"$lte": horizon},
+    }
+
+
+class MongoDueStore:
+    """Acesso às mensagens pendentes ordenadas por send_at.
+
+    A reserva é atômica por documento: só passa para "Agendada" quem ainda
+    está pendente (ou com reserva expirada), então várias réplicas podem
+    disputar o mesmo lote sem envio duplicado.
+
+    Com `stats_collection`, cada mudança de status incrementa a versão da
+    listagem dos remetentes afetados (ETag de GET /api/messages).
+    """
+
+    def __init__(self, collection, owner: str, lease_seconds: float = LEASE_SECONDS, stats_collection=None):
+        self.collection = collection
+        self.owner = owner
+        self.lease = timedelta(seconds=lease_seconds)
+        self.stats_collection = stats_collection
+        self._senders = {}  # id da mensagem reservada -> remetente
+
+    def claim_due(self, horizon: datetime, limit: int) -> list:
+        now = datetime.utcnow()
+        query = claimable_query(horizon, now)
+        ids = [
+            doc["_id"]
+            for doc in self.collection.find(query, {"_id": 1}).sort("send_at", ASCENDING).limit(limit)
+        ]
+        if not ids:
+            return []
+
+        token = uuid.uuid4().hex
+        self.collection.update_many(
+            {"_id": {"$in": ids}, **query},
+            {"$set": {
+                "status": MessageStatus.AGENDADA,
+                "claimed_by": self.owner,
+                "claim_token": token,
+                "lease_until": now + self.lease,
+            }},
+        )
+        # Apenas os documentos que esta réplica venceu carregam o token
+        docs = list(self.collection.find({"_id": {"$in": ids}, "claim_token": token}, DISPATCH_PROJECTION))
+        if self.stats_collection is not None:
+            for doc in docs:
+                self._senders[doc["_id"]] = doc.get("sender_id")
+            self._touch({doc.get("sender_id") for doc in docs})
+        return docs
+
+    def mark_published(self, ids: list):
+        if not ids:
+            return
+        self.collection.update_many(
+            # Só as que ainda estão reservadas: o worker pode ter gravado o envio antes
+            {"_id": {"$in": ids}, "claimed_by": self.owner, "status": MessageStatus.AGENDADA},
+            {
+                "$set": {"status": MessageStatus.ENFILEIRADA, "queued_at": datetime.utcnow()},
+                "$unset": {"claimed_by": "", "claim_token": "", "lease_until": ""},
+            },
+        )
+        self._touch({self._senders.pop(message_id, None) for message_id in ids})
+
+    def release(self, ids: list):
+        if not ids:
+            return
+        self.collection.update_many(
+            {"_id": {"$in": ids}, "claimed_by": self.owner, "status": MessageStatus.AGENDADA},
+            {
+                "$set": {"status": MessageStatus.PROCESSANDO},
+                "$unset": {"claimed_by": "", "claim_token": "", "lease_until": ""},
+            },
+        )
+        self._touch({self._senders.pop(message_id, None) for message_id in ids})
+
+    def _touch(self, sender_ids):
+        requests = version_updates(sender_ids) if self.stats_collection is not None else []
+        if not requests:
+            return
+        try:
+            self.stats_collection.bulk_write(requests, ordered=False)
+        except PyMongoError as e:
+            # O status já está gravado; a ETag da listagem expira sozinha
+            logger.error("Erro ao atualizar a versão de %d remetentes: %s", len(requests), e)
+
+
+class Scheduler:
+    """Busca mensagens vencidas em lotes e as publica no horário.
+
+    As mensagens que vencem dentro da janela de antecedência ficam em um
+    heap em memória, ordenado por send_at, até o momento da publicação.
+    """
+
+    def __init__(
+        self,
+        store,
+        publish_many,
+        batch_size: int = BATCH_SIZE,
+        lookahead_seconds: float = LOOKAHEAD_SECONDS,
+        poll_interval_seconds: float = POLL_INTERVAL_SECONDS,
+        max_buffered: int = MAX_BUFFERED,
+    ):
+        self.store = store
+        self.publish_many = publish_many
+        self.batch_size = batch_size
+        self.lookahead = timedelta(seconds=lookahead_seconds)
+        self.poll_interval = poll_interval_seconds
+        self.max_buffered = max_buffered
+        self._heap = []
+        self._stop = threading.Event()
+        self.stats = {"claimed": 0, "dispatched": 0, "failed": 0}
+
+    @property
+    def backlog(self) -> int:
+        return len(self._heap)
+
+    def poll(self) -> int:
+        """Reserva o próximo lote da janela; retorna quantas mensagens vieram."""
+        capacity = min(self.batch_size, self.max_buffered - len(self._heap))
+        if capacity <= 0:
+            return 0
+        horizon = datetime.utcnow() + self.lookahead
+        docs = self.store.claim_due(horizon, capacity)
+        for doc in docs:
+            heapq.heappush(self._heap, (doc["send_at"], doc["_id"], doc))
+        self.stats["claimed"] += len(docs)
+        return len(docs)
+
+    def dispatch_due(self) -> int:
+        now = datetime.utcnow()
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            due.append(heapq.heappop(self._heap))
+        if not due:
+            return 0
+
+        try:
+            results = self.publish_many([build_payload(doc) for _, _, doc in due])
+        except Exception as e:
+            logger.error("Erro ao publicar lote de %d mensagens: %s", len(due), e)
+            results = [False] * len(due)
+
+        published = [message_id for (_, message_id, _), ok in zip(due, results) if ok]
+        failed = [message_id for (_, message_id, _), ok in zip(due, results) if not ok]
+        self.store.mark_published(published)
+        # As não confirmadas voltam a ficar pendentes para uma nova reserva
+        self.store.release(failed)
+        self.stats["dispatched"] += len(published)
+        self.stats["failed"] += len(failed)
+        return len(published)
+
+    def _seconds_until_next_due(self) -> float:
+        if not self._heap:
+            return self.poll_interval
+        delta = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+        return max(0.0, min(delta, self.poll_interval))
+
+    def run(self):
+        logger.info("Agendador iniciado")
+        next_poll = 0.0
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                failed_before = self.stats["failed"]
+                try:
+                    if now >= next_poll:
+                        claimed = self.poll()
+                        # Lote cheio indica atraso acumulado: busca de novo sem esperar
+                        next_poll = now if claimed >= self.batch_size else now + self.poll_interval
+                    self.dispatch_due()
+                except PyMongoError as e:
+                    # MongoDB indisponível: o que não foi gravado volta com o fim da reserva
+                    logger.error("Erro de acesso ao MongoDB no agendador: %s", e)
+                    self._stop.wait(self.poll_interval)
+                    continue
+                if self.stats["failed"] > failed_before:
+                    # Broker indisponível: espera antes de tentar de novo
+                    self._stop.wait(self.poll_interval)
+                    continue
+                wait = min(self._seconds_until_next_due(), max(0.0, next_poll - time.monotonic()))
+                if wait > 0:
+                    self._stop.wait(wait)
+        finally:
+            # Devolve o que estava em memória para outra réplica assumir
+            try:
+                self.store.release([message_id for _, message_id, _ in self._heap])
+            except PyMongoError as e:
+                logger.error("Erro ao liberar %d mensagens reservadas; ficam para o fim da reserva: %s",
+                             len(self._heap), e)
+            self._heap.clear()
+            logger.info("Agendador finalizado")
+
+    def stop(self):
+        self._stop.set()
+
+
+def serve_metrics(scheduler: Scheduler, port: int):
+    from app.core import metrics
+
+    metrics.Gauge("scheduler_backlog", "Mensagens reservadas aguardando o horário de envio",
+                  function=lambda: scheduler.backlog)
+    for key in scheduler.stats:
+        metrics.Counter(f"scheduler_{key}_total", f"Mensagens {key} pelo agendador",
+                        function=lambda key=key: scheduler.stats[key])
+    metrics.serve(port)
+    logger.info("Métricas do agendador em :%d/metrics", port)
+
+
+def main():
+    import signal
+    from app.core.logs import setup_logging
+    from mongodb_config import get_sync_database
+    from mongodb_indexes import apply_indexes
+    from rabbitmq_config import publish_many
+
+    setup_logging()
+
+    owner = f"{socket.gethostname()}-{os.getpid()}"
+    db = get_sync_database()
+    apply_indexes(db, collections=["messages"])
+    store = MongoDueStore(db["messages"], owner, stats_collection=db["message_stats"])
+    scheduler = Scheduler(store, publish_many)
+    if METRICS_PORT:
+        serve_metrics(scheduler, METRICS_PORT)
+
+    signal.signal(signal.SIGTERM, lambda *_: scheduler.stop())
+    signal.signal(signal.SIGINT, lambda *_: scheduler.stop())
+    scheduler.run()
+
+
+if __name__ == "__main__":
+    main()
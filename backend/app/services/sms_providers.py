@@ -0,0 +1,155 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from abc import ABC, abstractmethod
+import httpx
+from ..models.message import phone_number
+
+# Configurações dos provedores de SMS
+SMS_PROVIDER = os.getenv("SMS_PROVIDER", "twilio")
+SMS_HTTP_MAX_CONNECTIONS = int(os.getenv("SMS_HTTP_MAX_CONNECTIONS", 100))
+SMS_HTTP_TIMEOUT_SECONDS = float(os.getenv("SMS_HTTP_TIMEOUT_SECONDS", 10))
+FAKE_SMS_LATENCY_MS = float(os.getenv("FAKE_SMS_LATENCY_MS", 150))
+FAKE_SMS_ERROR_RATE = float(os.getenv("FAKE_SMS_ERROR_RATE", 0.0))
+FAKE_SMS_MAX_RATE = float(os.getenv("FAKE_SMS_MAX_RATE", 0))  # 0 = sem limite
+
+ERROR_CODES = {
+    '21211': 'Número de telefone inválido',
+    '21608': 'Número não habilitado para SMS',
+    '21614': 'Número não é um celular',
+    '30003': 'Número não autorizado',
+    '30004': 'Número bloqueado',
+    '30005': 'Número desconhecido',
+    '30006': 'Número inválido',
+    '30007': 'Número não habilitado para SMS',
+    '20429': 'Muitas requisições, limite de envio excedido',
+}
+
+
+def to_e164(phone: str) -> str:
+    # Até 11 dígitos é número nacional, mesmo com DDD 55, e recebe o código do país
+    return f'+{phone_number(phone)}'
+
+
+def success_result(message_sid: str, status_code: str) -> dict:
+    return {
+        'status': 'success',
+        'message_sid': message_sid,
+        'status_code': status_code,
+        'error_code': None,
+        'error_message': None,
+    }
+
+
+def error_result(error_code, error_message: str) -> dict:
+    return {
+        'status': 'error',
+        'message_sid': None,
+        'status_code': None,
+        'error_code': str(error_code) if error_code is not None else None,
+        'error_message': error_message,
+    }
+
+
+class SmsProvider(ABC):
+    """Interface dos provedores de SMS.
+
+    send nunca levanta exceção por erro do provedor: devolve um dict no
+    formato de success_result/error_result. Exceções ficam para falhas
+    inesperadas, em que a mensagem deve voltar para a fila.
+    """
+
+    # Número de origem, usado para o limite de envio por número
+    from_number = "default"
+
+    @abstractmethod
+    async def send(self, to_number: str, body: str) -> dict:
+        ...
+
+    async def close(self):
+        pass
+
+
+class TwilioProvider(SmsProvider):
+    # Usa a API REST com um único cliente HTTP, reaproveitando as conexões
+    def __init__(self, account_sid=None, auth_token=None, phone_number=None):
+        self.account_sid = account_sid or os.getenv('TWILIO_ACCOUNT_SID')
+        self.auth_token = auth_token or os.getenv('TWILIO_AUTH_TOKEN')
+        self.phone_number = phone_number or os.getenv('TWILIO_PHONE_NUMBER')
+        self.from_number = self.phone_number
+        self.url = f"https://api.twilio.com/2010-04-01/Accounts/{self.account_sid}/Messages.json"
+        self.client = httpx.AsyncClient(
+            auth=(self.account_sid, self.auth_token),
+            timeout=SMS_HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=SMS_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=SMS_HTTP_MAX_CONNECTIONS,
+            ),
+        )
+
+    async def send(self, to_number, body):
+        try:
+            response = await self.client.post(self.url, data={
+                "To": to_e164(to_number),
+                "From": self.phone_number,
+                "Body": body,
+            })
+        except httpx.TransportError as e:
+            return error_result(None, f"Erro de comunicação com o Twilio: {str(e)}")
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if response.status_code >= 400:
+            code = data.get("code") or response.status_code
+            return error_result(code, data.get("message") or ERROR_CODES.get(str(code), 'Erro desconhecido ao enviar SMS'))
+        return success_result(data.get("sid"), data.get("status"))
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class FakeProvider(SmsProvider):
+    """Provedor local para desenvolvimento e benchmarks, sem rede.
+
+    Simula a latência do provedor (com variação de ±50%), uma taxa de erro
+    configurável, escolhendo códigos da tabela ERROR_CODES, e opcionalmente
+    um limite de envios por segundo que responde com throttling (20429).
+    """
+
+    from_number = "fake"
+
+    def __init__(self, latency_ms: float = FAKE_SMS_LATENCY_MS, error_rate: float = FAKE_SMS_ERROR_RATE,
+                 error_codes=None, max_rate: float = FAKE_SMS_MAX_RATE):
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.error_codes = [code for code in (error_codes or ERROR_CODES) if code != '20429']
+        self.max_rate = max_rate
+        self.sent = 0
+        self.throttled = 0
+        self._second = 0
+        self._in_second = 0
+
+    async def send(self, to_number, body):
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        if self.max_rate:
+            second = int(time.monotonic())
+            if second != self._second:
+                self._second, self._in_second = second, 0
+            self._in_second += 1
+            if self._in_second > self.max_rate:
+                self.throttled += 1
+                return error_result('20429', ERROR_CODES['20429'])
+        if random.random() < self.error_rate:
+            code = random.choice(self.error_codes)
+            return error_result(code, ERROR_CODES.get(code, 'Erro desconhecido ao enviar SMS'))
+        self.sent += 1
+        return success_result(f"SM{uuid.uuid4().hex}", "queued")
+
+
+def create_provider() -> SmsProvider:
+    if SMS_PROVIDER == "fake":
+        return FakeProvider()
+    return TwilioProvider()
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from itertools import islice
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from ..models.message import MessageStatus
+from .message_stats import add_delta, counter_updates
+
+logger = logging.getLogger(__name__)
+
+# Configurações da gravação em lote dos status
+STATUS_FLUSH_BATCH_SIZE = int(os.getenv("STATUS_FLUSH_BATCH_SIZE", 500))
+STATUS_FLUSH_INTERVAL_SECONDS = float(os.getenv("STATUS_FLUSH_INTERVAL_SECONDS", 0.05))
+STATUS_MAX_CONCURRENT_FLUSHES = int(os.getenv("STATUS_MAX_CONCURRENT_FLUSHES", 4))
+
+
+class StatusBuffer:
+    """Acumula transições de status e grava cada lote de uma vez.
+
+    `update` registra uma transição (status, campos extras em `extra` e valores
+    acrescentados a listas em `push`) e só retorna depois que o lote com ela
+    foi gravado no banco. O worker continua dando ack só após a gravação,
+    então nenhuma transição confirmada se perde: se o lote falhar, as chamadas
+    recebem a exceção e a mensagem volta para a fila. O lote vai para o banco quando enche ou quando o intervalo vence;
+    sem transições pendentes o laço dorme até a próxima, em vez de acordar a
+    cada intervalo. Até `max_concurrent_flushes` lotes podem estar em gravação
+    ao mesmo tempo, para que a espera por um lote não segure a formação do
+    próximo.
+
+    Os status finais (Enviada, Falhou) do lote vão em um único bulk_write.
+    Uma transição intermediária só vale se a mensagem ainda não chegou a um
+    status final; essas vão em update_one concorrentes, porque o bulk_write
+    não diz quais operações a guarda descartou, e `update` devolve 0 para
+    elas.
+
+    Com `counters_collection`, os incrementos dos totais por remetente
+    (`counters=(sender_id, delta)`) das transições aplicadas vão para o banco
+    em um segundo bulk_write, logo depois do lote de status. Uma entrega
+    repetida ou atrasada que a guarda descartou não conta duas vezes.
+    """
+
+    def __init__(self, collection, batch_size: int = STATUS_FLUSH_BATCH_SIZE,
+                 flush_interval_seconds: float = STATUS_FLUSH_INTERVAL_SECONDS,
+                 max_concurrent_flushes: int = STATUS_MAX_CONCURRENT_FLUSHES,
+                 counters_collection=None):
+        self.collection = collection
+        self.counters_collection = counters_collection
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self._pending = {}
+        self._full = asyncio.Event()
+        self._ready = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_concurrent_flushes)
+        self._inflight = set()
+        self._closed = False
+        self._flusher = None
+        self.stats = {"updates": 0, "flushes": 0, "errors": 0, "discarded": 0}
+
+    async def update(self, message_id, status, extra=None, push=None, counters=None):
+        if self._closed:
+            raise RuntimeError("Buffer de status já foi encerrado")
+        fields = {"status": status, "updated_at": datetime.utcnow()}
+        if extra:
+            fields.update(extra)
+        # Transições do mesmo id no mesmo lote viram uma só, a última vence
+        entry = self._pending.get(message_id)
+        if entry is None:
+            if not self._pending:
+                # Primeira transição pendente: acorda o laço e começa a contar o intervalo
+                self._ready.set()
+            entry = self._pending[message_id] = {"fields": {}, "push": {}, "counters": {}, "waiters": []}
+        if entry["fields"].get("status") in MessageStatus.FINAL and status not in MessageStatus.FINAL:
+            # Transição intermediária atrasada no mesmo lote: a guarda do banco a
+            # descartaria, então não apaga o status final nem entra nos totais
+            pass
+        else:
+            entry["fields"].update(fields)
+            for field, value in (push or {}).items():
+                entry["push"].setdefault(field, []).append(value)
+            if counters:
+                add_delta(entry["counters"], *counters)
+        waiter = asyncio.get_running_loop().create_future()
+        entry["waiters"].append(waiter)
+        self.stats["updates"] += 1
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        return await waiter
+
+    async def run(self):
+        # Laço de gravação: roda até close()
+        while not self._closed:
+            if not self._pending:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            if not self._pending:
+                continue
+            await self._slots.acquire()
+            batch = self._take_batch()
+            task = asyncio.get_running_loop().create_task(self._write(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            task.add_done_callback(lambda _task: self._slots.release())
+
+    async def flush(self):
+        # Grava na hora tudo o que está pendente
+        self._full.clear()
+        while self._pending:
+            await self._write(self._take_batch())
+
+    def _take_batch(self):
+        if len(self._pending) <= self.batch_size:
+            batch, self._pending = self._pending, {}
+            return batch
+        # Enquanto esperava um lote livre, acumulou mais de um lote inteiro
+        batch = {message_id: self._pending.pop(message_id)
+                 for message_id in list(islice(self._pending, self.batch_size))}
+        self._full.set()
+        return batch
+
+    async def _write(self, batch):
+        ids = list(batch)
+        final, guarded = [], []
+        for index, message_id in enumerate(ids):
+            entry = batch[message_id]
+            fields = entry["fields"]
+            query = {"_id": message_id}
+            update = {"$set": fields}
+            if entry["push"]:
+                update["$push"] = {field: {"$each": values} for field, values in entry["push"].items()}
+            if fields["status"] in MessageStatus.FINAL:
+                final.append((index, UpdateOne(query, update)))
+            else:
+                # Uma transição intermediária atrasada não apaga um envio já registrado
+                query["status"] = {"$nin": list(MessageStatus.FINAL)}
+                guarded.append((index, query, update))
+
+        # As guardadas vão uma a uma para saber quais a guarda descartou
+        results = await asyncio.gather(
+            self._write_final(final),
+            *(self.collection.update_one(query, update) for _, query, update in guarded),
+            return_exceptions=True,
+        )
+        failed = results[0]
+        matched = {index: 1 for index, _ in final if index not in failed}
+        for (index, _, _), result in zip(guarded, results[1:]):
+            if isinstance(result, Exception):
+                failed[index] = result
+            else:
+                matched[index] = result.matched_count
+        self.stats["flushes"] += 1
+        self.stats["discarded"] += sum(1 for count in matched.values() if not count)
+        if failed:
+            self.stats["errors"] += len(failed)
+            logger.error("Falha ao gravar %d de %d status", len(failed), len(ids))
+        if self.counters_collection is not None:
+            await self._write_counters(batch, ids, matched)
+
+        for index, message_id in enumerate(ids):
+            error = failed.get(index)
+            for waiter in batch[message_id]["waiters"]:
+                if waiter.done():
+                    continue
+                if error is None:
+                    waiter.set_result(matched[index])
+                else:
+                    waiter.set_exception(error)
+
+    async def _write_final(self, indexed_requests) -> dict:
+        # Status finais não têm guarda: vão juntos em um único bulk_write
+        if not indexed_requests:
+            return {}
+        try:
+            await self.collection.bulk_write([request for _, request in indexed_requests], ordered=False)
+        except BulkWriteError as e:
+            return {indexed_requests[error["index"]][0]: Exception(error.get("errmsg", "Erro ao gravar status"))
+                    for error in e.details.get("writeErrors", [])}
+        except Exception as e:
+            return {index: e for index, _ in indexed_requests}
+        return {}
+
+    async def _write_counters(self, batch, ids, matched):
+        # Só as transições que alteraram uma mensagem entram nos totais; as
+        # que falharam ou que a guarda descartou não contam
+        totals = {}
+        for index, message_id in enumerate(ids):
+            if not matched.get(index):
+                continue
+            for sender_id, delta in batch[message_id]["counters"].items():
+                add_delta(totals, sender_id, delta)
+        requests = counter_updates(totals)
+        if not requests:
+            return
+        try:
+            await self.counters_collection.bulk_write(requests, ordered=False)
+        except Exception as e:
+            # Os status já estão gravados; a reconciliação corrige os totais
+            logger.error("Erro ao atualizar os totais por remetente: %s", e)
+
+    def start(self):
+        self._flusher = asyncio.get_running_loop().create_task(self.run())
+        return self._flusher
+
+    async def close(self):
+        # Grava o que sobrou antes de encerrar o processo
+        self._closed = True
+        self._full.set()
+        self._ready.set()
+        if self._flusher is not None:
+            await self._flusher
+        if self._inflight:
+            await asyncio.gather(*self._inflight)
+        await self.flush()
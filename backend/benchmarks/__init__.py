@@ -0,0 +1 @@
+# Este arquivo é necessário para que a pasta benchmarks seja reconhecida como um pacote Python
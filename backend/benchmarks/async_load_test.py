@@ -0,0 +1,85 @@
+"""Teste de carga: handlers async com pymongo bloqueante vs. motor.
+
+Simula N requisições concorrentes a um handler `async def` que faz uma
+consulta ao MongoDB, do jeito antigo (pymongo direto no event loop) e do
+jeito novo (motor). Com o driver bloqueante as requisições são atendidas
+uma de cada vez; com o motor elas se sobrepõem até o tamanho do pool.
+
+Uso (a partir da pasta backend, com um mongod local):
+
+    python -m benchmarks.async_load_test --requests 2000 --concurrency 200
+    python -m benchmarks.async_load_test --query-ms 20
+
+--query-ms usa $where com sleep() para simular uma consulta lenta
+(exige JavaScript habilitado no servidor); 0 mede só a ida e volta.
+"""
+import argparse
+import asyncio
+import time
+from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def run(handler, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await handler()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return total / elapsed, latencies
+
+
+def report(name, throughput, latencies):
+    print(f"{name:<16} {throughput:>10,.0f} req/s   "
+          f"p50={percentile(latencies, 50) * 1000:8.1f}ms   "
+          f"p99={percentile(latencies, 99) * 1000:8.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--query-ms", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=100)
+    args = parser.parse_args()
+
+    sync_collection = MongoClient(args.mongodb_uri, maxPoolSize=args.pool_size)["mensagens_futuras_bench"]["load"]
+    async_collection = AsyncIOMotorClient(args.mongodb_uri, maxPoolSize=args.pool_size)["mensagens_futuras_bench"]["load"]
+    sync_collection.drop()
+    sync_collection.insert_one({"_id": "user", "phone": "11999999999"})
+
+    query = {"_id": "user"}
+    if args.query_ms:
+        query["$where"] = f"sleep({args.query_ms}) || true"
+
+    async def blocking_handler():
+        # Como as rotas faziam antes: pymongo dentro de async def
+        sync_collection.find_one(query)
+
+    async def async_handler():
+        await async_collection.find_one(query)
+
+    print(f"{args.requests} requisições, concorrência {args.concurrency}, consulta de ~{args.query_ms}ms")
+    report("pymongo (antes)", *await run(blocking_handler, args.requests, args.concurrency))
+    report("motor (depois)", *await run(async_handler, args.requests, args.concurrency))
+
+    sync_collection.drop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""Consulta à lista de bloqueio em memória, sem MongoDB.
+
+Monta a mesma tabela usada pela API e pelo worker com --numbers números
+(metade em faixas sequenciais, como as de operadora, metade aleatórios) e
+mede o tempo de uma consulta para números bloqueados e livres, além da
+memória da tabela. Com --compare-set mede também um set do Python com os
+mesmos números.
+
+Uso (a partir da pasta backend):
+
+    python -m benchmarks.blocklist_benchmark --numbers 5000000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from app.models.message import phone_number
+from app.services.blocklist import PhoneIndex
+
+
+def sample_numbers(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    numbers = set()
+    start = phone_number("11900000000")
+    numbers.update(range(start, start + count // 2))
+    while len(numbers) < count:
+        numbers.add(phone_number(f"{rng.randint(11, 99)}9{rng.randint(0, 99999999):08d}"))
+    return list(numbers)
+
+
+def per_lookup(structure, probes) -> float:
+    started = time.perf_counter()
+    for number in probes:
+        number in structure
+    return (time.perf_counter() - started) / len(probes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--numbers", type=int, default=5_000_000)
+    parser.add_argument("--probes", type=int, default=200_000)
+    parser.add_argument("--compare-set", action="store_true")
+    args = parser.parse_args()
+
+    numbers = sample_numbers(args.numbers)
+    rng = random.Random(7)
+    blocked = rng.sample(numbers, args.probes)
+    members = set(numbers) if args.compare_set else None
+    free = [phone_number(f"{rng.randint(11, 99)}8{rng.randint(0, 99999999):08d}") for _ in range(args.probes)]
+
+    started = time.perf_counter()
+    index = PhoneIndex(len(numbers))
+    for number in numbers:
+        index.add(number)
+    print(f"tabela: {len(index):,} números em {time.perf_counter() - started:.1f}s, "
+          f"{index.memory_bytes / 1024 / 1024:.0f} MiB ({index.memory_bytes / len(index):.1f} bytes/número)")
+    print(f"  bloqueado: {per_lookup(index, blocked) * 1e9:.0f} ns/consulta")
+    print(f"  livre:     {per_lookup(index, free) * 1e9:.0f} ns/consulta")
+
+    if members is not None:
+        del members
+        tracemalloc.start()
+        members = set(numbers)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # Inteiros grandes do set são objetos próprios; a lista original conta à parte
+        print(f"set: {size / 1024 / 1024:.0f} MiB só da tabela do set, sem os objetos int")
+        print(f"  bloqueado: {per_lookup(members, blocked) * 1e9:.0f} ns/consulta")
+        print(f"  livre:     {per_lookup(members, free) * 1e9:.0f} ns/consulta")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Vazão do worker de envio com o provedor falso, sem rede nem broker.
+
+Entrega N mensagens ao DispatchWorker.process com no máximo `prefetch`
+em andamento (o mesmo limite que o basic_qos impõe no RabbitMQ) e grava
+os status em memória, para medir só o pipeline de envio.
+
+Uso (a partir da pasta backend):
+
+    python -m benchmarks.dispatch_benchmark --messages 20000 --latency-ms 150 --prefetch 1 10 100 500
+
+Com --rate o envio passa pelo RateLimiter (baldes em memória); junto com
+--provider-max-rate dá para ver o throttling adaptativo convergir para o
+limite real do provedor:
+
+    python -m benchmarks.dispatch_benchmark --prefetch 200 --rate 400 --provider-max-rate 250
+"""
+import argparse
+import asyncio
+import time
+from app.services.dispatcher import DispatchWorker
+from app.services.rate_limit import MemoryBucketStore, RateLimiter
+from app.services.sms_providers import FakeProvider
+
+
+async def run(messages, prefetch, latency_ms, error_rate, rate=None, provider_max_rate=0):
+    statuses = {}
+
+    async def update_status(message_id, status, extra=None, push=None, counters=None):
+        statuses[message_id] = status
+        return 1
+
+    limiter = RateLimiter(MemoryBucketStore(), global_rate=rate, sender_rate=rate) if rate else None
+    worker = DispatchWorker(FakeProvider(latency_ms, error_rate, max_rate=provider_max_rate), update_status,
+                            prefetch=prefetch, rate_limiter=limiter)
+    semaphore = asyncio.Semaphore(prefetch)
+
+    async def deliver(i):
+        async with semaphore:
+            await worker.process({"id": str(i), "recipient_phone": "11999999999", "message": "Lembrete"})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(deliver(i) for i in range(messages)))
+    elapsed = time.perf_counter() - started
+    print(f"prefetch={prefetch:<5} {messages / elapsed:>10,.0f} msg/s   "
+          f"enviadas={worker.stats['sent']} falhas={worker.stats['failed']} "
+          f"novas tentativas={worker.stats['retried']} em {elapsed:.2f}s")
+    if limiter is not None:
+        print(f"               limitador: {limiter.metrics()}  throttling do provedor: {worker.stats['throttled']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--prefetch", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--rate", type=float, default=None, help="limite global e por número (msg/s)")
+    parser.add_argument("--provider-max-rate", type=float, default=0, help="limite simulado do provedor (msg/s)")
+    args = parser.parse_args()
+
+    for prefetch in args.prefetch:
+        # Com prefetch 1 o envio é serial; limita o volume para não demorar demais
+        messages = min(args.messages, max(prefetch * 50, 200))
+        await run(messages, prefetch, args.latency_ms, args.error_rate, args.rate, args.provider_max_rate)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
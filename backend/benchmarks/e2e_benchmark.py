@@ -0,0 +1,239 @@
+"""Benchmark ponta a ponta da API e da publicação na fila.
+
+Executa, em fases, cadastro, login, criação de mensagens, listagem e
+publicação no RabbitMQ com a concorrência pedida, e mede vazão e latência
+(p50/p95/p99) de cada operação. O resultado vai para um JSON que pode ser
+guardado como referência e comparado com as execuções seguintes.
+
+Uso (a partir da pasta backend, com mongod e RabbitMQ locais):
+
+    # contra um servidor já rodando (uvicorn main:app)
+    python -m benchmarks.e2e_benchmark --base-url http://localhost:8000 --output resultado.json
+
+    # com a aplicação no mesmo processo (sem rede nem uvicorn)
+    python -m benchmarks.e2e_benchmark --in-process --output baseline.json
+
+    # compara com a referência; sai com código 1 se alguma operação piorou
+    python -m benchmarks.e2e_benchmark --in-process --baseline baseline.json --threshold 10
+
+--skip-publish pula a fase do RabbitMQ quando não há broker disponível.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta
+import httpx
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summarize(latencies, errors, elapsed, items=None):
+    latencies = sorted(latencies)
+    items = items if items is not None else len(latencies)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput": round(items / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def phase(name, total, concurrency, call, items_per_call=1):
+    """Roda `call(i)` para i em 0..total-1 com no máximo `concurrency` ao mesmo tempo.
+
+    `call` devolve True quando a operação deu certo; exceções contam como erro.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = await call(i)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    result = summarize(latencies, errors, time.perf_counter() - started, total * items_per_call)
+    print(f"{name:<10} {result['count']:>7} ops {result['throughput']:>10,.1f}/s   "
+          f"p50={result['p50_ms']:8.2f}ms p95={result['p95_ms']:8.2f}ms p99={result['p99_ms']:8.2f}ms   "
+          f"erros={errors}")
+    return result
+
+
+async def run_api(client, args):
+    results = {}
+    run_id = random.randint(0, 9999)
+    phones = [f"1{run_id:04d}{i:06d}" for i in range(args.users)]
+    password = "senha-benchmark"
+    sessions = {}
+
+    async def register(i):
+        response = await client.post("/register", data={
+            "first_name": "Benchmark", "last_name": str(i), "phone": phones[i], "password": password,
+        })
+        return response.status_code == 200
+
+    async def login(i):
+        response = await client.post("/login", data={"phone": phones[i], "password": password})
+        # O cookie vai explicitamente em cada requisição, não no cliente compartilhado
+        client.cookies.clear()
+        if response.status_code != 200:
+            return False
+        sessions[i] = response.cookies.get("session_id")
+        return True
+
+    def cookie(i):
+        return {"Cookie": f"session_id={sessions[i % len(sessions)]}"}
+
+    event_date = (datetime.utcnow() + timedelta(days=30)).isoformat()
+
+    async def create_message(i):
+        response = await client.post("/api/messages", headers=cookie(i), json={
+            "recipient_phone": "11999999999",
+            "message": f"Lembrete de benchmark {i}",
+            "event_date": event_date,
+            "reminder_days": 1,
+        })
+        return response.status_code == 200
+
+    async def list_messages(i):
+        response = await client.get("/api/messages", headers=cookie(i), params={"limit": args.list_limit})
+        return response.status_code == 200
+
+    results["register"] = await phase("register", args.users, args.concurrency, register)
+    results["login"] = await phase("login", args.users, args.concurrency, login)
+    if not sessions:
+        print("Nenhum login deu certo; as fases autenticadas foram puladas")
+        return results
+    results["create"] = await phase("create", args.messages, args.concurrency, create_message)
+    results["list"] = await phase("list", args.lists, args.concurrency, list_messages)
+    return results
+
+
+async def run_publish(args):
+    from rabbitmq_config import get_publisher, publish_many
+
+    batches = max(1, args.publish // args.publish_batch)
+
+    async def publish(i):
+        payloads = [{"id": f"benchmark-{i}-{j}", "recipient_phone": "11999999999", "message": "Lembrete"}
+                    for j in range(args.publish_batch)]
+        acked = await asyncio.to_thread(publish_many, payloads)
+        return all(acked)
+
+    # Cada chamada publica um lote; a vazão é contada em mensagens
+    result = await phase("publish", batches, args.concurrency, publish, args.publish_batch)
+    get_publisher().close()
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Imprime a variação de cada operação e devolve as que pioraram além do limite (%)."""
+    regressions = []
+    print(f"\n{'operação':<10} {'vazão':>10} {'p95':>10} {'p99':>10}")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        changes = {}
+        for key in ("throughput", "p95_ms", "p99_ms"):
+            changes[key] = (current[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+        print(f"{name:<10} {changes['throughput']:>+9.1f}% {changes['p95_ms']:>+9.1f}% {changes['p99_ms']:>+9.1f}%")
+        if changes["throughput"] < -threshold or changes["p95_ms"] > threshold:
+            regressions.append(name)
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--in-process", action="store_true", help="chama o app via ASGI, sem servidor")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--lists", type=int, default=2000)
+    parser.add_argument("--list-limit", type=int, default=100)
+    parser.add_argument("--publish", type=int, default=10000, help="mensagens publicadas no RabbitMQ")
+    parser.add_argument("--publish-batch", type=int, default=100)
+    parser.add_argument("--skip-publish", action="store_true")
+    parser.add_argument("--output", default=None, help="grava o resultado em JSON")
+    parser.add_argument("--baseline", default=None, help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=10.0, help="piora tolerada em %%")
+    args = parser.parse_args()
+
+    async with AsyncExitStack() as stack:
+        if args.in_process:
+            from main import app
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            transport = httpx.ASGITransport(app=app)
+            base_url = "http://benchmark"
+        else:
+            transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=args.concurrency))
+            base_url = args.base_url
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60)
+        )
+        results = await run_api(client, args)
+
+    if not args.skip_publish:
+        results["publish"] = await run_publish(args)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "revision": git_revision(),
+            "mode": "in-process" if args.in_process else args.base_url,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "messages": args.messages,
+            "lists": args.lists,
+            "publish": 0 if args.skip_publish else args.publish,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResultado gravado em {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\nPiora acima de {args.threshold:.0f}% em: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nSem regressões em relação à referência")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
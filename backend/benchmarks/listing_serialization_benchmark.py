@@ -0,0 +1,117 @@
+"""Linhas por segundo na serialização da listagem de mensagens.
+
+Compara, sem MongoDB, dois apps FastAPI que devolvem a mesma página de
+documentos (como saem do banco com MESSAGE_LIST_PROJECTION):
+
+- antigo: ajusta cada documento, cria um Message(**msg) por linha e deixa o
+  FastAPI validar e serializar de novo pelo response_model=List[Message];
+- novo: encode_messages, que escreve os documentos direto com orjson.
+
+Os dois são chamados pela interface ASGI, sem cliente HTTP, e o corpo das
+respostas é comparado para garantir que o formato não mudou.
+
+Uso (a partir da pasta backend):
+
+    python -m benchmarks.listing_serialization_benchmark --rows 10000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+from fastapi import FastAPI, Response
+from app.models.message import Message, MessageStatus
+from app.routes.messages import encode_messages
+
+
+def sample_documents(rows):
+    sender_id = str(uuid.uuid4())
+    created = datetime(2024, 4, 1)
+    statuses = (MessageStatus.PROCESSANDO, MessageStatus.ENFILEIRADA, MessageStatus.ENVIADA)
+    return [{
+        "_id": str(uuid.uuid4()),
+        "sender_id": sender_id,
+        "recipient_phone": f"119{i:08d}",
+        "message": "Olá! Lembrete da sua consulta amanhã às 14h. Responda SIM para confirmar.",
+        "event_date": created + timedelta(days=30, minutes=i),
+        "reminder_days": 1,
+        "status": statuses[i % len(statuses)],
+        "created_at": created + timedelta(seconds=i),
+    } for i in range(rows)]
+
+
+def build_app(documents):
+    app = FastAPI()
+
+    @app.get("/old", response_model=List[Message])
+    async def old_listing():
+        # Cópia rasa, como os documentos novos que o motor devolveria
+        messages = [dict(msg) for msg in documents]
+        for msg in messages:
+            if isinstance(msg.get("event_date"), datetime):
+                msg["event_date"] = msg["event_date"].isoformat()
+            if isinstance(msg.get("created_at"), datetime):
+                msg["created_at"] = msg["created_at"].isoformat()
+            msg["id"] = msg["_id"]
+        return [Message(**msg) for msg in messages]
+
+    @app.get("/new", response_model=List[Message])
+    async def new_listing():
+        messages = [dict(msg) for msg in documents]
+        return Response(encode_messages(messages), media_type="application/json")
+
+    return app
+
+
+async def call(app, path):
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app({
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("benchmark", 80),
+    }, receive, send)
+    return b"".join(body)
+
+
+async def measure(app, path, rounds):
+    # Fica o melhor tempo das rodadas, para o ruído da máquina não entrar
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await call(app, path)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    documents = sample_documents(args.rows)
+    app = build_app(documents)
+
+    old_body, new_body = await call(app, "/old"), await call(app, "/new")
+    if json.loads(old_body) != json.loads(new_body):
+        raise SystemExit("As duas respostas não são iguais")
+
+    old = await measure(app, "/old", args.rounds)
+    new = await measure(app, "/new", args.rounds)
+    for label, seconds in (("antigo (pydantic 2x)", old), ("novo (orjson)", new)):
+        print(f"{label:<21} {seconds * 1000:8.1f} ms por resposta   {args.rows / seconds:>12,.0f} linhas/s")
+    print(f"ganho: {old / new:.1f}x ({len(new_body) / 1024:,.0f} KiB por resposta)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
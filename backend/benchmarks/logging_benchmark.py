@@ -0,0 +1,139 @@
+"""Latência de requisição com o logging antigo e com a fila de logging.
+
+Simula o POST /api/messages: ~1ms de I/O assíncrono (o insert no MongoDB)
+mais os logs da rota. No cenário antigo são três logger.info com f-strings
+do payload, do usuário e do documento, escritos por um StreamHandler
+síncrono. No novo há um debug amostrado com campos estruturados, via
+NonBlockingQueueHandler e QueueListener em outra thread. Um cenário
+intermediário manda os logs antigos pela fila, para separar o ganho da
+fila do ganho de logar menos.
+
+A saída é um stream que demora `--write-us` por escrita, imitando um stdout
+preso a um pipe ou a um driver de log lento; com 0 mede só o custo de CPU.
+
+Uso (a partir da pasta backend):
+
+    python -m benchmarks.logging_benchmark --requests 5000 --concurrency 100 --write-us 200
+"""
+import argparse
+import asyncio
+import logging
+import logging.handlers
+import queue
+import time
+import uuid
+from datetime import datetime
+from app.core.logs import (
+    ContextFilter, JsonFormatter, NonBlockingQueueHandler, SamplingFilter, TEXT_FORMAT, request_id_var
+)
+
+
+class SlowStream:
+    # Escrita bloqueante com custo fixo, como um pipe cheio
+    def __init__(self, write_us):
+        self.delay = write_us / 1_000_000
+        self.lines = 0
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        self.lines += 1
+
+    def flush(self):
+        pass
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def sample_message():
+    return {
+        "recipient_phone": "11999999999",
+        "message": "Olá! Lembrete da sua consulta amanhã às 14h. Responda SIM para confirmar. " * 3,
+        "event_date": "2024-04-10T00:00:00",
+        "reminder_days": 1,
+    }
+
+
+async def old_handler(logger):
+    message = sample_message()
+    user = {"id": str(uuid.uuid4()), "first_name": "Maria", "phone": "11988887777"}
+    logger.info(f"Recebendo mensagem: {message}")
+    logger.info(f"Usuário atual: {user}")
+    document = {**message, "_id": str(uuid.uuid4()), "sender_id": user["id"], "created_at": datetime.utcnow()}
+    logger.info(f"Mensagem processada: {document}")
+    await asyncio.sleep(0.001)
+
+
+async def new_handler(logger):
+    message = sample_message()
+    request_id_var.set(uuid.uuid4().hex)
+    document = {**message, "_id": str(uuid.uuid4()), "created_at": datetime.utcnow()}
+    logger.debug("Mensagem recebida", extra={"fields": {"message_id": document["_id"]}})
+    await asyncio.sleep(0.001)
+
+
+async def scenario(name, handler, logger, requests, concurrency, stream):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await handler(logger)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"{name:<21} {requests / elapsed:>8,.0f} req/s   p50={percentile(latencies, 50) * 1000:6.2f}ms "
+          f"p99={percentile(latencies, 99) * 1000:6.2f}ms   linhas escritas={stream.lines}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--write-us", type=float, default=200)
+    parser.add_argument("--debug-sample-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    old_stream = SlowStream(args.write_us)
+    old_logger = logging.getLogger("benchmark.old")
+    old_logger.propagate = False
+    handler = logging.StreamHandler(old_stream)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    old_logger.addHandler(handler)
+    old_logger.setLevel(logging.INFO)
+
+    new_stream = SlowStream(args.write_us)
+    new_logger = logging.getLogger("benchmark.new")
+    new_logger.propagate = False
+    output = logging.StreamHandler(new_stream)
+    output.setFormatter(JsonFormatter())
+    queue_handler = NonBlockingQueueHandler(queue.Queue(10000))
+    queue_handler.addFilter(SamplingFilter(args.debug_sample_rate))
+    queue_handler.addFilter(ContextFilter())
+    new_logger.addHandler(queue_handler)
+    new_logger.setLevel(logging.DEBUG)
+    listener = logging.handlers.QueueListener(queue_handler.queue, output)
+    listener.start()
+
+    await scenario("StreamHandler", old_handler, old_logger, args.requests, args.concurrency, old_stream)
+    # Os mesmos três logs antigos só trocando o handler, para separar o ganho da fila
+    for name, handler_fn in (("logs antigos na fila", old_handler), ("fila + amostragem", new_handler)):
+        await scenario(name, handler_fn, new_logger, args.requests, args.concurrency, new_stream)
+        # Espera a thread esvaziar a fila antes do próximo cenário
+        while not queue_handler.queue.empty():
+            await asyncio.sleep(0.05)
+        print(f"{'':<21} descartados com a fila cheia: {queue_handler.dropped}")
+        new_stream.lines, queue_handler.dropped = 0, 0
+    listener.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
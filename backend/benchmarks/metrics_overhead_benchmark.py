@@ -0,0 +1,97 @@
+"""Custo das métricas no caminho de cada requisição.
+
+Mede três coisas, sem MongoDB nem RabbitMQ:
+
+- Histogram.observe isolado (o que cada requisição, comando do MongoDB e
+  confirmação do RabbitMQ paga);
+- o custo do MetricsMiddleware em volta de um app ASGI que não faz nada;
+- o tempo por requisição de um app FastAPI mínimo, com e sem o
+  MetricsMiddleware, chamado direto pela interface ASGI (sem cliente HTTP
+  nem rede, para o custo não sumir no ruído);
+- o tempo para gerar o texto do /metrics com as séries criadas.
+
+Uso (a partir da pasta backend):
+
+    python -m benchmarks.metrics_overhead_benchmark --requests 20000
+"""
+import argparse
+import asyncio
+import time
+import timeit
+from fastapi import FastAPI
+from app.core.metrics import MetricsMiddleware, Histogram, Registry
+
+
+def build_app(histogram=None):
+    app = FastAPI()
+
+    @app.get("/api/messages/{message_id}")
+    async def get_message(message_id: str):
+        return {"id": message_id, "status": "Processando"}
+
+    if histogram is not None:
+        app.add_middleware(MetricsMiddleware, histogram=histogram)
+    return app
+
+
+async def raw_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def per_request(app, requests):
+    # Chama o app ASGI direto, sem cliente HTTP, para o custo medido ser só o do app
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(i):
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": f"/api/messages/{i % 100}", "raw_path": b"", "root_path": "",
+            "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("benchmark", 80),
+        }
+
+    # Aquecimento: monta a pilha de middlewares e os caches de rota
+    for i in range(200):
+        await app(scope(i), receive, send)
+    started = time.perf_counter()
+    for i in range(requests):
+        await app(scope(i), receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    registry = Registry()
+    histogram = Histogram("bench_seconds", "benchmark", ("method", "route", "status"), registry=registry)
+    calls = 200_000
+    seconds = timeit.timeit(lambda: histogram.observe(0.0042, "GET", "/api/messages", 200), number=calls)
+    print(f"Histogram.observe: {seconds / calls * 1e9:,.0f} ns por chamada")
+
+    # Alterna as rodadas para que aquecimento e ruído afetem os dois lados igual;
+    # fica o melhor tempo de cada lado
+    for label, plain_app, measured_app in (
+        ("app ASGI vazio", lambda: raw_app, lambda: MetricsMiddleware(raw_app, histogram)),
+        ("app FastAPI", build_app, lambda: build_app(histogram)),
+    ):
+        plain, measured = [], []
+        for _ in range(args.rounds):
+            plain.append(await per_request(plain_app(), args.requests))
+            measured.append(await per_request(measured_app(), args.requests))
+        without, with_metrics = min(plain), min(measured)
+        print(f"{label:<15} sem métricas {without * 1e6:7.1f} µs, com {with_metrics * 1e6:7.1f} µs por requisição "
+              f"({(with_metrics - without) * 1e6:+.1f} µs, {(with_metrics / without - 1) * 100:+.1f}%)")
+
+    render = timeit.timeit(registry.render, number=1000) / 1000
+    print(f"render do /metrics: {render * 1e3:.2f} ms ({len(registry.render().splitlines())} linhas)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Latência das listagens durante uma rajada de logins.
+
+Roda no mesmo event loop uma rajada de logins (bcrypt) e um fluxo contínuo
+de requisições de listagem, e mede o p50/p99 das listagens em dois cenários:
+bcrypt direto no event loop (como antes) e bcrypt no pool de processos.
+
+A listagem é simulada por uma corrotina com ~1ms de I/O assíncrono (a ida
+e volta ao MongoDB); o que se mede é quanto o event loop demora para
+atendê-la, que é exatamente o que o bcrypt síncrono travava.
+
+Uso (a partir da pasta backend):
+
+    BCRYPT_ROUNDS=12 PASSWORD_WORKERS=4 python -m benchmarks.password_pool_benchmark --logins 40
+"""
+import argparse
+import asyncio
+import time
+from app.core import passwords
+from app.core.security import BCRYPT_ROUNDS, pwd_context
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def list_messages_stream(stop, latencies, rate):
+    # As chegadas seguem um relógio fixo, independente do event loop: se o
+    # loop travar, as requisições que "chegaram" nesse intervalo acumulam atraso
+    interval = 1 / rate
+    pending = set()
+    next_at = time.perf_counter()
+
+    async def one(arrived_at):
+        await asyncio.sleep(0.001)
+        latencies.append(time.perf_counter() - arrived_at)
+
+    while not stop.is_set():
+        now = time.perf_counter()
+        while next_at <= now:
+            task = asyncio.create_task(one(next_at))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            next_at += interval
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+    await asyncio.gather(*pending)
+
+
+async def scenario(name, login, logins, concurrency, rate):
+    stop = asyncio.Event()
+    latencies = []
+    reader = asyncio.create_task(list_messages_stream(stop, latencies, rate))
+    semaphore = asyncio.Semaphore(concurrency)
+    rejected = 0
+
+    async def one_login():
+        nonlocal rejected
+        async with semaphore:
+            try:
+                await login()
+            except passwords.PasswordPoolBusy:
+                rejected += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await reader
+
+    latencies.sort()
+    print(f"{name:<22} logins em {elapsed:6.2f}s (503: {rejected:3d})   "
+          f"GET /api/messages p50={percentile(latencies, 50) * 1000:7.1f}ms "
+          f"p99={percentile(latencies, 99) * 1000:7.1f}ms max={latencies[-1] * 1000:7.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--list-rate", type=float, default=200.0, help="listagens por segundo")
+    args = parser.parse_args()
+
+    # Mesmo custo configurado em BCRYPT_ROUNDS, para não medir o rehash
+    hashed = pwd_context.hash("senha-de-teste")
+
+    async def inline_login():
+        pwd_context.verify_and_update("senha-de-teste", hashed)
+
+    async def pooled_login():
+        await passwords.verify_password("senha-de-teste", hashed)
+
+    # Aquece o pool para não medir a criação dos processos
+    await asyncio.gather(*(passwords.verify_password("x", hashed) for _ in range(passwords.PASSWORD_WORKERS)))
+
+    print(f"{args.logins} logins (bcrypt custo {BCRYPT_ROUNDS}), {passwords.PASSWORD_WORKERS} processos no pool")
+    await scenario("bcrypt no event loop", inline_login, args.logins, args.concurrency, args.list_rate)
+    await scenario("bcrypt no pool", pooled_login, args.logins, args.concurrency, args.list_rate)
+    passwords.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
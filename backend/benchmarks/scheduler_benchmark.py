@@ -0,0 +1,151 @@
+"""Benchmark do agendador: atraso de disparo e vazão com muitas mensagens pendentes.
+
+Uso (a partir da pasta backend):
+
+    python -m benchmarks.scheduler_benchmark --messages 1000000
+    python -m benchmarks.scheduler_benchmark --mongodb-uri mongodb://localhost:27017
+
+Sem --mongodb-uri o índice de pendentes fica em memória, o que isola o custo
+do heap e do laço de disparo. Com --mongodb-uri as mensagens são gravadas em
+uma coleção descartável e a reserva passa pelo MongoDueStore real.
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from app.services.scheduler import MongoDueStore, Scheduler
+from mongodb_indexes import apply_indexes
+
+
+class MemoryDueStore:
+    # Mesmo contrato do MongoDueStore, com as pendentes em uma lista ordenada
+    def __init__(self, docs):
+        self._pending = deque(sorted(docs, key=lambda d: d["send_at"]))
+        self.published = 0
+
+    def claim_due(self, horizon, limit):
+        claimed = []
+        while self._pending and len(claimed) < limit and self._pending[0]["send_at"] <= horizon:
+            claimed.append(self._pending.popleft())
+        return claimed
+
+    def mark_published(self, ids):
+        self.published += len(ids)
+
+    def release(self, ids):
+        pass
+
+
+def make_docs(count, spread_seconds, overdue_fraction):
+    now = datetime.utcnow()
+    docs = []
+    for _ in range(count):
+        if random.random() < overdue_fraction:
+            offset = -random.uniform(0, spread_seconds)
+        else:
+            offset = random.uniform(0, spread_seconds)
+        docs.append({
+            "_id": str(uuid.uuid4()),
+            "sender_id": "benchmark",
+            "recipient_phone": "11999999999",
+            "message": "Lembrete de teste",
+            "event_date": now + timedelta(days=1, seconds=offset),
+            "reminder_days": 1,
+            "send_at": now + timedelta(seconds=offset),
+            "status": "Processando",
+        })
+    return docs
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--spread-seconds", type=float, default=30.0)
+    parser.add_argument("--overdue-fraction", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--lookahead-seconds", type=float, default=5.0)
+    parser.add_argument("--poll-interval-seconds", type=float, default=0.5)
+    parser.add_argument("--mongodb-uri", default=None)
+    args = parser.parse_args()
+
+    print(f"Gerando {args.messages} mensagens pendentes...")
+    generated_at = datetime.utcnow()
+    docs = make_docs(args.messages, args.spread_seconds, args.overdue_fraction)
+
+    collection = None
+    if args.mongodb_uri:
+        from pymongo import MongoClient
+        collection = MongoClient(args.mongodb_uri)["mensagens_futuras_bench"]["messages"]
+        collection.drop()
+        for i in range(0, len(docs), 10000):
+            collection.insert_many(docs[i:i + 10000], ordered=False)
+        apply_indexes(collection.database, collections=["messages"])
+        store = MongoDueStore(collection, owner="benchmark")
+    else:
+        store = MemoryDueStore(docs)
+
+    # Desloca os horários pelo tempo gasto na carga, para que as "futuras" continuem no futuro
+    shift = datetime.utcnow() - generated_at
+    if collection is not None:
+        shift_ms = int(shift.total_seconds() * 1000)
+        collection.update_many({}, [{"$set": {"send_at": {"$add": ["$send_at", shift_ms]}}}])
+    else:
+        for doc in docs:
+            doc["send_at"] += shift
+    del docs
+
+    # Mensagens já vencidas medem o tempo para drenar o backlog; as futuras, o atraso de disparo
+    seeded_at = datetime.utcnow()
+    lags = []
+    backlog_drained = [0.0]
+
+    def publish_many(payloads):
+        now = datetime.utcnow()
+        for payload in payloads:
+            send_at = datetime.fromisoformat(payload["send_at"])
+            if send_at <= seeded_at:
+                backlog_drained[0] = (now - seeded_at).total_seconds()
+            else:
+                lags.append(max(0.0, (now - send_at).total_seconds()))
+        return [True] * len(payloads)
+
+    scheduler = Scheduler(
+        store,
+        publish_many,
+        batch_size=args.batch_size,
+        lookahead_seconds=args.lookahead_seconds,
+        poll_interval_seconds=args.poll_interval_seconds,
+        max_buffered=max(args.batch_size * 20, 100000),
+    )
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    started = time.perf_counter()
+    thread.start()
+    while scheduler.stats["dispatched"] < args.messages and thread.is_alive():
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    scheduler.stop()
+    thread.join()
+
+    if collection is not None:
+        collection.drop()
+
+    lags.sort()
+    print(f"Mensagens disparadas: {scheduler.stats['dispatched']} em {elapsed:.2f}s")
+    print(f"Vazão média: {scheduler.stats['dispatched'] / elapsed:,.0f} msg/s")
+    print(f"Backlog vencido drenado em {backlog_drained[0]:.2f}s")
+    print(f"Atraso de disparo (mensagens no prazo) p50={percentile(lags, 50) * 1000:.1f}ms "
+          f"p95={percentile(lags, 95) * 1000:.1f}ms p99={percentile(lags, 99) * 1000:.1f}ms "
+          f"max={lags[-1] * 1000 if lags else 0:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Gravação de status: um update_one por mensagem contra o StatusBuffer.
+
+Simula `--concurrency` envios simultâneos (o prefetch do worker), cada um
+gravando a transição final da sua mensagem, e mede quantas transições por
+segundo cada estratégia consegue gravar.
+
+Sem --mongodb-uri a coleção é simulada: cada ida ao banco custa `--rtt-ms`
+de rede (em paralelo, até `--pool-size` conexões) e ocupa o servidor por
+`--per-command-us` mais `--per-doc-us` por documento alterado, o que isola
+o efeito de juntar as gravações. Com --mongodb-uri usa uma coleção
+descartável real.
+
+Uso (a partir da pasta backend):
+
+    python -m benchmarks.status_update_benchmark --messages 20000 --concurrency 200
+    python -m benchmarks.status_update_benchmark --mongodb-uri mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from app.models.message import MessageStatus
+from app.services.status_buffer import StatusBuffer
+
+
+class _Result:
+    matched_count = 1
+
+
+class SimulatedCollection:
+    # Rede em paralelo (limitada pelo pool), trabalho do servidor em série
+    def __init__(self, rtt_ms, per_command_us, per_doc_us, pool_size):
+        self.rtt = rtt_ms / 1000
+        self.per_command = per_command_us / 1_000_000
+        self.per_doc = per_doc_us / 1_000_000
+        self._pool = asyncio.Semaphore(pool_size)
+        self._server_free_at = 0.0
+
+    async def _command(self, docs):
+        loop = asyncio.get_running_loop()
+        async with self._pool:
+            await asyncio.sleep(self.rtt / 2)
+            # O comando entra na fila do servidor e só termina quando chega a vez dele
+            self._server_free_at = max(self._server_free_at, loop.time()) + self.per_command + self.per_doc * docs
+            await asyncio.sleep(self._server_free_at - loop.time() + self.rtt / 2)
+
+    async def update_one(self, query, update):
+        await self._command(1)
+        return _Result()
+
+    async def bulk_write(self, requests, ordered=True):
+        await self._command(len(requests))
+
+
+async def run(name, update, ids, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(message_id):
+        async with semaphore:
+            await update(message_id, MessageStatus.ENVIADA, {"provider_sid": "SM" + message_id[:8]})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(message_id) for message_id in ids))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<22} {len(ids) / elapsed:>10,.0f} status/s   em {elapsed:.2f}s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-interval-ms", type=float, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=1.0)
+    parser.add_argument("--per-command-us", type=float, default=100)
+    parser.add_argument("--per-doc-us", type=float, default=15)
+    parser.add_argument("--pool-size", type=int, default=100)
+    parser.add_argument("--mongodb-uri", default=None)
+    args = parser.parse_args()
+
+    ids = [str(uuid.uuid4()) for _ in range(args.messages)]
+    client = None
+    if args.mongodb_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(args.mongodb_uri)
+        collection = client["benchmark_status_updates"]["messages"]
+        await collection.drop()
+        await collection.insert_many([{"_id": i, "status": MessageStatus.ENFILEIRADA} for i in ids])
+    else:
+        collection = SimulatedCollection(args.rtt_ms, args.per_command_us, args.per_doc_us, args.pool_size)
+
+    async def per_message(message_id, status, extra=None):
+        fields = {"status": status, **(extra or {})}
+        await collection.update_one({"_id": message_id}, {"$set": fields})
+
+    await run("update_one por mensagem", per_message, ids, args.concurrency)
+
+    buffer = StatusBuffer(collection, args.batch_size, args.flush_interval_ms / 1000)
+    buffer.start()
+    await run("StatusBuffer", buffer.update, ids, args.concurrency)
+    await buffer.close()
+    print(f"lotes gravados: {buffer.stats['flushes']} ({buffer.stats['updates'] / max(1, buffer.stats['flushes']):.0f} status por lote)")
+
+    if client is not None:
+        await client.drop_database("benchmark_status_updates")
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
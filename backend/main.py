@@ -1,29 +1,75 @@
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, status, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel, ConfigDict
 import os
 from dotenv import load_dotenv
 from rabbitmq_config import publish_message
+import mongodb_config
 from mongodb_config import create_user, verify_user
-from app.models.message import Message
-from app.routes import auth, messages
+from mongodb_indexes import apply_indexes
+from app.models.message import Message, MessageStatus
+from app.routes import auth, campaigns, messages
+from app.core import metrics, passwords
+from app.core.logs import RequestContextMiddleware, setup_logging
 from app.core.auth import create_session, delete_session
+from app.core.passwords import PasswordPoolBusy
+from app.core.sessions import SESSION_TTL_SECONDS, CachedSessionBackend, get_session_backend
+from app.services.blocklist import get_blocklist
+from app.services.message_events import close_message_events
 
 load_dotenv()
 
-# Configuração do logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+# Configuração do logging (fila + thread de escrita, JSON com redação)
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Cria os índices que faltam ao subir o worker (idempotente)
+APPLY_INDEXES_ON_STARTUP = os.getenv("MONGODB_APPLY_INDEXES_ON_STARTUP", "true").lower() == "true"
+
+async def apply_indexes_in_background():
+    # Não segura a subida do worker; se o banco estiver fora, só registra o erro
+    try:
+        await asyncio.to_thread(apply_indexes, mongodb_config.get_sync_database())
+    except Exception as e:
+        logger.error("Não foi possível verificar os índices do MongoDB: %s", e)
 
-app = FastAPI(title="Sistema de Mensagens Futuras")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # O cliente é criado aqui (sem I/O); a conexão acontece em segundo plano
+    mongodb_config.get_async_client()
+    indexes = asyncio.create_task(apply_indexes_in_background()) if APPLY_INDEXES_ON_STARTUP else None
+    # Invalida o cache local de sessões quando outro processo faz logout
+    sessions = get_session_backend()
+    watcher = asyncio.create_task(sessions.watch_invalidations()) if isinstance(sessions, CachedSessionBackend) else None
+    lag_watcher = asyncio.create_task(metrics.watch_event_loop_lag())
+    # Lista de bloqueio em memória, consultada na validação do telefone
+    blocklist = get_blocklist()
+    blocklist_refresher = asyncio.create_task(blocklist.run()) if blocklist else None
+    yield
+    lag_watcher.cancel()
+    if blocklist_refresher:
+        blocklist_refresher.cancel()
+    if indexes:
+        indexes.cancel()
+    if watcher:
+        watcher.cancel()
+    close_message_events()
+    passwords.shutdown()
+    mongodb_config.close_client()
+
+app = FastAPI(title="Sistema de Mensagens Futuras", lifespan=lifespan)
+
+# Mede a latência de cada rota para o /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+# Id por requisição nos logs e no cabeçalho X-Request-ID
+app.add_middleware(RequestContextMiddleware)
 
 # Configuração CORS
 app.add_middleware(
@@ -32,23 +78,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Request-ID"],
 )
 
-# Armazenamento de sessões em memória (em produção, use Redis ou banco de dados)
-sessions = {}
-
-def get_current_user(request: Request):
-    session_id = request.cookies.get("session_id")
-    if not session_id or session_id not in sessions:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Usuário não autenticado"
-        )
-    return sessions[session_id]
-
 @app.post("/login")
 async def login(response: Response, phone: str = Form(...), password: str = Form(...)):
-    user = verify_user(phone, password)
+    user = await verify_user(phone, password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -56,7 +91,7 @@ async def login(response: Response, phone: str = Form(...), password: str = Form
         )
     
     # Criar uma nova sessão
-    session_id = create_session(user)
+    session_id = await create_session(user)
     
     # Definir o cookie
     response.set_cookie(
@@ -64,7 +99,8 @@ async def login(response: Response, phone: str = Form(...), password: str = Form
         value=session_id,
         httponly=True,
         secure=False,  # Em produção, defina como True
-        samesite="lax"
+        samesite="lax",
+        max_age=SESSION_TTL_SECONDS
     )
     
     return {
@@ -80,7 +116,7 @@ async def login(response: Response, phone: str = Form(...), password: str = Form
 async def logout(request: Request, response: Response):
     session_id = request.cookies.get("session_id")
     if session_id:
-        delete_session(session_id)
+        await delete_session(session_id)
     response.delete_cookie("session_id")
     return {"message": "Logout realizado com sucesso"}
 
@@ -98,21 +134,59 @@ async def register(
             "phone": phone,
             "password": password
         }
-        result = create_user(user_data)
+        result = await create_user(user_data)
         return {"message": "Usuário criado com sucesso", "id": str(result.inserted_id)}
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+    except PasswordPoolBusy:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao criar usuário: {str(e)}"
         )
 
+# Pico de logins/cadastros: 503 com Retry-After em vez de 500
+app.add_exception_handler(PasswordPoolBusy, auth.password_pool_busy_handler)
+
+# Mensagens vencidas que ainda não foram para a fila (atraso do agendador).
+# A contagem usa o índice status_send_at e é refeita no máximo a cada 15s
+DUE_MESSAGES_REFRESH_SECONDS = float(os.getenv("METRICS_DUE_MESSAGES_REFRESH_SECONDS", 15))
+DUE_MESSAGES = metrics.Gauge("scheduler_due_messages", "Mensagens vencidas ainda não publicadas na fila")
+_due_messages_checked_at = 0.0
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    global _due_messages_checked_at
+    if time.monotonic() - _due_messages_checked_at >= DUE_MESSAGES_REFRESH_SECONDS:
+        _due_messages_checked_at = time.monotonic()
+        try:
+            DUE_MESSAGES.set(await mongodb_config.get_async_database().messages.count_documents({
+                "status": {"$in": [MessageStatus.PROCESSANDO, MessageStatus.AGENDADA]},
+                "send_at": {"$lte": datetime.utcnow()},
+            }))
+        except Exception as e:
+            logger.error("Erro ao contar mensagens vencidas: %s", e)
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 # Incluir as rotas de mensagens
 app.include_router(messages.router, prefix="/api", tags=["messages"])
+app.include_router(campaigns.router, prefix="/api", tags=["campaigns"])
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    # Processo no ar; não depende do banco
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    # Pronto para receber tráfego só quando o MongoDB responde
+    if not await mongodb_config.ping():
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "unavailable", "mongodb": False})
+    return {"status": "ok", "mongodb": True}
 
 @app.get("/")
 async def root():
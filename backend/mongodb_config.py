@@ -1,113 +1,267 @@
-from pymongo import MongoClient
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import base64
+from datetime import datetime
+import json
+import logging
 import os
+import threading
 from dotenv import load_dotenv
-from app.core.security import pwd_context
+from app.core.metrics import CommandTimer
+from app.models.message import ARCHIVE_COLLECTION, to_utc_naive
+from app.core.passwords import PasswordPoolBusy, hash_password, verify_password
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 # Configuração do MongoDB
-mongodb_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/mensagens_futuras")
-print(f"Connecting to MongoDB with URI: {mongodb_uri}")
-
-try:
-    client = MongoClient(
-        mongodb_uri,
-        serverSelectionTimeoutMS=5000,
-        connectTimeoutMS=10000,
-        socketTimeoutMS=10000,
-        retryWrites=True,
-        w="majority"
-    )
-    # Test the connection
-    client.admin.command('ping')
-    print("Successfully connected to MongoDB")
-except Exception as e:
-    print(f"Failed to connect to MongoDB: {str(e)}")
-    print("Tentando reconectar sem autenticação...")
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/mensagens_futuras")
+MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "mensagens_futuras")
+
+# Tamanho do pool de conexões e tempos limite, por processo
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", 100))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", 0))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", 0)) or None
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", 10000))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", 10000))
+MONGODB_PING_TIMEOUT_SECONDS = float(os.getenv("MONGODB_PING_TIMEOUT_SECONDS", 2))
+
+# Mede cada comando enviado ao banco (exposto em /metrics)
+command_timer = CommandTimer()
+
+# Um único cliente por processo, criado no primeiro uso. Criar o cliente não
+# faz I/O: a conexão acontece em segundo plano e no primeiro comando, então
+# importar este módulo não depende de o banco estar no ar.
+_client = None
+_client_lock = threading.Lock()
+
+def get_async_client() -> AsyncIOMotorClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AsyncIOMotorClient(
+                    MONGODB_URI,
+                    maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                    minPoolSize=MONGODB_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+                    serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+                    retryWrites=True,
+                    w="majority",
+                    event_listeners=[command_timer],
+                )
+    return _client
+
+def get_async_database():
+    # Rotas da API e worker: motor, sem bloquear o event loop
+    return get_async_client()[MONGODB_DB_NAME]
+
+def get_sync_database():
+    # Agendador, CLIs e criação de índices: o MongoClient síncrono por trás do
+    # motor, que divide o mesmo pool de conexões
+    return get_async_client().delegate[MONGODB_DB_NAME]
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+async def ping() -> bool:
+    """True se o banco respondeu ao ping dentro do tempo limite (usado no /readyz)."""
     try:
-        client = MongoClient(
-            "mongodb://localhost:27017/mensagens_futuras",
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=10000,
-            socketTimeoutMS=10000,
-            retryWrites=True,
-            w="majority"
-        )
-        client.admin.command('ping')
-        print("Successfully connected to MongoDB without authentication")
+        await asyncio.wait_for(get_async_database().command("ping"), MONGODB_PING_TIMEOUT_SECONDS)
+        return True
     except Exception as e:
-        print(f"Failed to connect to MongoDB without authentication: {str(e)}")
-        raise
+        logger.warning("MongoDB indisponível: %s", e)
+        return False
+
+# Nomes antigos do módulo, resolvidos só quando usados
+_LAZY_ATTRIBUTES = {
+    "client": lambda: get_async_client().delegate,
+    "db": get_sync_database,
+    "messages_collection": lambda: get_sync_database()["messages"],
+    "users_collection": lambda: get_sync_database()["users"],
+    "async_client": get_async_client,
+    "async_db": get_async_database,
+    "async_messages_collection": lambda: get_async_database()["messages"],
+    "async_users_collection": lambda: get_async_database()["users"],
+}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-try:
-    db = client["mensagens_futuras"]
-    # Create collections if they don't exist
-    if "users" not in db.list_collection_names():
-        db.create_collection("users")
-    if "messages" not in db.list_collection_names():
-        db.create_collection("messages")
-    
-    messages_collection = db["messages"]
-    users_collection = db["users"]
-    print("Collections created/verified successfully")
-except Exception as e:
-    print(f"Error setting up database collections: {str(e)}")
-    raise
-
-def create_user(user_data):
+async def create_user(user_data):
     try:
-        # Verifica se o usuário já existe
-        if users_collection.find_one({"phone": user_data["phone"]}):
-            raise ValueError("Usuário já existe com este número de telefone")
-        
-        # Criptografa a senha
-        hashed_password = pwd_context.hash(user_data["password"])
+        # Criptografa a senha fora do event loop
+        hashed_password = await hash_password(user_data["password"])
         user_data["password"] = hashed_password
         
-        # Insere o usuário no banco de dados
-        result = users_collection.insert_one(user_data)
-        print(f"User created successfully with ID: {result.inserted_id}")
+        # Insere o usuário no banco de dados; o índice único em phone
+        # rejeita duplicados mesmo com cadastros concorrentes
+        try:
+            result = await get_async_database().users.insert_one(user_data)
+        except DuplicateKeyError:
+            raise ValueError("Usuário já existe com este número de telefone")
         return result
-    except ValueError as e:
-        print(f"Validation error creating user: {str(e)}")
+    except ValueError:
         raise
     except Exception as e:
-        print(f"Error creating user: {str(e)}")
+        logger.error("Erro ao criar usuário: %s", e)
         raise
 
-def verify_user(phone, password):
+async def verify_user(phone, password):
     try:
-        user = users_collection.find_one({"phone": phone})
+        user = await get_async_database().users.find_one({"phone": phone})
         if not user:
-            print(f"No user found with phone: {phone}")
             return None
         
-        if not pwd_context.verify(password, user["password"]):
-            print(f"Invalid password for user: {phone}")
+        valid, new_hash = await verify_password(password, user["password"])
+        if not valid:
             return None
         
+        if new_hash:
+            # O custo do bcrypt mudou: grava o hash refeito com a senha em mãos
+            await get_async_database().users.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": new_hash}}
+            )
+            user["password"] = new_hash
+        
         return user
+    except PasswordPoolBusy:
+        raise
     except Exception as e:
-        print(f"Error verifying user: {str(e)}")
+        logger.error("Erro ao verificar usuário: %s", e)
         return None
 
-def save_message(message_data):
-    try:
-        return messages_collection.insert_one(message_data)
-    except Exception as e:
-        print(f"Error saving message: {str(e)}")
-        raise
+# Campos devolvidos na listagem de mensagens (o restante fica no banco)
+MESSAGE_LIST_PROJECTION = {
+    "_id": 1,
+    "sender_id": 1,
+    "recipient_phone": 1,
+    "message": 1,
+    "event_date": 1,
+    "reminder_days": 1,
+    "status": 1,
+    "created_at": 1,
+    # Mensagens de campanha: o texto é montado na listagem
+    "campaign_id": 1,
+    "variables": 1,
+}
 
-def get_messages_by_recipient(recipient_id):
-    try:
-        return list(messages_collection.find({"recipient_id": recipient_id}))
-    except Exception as e:
-        print(f"Error getting messages: {str(e)}")
-        return []
+def encode_cursor(doc):
+    # Cursor opaco com a posição (created_at, _id) do último documento da página;
+    # o terceiro item marca created_at como data (documentos antigos têm string)
+    created_at = doc.get("created_at")
+    if isinstance(created_at, datetime):
+        raw = json.dumps([created_at.isoformat(), doc["_id"], True])
+    else:
+        raw = json.dumps([created_at, doc["_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
 
-def get_messages_by_sender(sender_id):
+def decode_cursor(cursor):
     try:
-        return list(messages_collection.find({"sender_id": sender_id}))
-    except Exception as e:
-        print(f"Error getting messages by sender: {str(e)}")
-        return [] 
\ No newline at end of file
+        created_at, message_id, *is_date = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if is_date and is_date[0]:
+            created_at = datetime.fromisoformat(created_at)
+        return created_at, message_id
+    except Exception:
+        raise ValueError("Cursor de paginação inválido")
+
+def build_sender_query(sender_id, after=None, statuses=None, date_from=None, date_to=None):
+    query = {"sender_id": sender_id}
+    conditions = []
+    if statuses:
+        query["status"] = {"$in": list(statuses)}
+    if date_from or date_to:
+        dates, strings = {}, {}
+        if date_from:
+            dates["$gte"], strings["$gte"] = to_utc_naive(date_from), date_from.isoformat()
+        if date_to:
+            dates["$lte"], strings["$lte"] = to_utc_naive(date_to), date_to.isoformat()
+        # Enquanto a migração de datas não termina, event_date pode ainda ser string ISO
+        conditions.append({"$or": [{"event_date": dates}, {"event_date": strings}]})
+    if after:
+        # Keyset: tudo que vem depois de (created_at, _id) na ordem decrescente
+        created_at, message_id = decode_cursor(after)
+        keyset = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": message_id}},
+        ]
+        if isinstance(created_at, datetime):
+            # Na ordem do BSON strings vêm antes de datas; em ordem decrescente
+            # os documentos ainda não migrados aparecem depois de todas as datas
+            keyset.append({"created_at": {"$type": "string"}})
+        conditions.append({"$or": keyset})
+    if len(conditions) == 1:
+        query["$or"] = conditions[0]["$or"]
+    elif conditions:
+        query["$and"] = conditions
+    return query
+
+def find_messages_by_sender(sender_id, limit=None, after=None, statuses=None, date_from=None, date_to=None,
+                            projection=MESSAGE_LIST_PROJECTION, batch_size=1000, include_archived=False):
+    """Cursor assíncrono das mensagens do remetente, mais recentes primeiro.
+
+    Com include_archived, junta a coleção principal e a de arquivo na mesma
+    ordem, então o cursor de paginação vale para as duas.
+    """
+    query = build_sender_query(sender_id, after, statuses, date_from, date_to)
+    names = ["messages", ARCHIVE_COLLECTION] if include_archived else ["messages"]
+    cursors = []
+    for name in names:
+        cursor = get_async_database()[name].find(query, projection) \
+            .sort([("created_at", DESCENDING), ("_id", DESCENDING)]) \
+            .batch_size(batch_size)
+        if limit:
+            cursor = cursor.limit(limit)
+        cursors.append(cursor)
+    return cursors[0] if len(cursors) == 1 else _merge_descending(cursors, limit)
+
+def _listing_key(doc):
+    # Ordem do BSON para created_at: null, depois strings, depois datas
+    created_at = doc.get("created_at")
+    rank = 0 if created_at is None else (2 if isinstance(created_at, datetime) else 1)
+    return rank, created_at if created_at is not None else "", doc["_id"]
+
+async def _merge_descending(cursors, limit=None):
+    # Cada cursor já vem ordenado; a cada passo sai o maior dos primeiros
+    heads = [await anext(cursor, None) for cursor in cursors]
+    sent = 0
+    while not limit or sent < limit:
+        candidates = [index for index, doc in enumerate(heads) if doc is not None]
+        if not candidates:
+            break
+        index = max(candidates, key=lambda i: _listing_key(heads[i]))
+        yield heads[index]
+        sent += 1
+        heads[index] = await anext(cursors[index], None)
+
+async def get_messages_page(sender_id, limit, after=None, statuses=None, date_from=None, date_to=None,
+                            include_archived=False):
+    # Busca um documento a mais para saber se existe próxima página
+    cursor = find_messages_by_sender(
+        sender_id, limit + 1, after, statuses, date_from, date_to, include_archived=include_archived
+    )
+    if include_archived:
+        docs = [doc async for doc in cursor]
+    else:
+        docs = await cursor.to_list(length=limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1])
+    return docs, next_cursor
+
+async def get_message_status(message_id):
+    doc = await get_async_database().messages.find_one({"_id": message_id}, {"status": 1})
+    return doc["status"] if doc else None
@@ -0,0 +1,151 @@
+"""Registro de índices do MongoDB e verificação das consultas críticas.
+
+Uso (a partir da pasta backend):
+
+    python -m mongodb_indexes apply   # cria os índices que faltam
+    python -m mongodb_indexes check   # roda explain() e falha se houver COLLSCAN
+"""
+import logging
+import sys
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Índices declarados por coleção. create_indexes é idempotente: índices já
+# existentes com a mesma especificação são ignorados pelo servidor. A opção
+# background só tem efeito antes do MongoDB 4.2; nas versões seguintes o
+# build já é otimizado e segura o lock exclusivo só no início e no fim.
+INDEXES = {
+    "users": [
+        # Login e cadastro buscam por telefone; o índice único também evita
+        # cadastros duplicados em requisições concorrentes
+        IndexModel([("phone", ASCENDING)], name="phone_unique", unique=True, background=True),
+    ],
+    "messages": [
+        # Listagem paginada do remetente (keyset em created_at, _id)
+        IndexModel(
+            [("sender_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="sender_created_at",
+            background=True,
+        ),
+        # Varredura do agendador pelas mensagens vencidas
+        IndexModel([("status", ASCENDING), ("send_at", ASCENDING)], name="status_send_at", background=True),
+        # Só as mensagens mortas entram no índice (listagem e reenvio em massa)
+        IndexModel(
+            [("dead_lettered_at", ASCENDING)],
+            name="dead_letter",
+            partialFilterExpression={"dead_letter": True},
+            background=True,
+        ),
+    ],
+    "campaigns": [
+        # Campanhas do remetente, mais recentes primeiro
+        IndexModel([("sender_id", ASCENDING), ("created_at", DESCENDING)], name="sender_created_at", background=True),
+    ],
+    "messages_archive": [
+        # Listagem com include_archived, na mesma ordem da coleção principal
+        IndexModel(
+            [("sender_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="sender_created_at",
+            background=True,
+        ),
+    ],
+    "phone_blocklist": [
+        # Atualização incremental da cópia em memória de cada processo
+        IndexModel([("updated_at", ASCENDING)], name="updated_at", background=True),
+    ],
+    "sessions": [
+        # O MongoDB remove as sessões assim que expires_at passa
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0, background=True),
+    ],
+}
+
+
+def apply_indexes(db, collections=None):
+    """Cria os índices do registro; erros em um índice não impedem os demais."""
+    for name, models in INDEXES.items():
+        if collections is not None and name not in collections:
+            continue
+        for model in models:
+            try:
+                db[name].create_indexes([model])
+            except OperationFailure as e:
+                logger.error("Erro ao criar índice %s em %s: %s", model.document['name'], name, e)
+    logger.info("Índices do MongoDB verificados")
+
+
+def hot_queries():
+    # Consultas executadas a cada requisição ou a cada ciclo do agendador
+    from mongodb_config import build_sender_query, encode_cursor
+    from app.services.scheduler import claimable_query
+
+    now = datetime.utcnow()
+    return [
+        ("login por telefone", "users", {"filter": {"phone": "11999999999"}}),
+        ("listagem do remetente", "messages", {
+            "filter": build_sender_query("sender"),
+            "sort": [("created_at", DESCENDING), ("_id", DESCENDING)],
+            "limit": 101,
+        }),
+        ("página seguinte", "messages", {
+            "filter": build_sender_query("sender", after=encode_cursor({"created_at": now, "_id": "id"})),
+            "sort": [("created_at", DESCENDING), ("_id", DESCENDING)],
+            "limit": 101,
+        }),
+        ("mensagens vencidas", "messages", {
+            "filter": claimable_query(now, now),
+            "sort": [("send_at", ASCENDING)],
+            "limit": 1000,
+        }),
+    ]
+
+
+def _stages(plan):
+    # Percorre o plano (inclusive o formato do SBE) coletando os estágios
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+def check_queries(db) -> bool:
+    ok = True
+    for label, collection, spec in hot_queries():
+        cursor = db[collection].find(spec["filter"])
+        if "sort" in spec:
+            cursor = cursor.sort(spec["sort"])
+        if "limit" in spec:
+            cursor = cursor.limit(spec["limit"])
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = list(_stages(plan))
+        collscan = "COLLSCAN" in stages
+        ok = ok and not collscan
+        print(f"{'FALHA' if collscan else 'OK':<6} {label:<24} {' <- '.join(stages)}")
+    return ok
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    from mongodb_config import get_sync_database
+    db = get_sync_database()
+
+    if command == "apply":
+        apply_indexes(db)
+    elif command == "check":
+        if not check_queries(db):
+            print("Há consultas críticas sem índice (COLLSCAN)")
+            sys.exit(1)
+    else:
+        print(__doc__)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
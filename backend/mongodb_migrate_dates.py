@@ -0,0 +1,175 @@
+"""Migração de event_date e created_at de string ISO para data BSON.
+
+Percorre as mensagens em ordem de _id, em lotes, com a API no ar: cada lote
+é gravado com um bulk_write e seguido de uma pausa que mantém o ritmo abaixo
+de --max-rate documentos por segundo. A posição é salva na coleção
+migrations depois de cada lote, então uma execução interrompida continua de
+onde parou. Mensagens antigas sem send_at também recebem o campo, para o
+agendador encontrá-las.
+
+Cada atualização só vale se o documento ainda tiver o valor lido, para não
+sobrescrever uma escrita concorrente. Rode depois que todas as réplicas da
+API já gravarem datas BSON.
+
+Uso (a partir da pasta backend):
+
+    python -m mongodb_migrate_dates status
+    python -m mongodb_migrate_dates run --batch-size 500 --max-rate 2000
+    python -m mongodb_migrate_dates run --restart   # ignora a posição salva
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, UpdateOne
+from app.models.message import to_utc_naive
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_ID = "message_dates"
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", 500))
+MIGRATION_MAX_DOCS_PER_SECOND = float(os.getenv("MIGRATION_MAX_DOCS_PER_SECOND", 2000))
+MIGRATION_REPORT_INTERVAL_SECONDS = float(os.getenv("MIGRATION_REPORT_INTERVAL_SECONDS", 5))
+
+DATE_FIELDS = ("event_date", "created_at")
+MIGRATION_PROJECTION = {"_id": 1, "event_date": 1, "created_at": 1, "reminder_days": 1, "send_at": 1}
+
+# Documentos que ainda têm alguma data como string (contagem do status)
+PENDING_QUERY = {"$or": [{field: {"$type": "string"}} for field in DATE_FIELDS]}
+
+
+def parse_date(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return to_utc_naive(value)
+
+
+def date_updates(doc: dict):
+    """Campos a gravar e filtro de comparação para um documento; (None, None) se já migrado.
+
+    Levanta ValueError se uma data não puder ser lida e OverflowError se ela ou
+    o send_at calculado sair do intervalo de datetime.
+    """
+    fields, expected = {}, {"_id": doc["_id"]}
+    for field in DATE_FIELDS:
+        if isinstance(doc.get(field), str):
+            fields[field] = parse_date(doc[field])
+            expected[field] = doc[field]
+    if doc.get("send_at") is None and doc.get("event_date") is not None:
+        event_date = fields.get("event_date") or parse_date(doc["event_date"])
+        fields["send_at"] = event_date - timedelta(days=doc.get("reminder_days") or 0)
+        expected["send_at"] = None
+    if not fields:
+        return None, None
+    return fields, expected
+
+
+def migrate(collection, migrations, batch_size=MIGRATION_BATCH_SIZE, max_rate=MIGRATION_MAX_DOCS_PER_SECOND,
+            restart=False, dry_run=False, report_interval=MIGRATION_REPORT_INTERVAL_SECONDS) -> dict:
+    state = {} if restart else (migrations.find_one({"_id": MIGRATION_ID}) or {})
+    last_id = state.get("last_id")
+    counts = state.get("counts") or {"scanned": 0, "converted": 0, "conflicts": 0, "invalid": 0}
+    total = collection.estimated_document_count()
+    started = last_report = time.monotonic()
+    scanned_at_start = counts["scanned"]
+    if last_id is not None:
+        print(f"Continuando depois de _id={last_id} ({counts['scanned']:,} já lidos)")
+
+    while True:
+        batch_started = time.monotonic()
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = list(collection.find(query, MIGRATION_PROJECTION).sort("_id", ASCENDING).limit(batch_size))
+        if not docs:
+            break
+
+        operations = []
+        for doc in docs:
+            try:
+                fields, expected = date_updates(doc)
+            except (TypeError, ValueError, OverflowError) as e:
+                # Contado e pulado: a posição salva passa dele na próxima retomada
+                counts["invalid"] += 1
+                logger.warning("Data inválida na mensagem %s: %s", doc["_id"], e)
+                continue
+            if fields:
+                operations.append(UpdateOne(expected, {"$set": fields}))
+        if operations and not dry_run:
+            result = collection.bulk_write(operations, ordered=False)
+            counts["converted"] += result.modified_count
+            # O documento mudou entre a leitura e a escrita: a API já gravou outra coisa
+            counts["conflicts"] += len(operations) - result.matched_count
+        elif dry_run:
+            counts["converted"] += len(operations)
+
+        last_id = docs[-1]["_id"]
+        counts["scanned"] += len(docs)
+        if not dry_run:
+            migrations.update_one(
+                {"_id": MIGRATION_ID},
+                {"$set": {"last_id": last_id, "counts": counts, "updated_at": datetime.utcnow()},
+                 "$setOnInsert": {"started_at": datetime.utcnow()},
+                 "$unset": {"finished_at": ""}},
+                upsert=True,
+            )
+
+        now = time.monotonic()
+        if now - last_report >= report_interval:
+            _report(counts, total, counts["scanned"] - scanned_at_start, now - started)
+            last_report = now
+        # Limita o ritmo para a migração não disputar o banco com a API
+        pause = len(docs) / max_rate - (time.monotonic() - batch_started) if max_rate > 0 else 0
+        if pause > 0:
+            time.sleep(pause)
+
+    if not dry_run:
+        migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"counts": counts, "finished_at": datetime.utcnow()}},
+            upsert=True,
+        )
+    _report(counts, total, counts["scanned"] - scanned_at_start, time.monotonic() - started)
+    return counts
+
+
+def _report(counts, total, scanned_now, elapsed):
+    rate = scanned_now / elapsed if elapsed > 0 else 0
+    percent = min(100.0, counts["scanned"] / total * 100) if total else 100.0
+    remaining = max(0, total - counts["scanned"])
+    eta = f"{remaining / rate:,.0f}s" if rate else "-"
+    print(f"{counts['scanned']:>10,}/{total:,} ({percent:5.1f}%)  convertidos={counts['converted']:,} "
+          f"conflitos={counts['conflicts']:,} inválidos={counts['invalid']:,}  {rate:,.0f} docs/s  restante≈{eta}")
+
+
+def show_status(collection, migrations):
+    state = migrations.find_one({"_id": MIGRATION_ID})
+    if not state:
+        print("Migração ainda não executada")
+    else:
+        situation = f"concluída em {state['finished_at']}" if state.get("finished_at") else "em andamento"
+        print(f"Migração {situation}; último _id={state.get('last_id')} contagens={state.get('counts')}")
+    print(f"Mensagens com datas em string: {collection.count_documents(PENDING_QUERY):,}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--max-rate", type=float, default=MIGRATION_MAX_DOCS_PER_SECOND,
+                        help="documentos por segundo; 0 = sem limite")
+    parser.add_argument("--restart", action="store_true", help="começa do início, ignorando a posição salva")
+    parser.add_argument("--dry-run", action="store_true", help="só conta o que seria convertido")
+    args = parser.parse_args()
+
+    from mongodb_config import get_sync_database
+    db = get_sync_database()
+
+    if args.command == "status":
+        show_status(db["messages"], db["migrations"])
+    else:
+        migrate(db["messages"], db["migrations"], args.batch_size, args.max_rate, args.restart, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
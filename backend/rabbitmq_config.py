@@ -1,37 +1,355 @@
 import pika
 import json
 import os
+import atexit
+import functools
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 from datetime import datetime
+from app.core.metrics import RABBITMQ_CONFIRM_DURATION, RABBITMQ_PUBLISH_DURATION
 
 load_dotenv()
 
-def publish_message(message_data):
-    # Adiciona timestamp à mensagem
-    message_data["timestamp"] = datetime.now().isoformat()
-    
-    # Configuração da conexão com o RabbitMQ
-    connection = pika.BlockingConnection(
-        pika.ConnectionParameters(
-            host=os.getenv("RABBITMQ_HOST", "localhost"),
-            port=int(os.getenv("RABBITMQ_PORT", 5672)),
-            credentials=pika.PlainCredentials(
-                os.getenv("RABBITMQ_USER", "guest"),
-                os.getenv("RABBITMQ_PASSWORD", "guest")
-            )
+logger = logging.getLogger(__name__)
+
+QUEUE_NAME = "mensagens_futuras"
+
+# Configurações do publicador
+CHANNEL_POOL_SIZE = int(os.getenv("RABBITMQ_CHANNEL_POOL_SIZE", 4))
+CONFIRM_BATCH_SIZE = int(os.getenv("RABBITMQ_CONFIRM_BATCH_SIZE", 2000))
+MAX_INFLIGHT_BATCHES = int(os.getenv("RABBITMQ_MAX_INFLIGHT_BATCHES", 8))
+PUBLISH_TIMEOUT_SECONDS = float(os.getenv("RABBITMQ_PUBLISH_TIMEOUT_SECONDS", 30))
+RECONNECT_MAX_DELAY_SECONDS = float(os.getenv("RABBITMQ_RECONNECT_MAX_DELAY_SECONDS", 30))
+
+
+class PublishError(Exception):
+    pass
+
+
+def connection_parameters():
+    return pika.ConnectionParameters(
+        host=os.getenv("RABBITMQ_HOST", "localhost"),
+        port=int(os.getenv("RABBITMQ_PORT", 5672)),
+        credentials=pika.PlainCredentials(
+            os.getenv("RABBITMQ_USER", "guest"),
+            os.getenv("RABBITMQ_PASSWORD", "guest")
         )
     )
-    
-    channel = connection.channel()
-    
-    # Declara a fila
-    channel.queue_declare(queue="mensagens_futuras")
-    
-    # Publica a mensagem
-    channel.basic_publish(
-        exchange="",
-        routing_key="mensagens_futuras",
-        body=json.dumps(message_data)
-    )
-    
-    connection.close() 
\ No newline at end of file
+
+
+class _ConfirmChannel:
+    # Canal em modo confirm; as delivery tags crescem a partir de 1
+    def __init__(self, channel=None):
+        self.channel = channel
+        self.confirming = False  # já aceitou o modo confirm
+        self.next_tag = 1
+        self.pending = OrderedDict()  # delivery_tag -> (Future, enviado_em)
+
+
+class RabbitPublisher:
+    """Publicador de longa duração compartilhado pelo processo.
+
+    Mantém uma conexão persistente (SelectConnection) com um pool de canais
+    em modo publisher confirms, rodando em uma thread de I/O própria. As
+    confirmações chegam de forma assíncrona e resolvem um Future por
+    mensagem; se a conexão cair, as pendentes falham e a thread reconecta
+    com backoff exponencial.
+
+    O publicador fica pronto quando a fila foi declarada, uma vez por
+    conexão, no primeiro canal em modo confirm. Se um canal é recusado ou
+    fecha antes disso (por exemplo, a fila existe com outros argumentos e o
+    queue_declare falha com PRECONDITION_FAILED), a conexão é fechada e a
+    preparação recomeça do zero na reconexão.
+    """
+
+    def __init__(
+        self,
+        queue_name: str = QUEUE_NAME,
+        channel_pool_size: int = CHANNEL_POOL_SIZE,
+        confirm_batch_size: int = CONFIRM_BATCH_SIZE,
+        max_inflight_batches: int = MAX_INFLIGHT_BATCHES,
+    ):
+        self.queue_name = queue_name
+        self.channel_pool_size = channel_pool_size
+        self.confirm_batch_size = confirm_batch_size
+        self.max_inflight_batches = max_inflight_batches
+        self._connection = None
+        self._channels = []
+        self._round_robin = itertools.count()
+        self._declaring = False
+        self._ready = threading.Event()
+        self._closing = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._reconnect_delay = 1.0
+        self.stats = {
+            "published": 0,
+            "confirmed": 0,
+            "nacked": 0,
+            "failed": 0,
+            "reconnects": 0,
+            "confirm_latency_total": 0.0,
+            "confirm_latency_max": 0.0,
+        }
+
+    # --- ciclo de vida (thread de I/O) ---
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._closing = False
+                self._thread = threading.Thread(target=self._run, name="rabbitmq-publisher", daemon=True)
+                self._thread.start()
+
+    def close(self, timeout: float = 5.0):
+        self._closing = True
+        connection = self._connection
+        if connection is not None:
+            connection.ioloop.add_callback_threadsafe(self._close_connection)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _close_connection(self):
+        if self._connection is not None and not (self._connection.is_closing or self._connection.is_closed):
+            self._connection.close()
+        else:
+            self._connection.ioloop.stop()
+
+    def _run(self):
+        while not self._closing:
+            self._connection = pika.SelectConnection(
+                connection_parameters(),
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_open_error,
+                on_close_callback=self._on_connection_closed,
+            )
+            self._connection.ioloop.start()
+            self._ready.clear()
+            if self._closing:
+                break
+            self.stats["reconnects"] += 1
+            logger.warning("Reconectando ao RabbitMQ em %.0fs", self._reconnect_delay)
+            time.sleep(self._reconnect_delay)
+            self._reconnect_delay = min(self._reconnect_delay * 2, RECONNECT_MAX_DELAY_SECONDS)
+
+    def _on_connection_open(self, connection):
+        self._channels = []
+        self._declaring = False
+        for _ in range(self.channel_pool_size):
+            self._open_channel(connection)
+
+    def _open_channel(self, connection):
+        # O callback de fechamento vale desde já: também avisa se o canal for recusado
+        confirm_channel = _ConfirmChannel()
+        confirm_channel.channel = connection.channel(
+            on_open_callback=functools.partial(self._on_channel_open, confirm_channel)
+        )
+        confirm_channel.channel.add_on_close_callback(functools.partial(self._on_channel_closed, confirm_channel))
+
+    def _on_connection_open_error(self, connection, error):
+        logger.error("Falha ao conectar ao RabbitMQ: %s", error)
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        self._ready.clear()
+        for confirm_channel in self._channels:
+            self._fail_pending(confirm_channel, reason)
+        self._channels = []
+        if not self._closing:
+            logger.error("Conexão com o RabbitMQ perdida: %s", reason)
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, confirm_channel, channel):
+        channel.confirm_delivery(
+            ack_nack_callback=functools.partial(self._on_confirm, confirm_channel),
+            callback=lambda _frame: self._on_confirm_mode(confirm_channel),
+        )
+
+    def _on_confirm_mode(self, confirm_channel):
+        confirm_channel.confirming = True
+        self._channels.append(confirm_channel)
+        if not self._declaring:
+            # A fila é declarada uma vez por conexão, não a cada mensagem
+            self._declaring = True
+            confirm_channel.channel.queue_declare(queue=self.queue_name, callback=self._on_topology_ready)
+
+    def _on_topology_ready(self, _frame):
+        self._reconnect_delay = 1.0
+        self._ready.set()
+        logger.info("Publicador conectado ao RabbitMQ com %d canais", len(self._channels))
+
+    def _on_channel_closed(self, confirm_channel, channel, reason):
+        self._fail_pending(confirm_channel, reason)
+        if confirm_channel in self._channels:
+            self._channels.remove(confirm_channel)
+        connection = self._connection
+        if self._closing or connection is None or not connection.is_open:
+            return
+        if not self._ready.is_set() or not confirm_channel.confirming:
+            # Preparação incompleta ou canal recusado: reabrir só repetiria a falha
+            logger.error("Canal do RabbitMQ fechado durante a preparação (%s), reconectando", reason)
+            connection.close()
+            return
+        logger.warning("Canal do RabbitMQ fechado (%s), abrindo outro", reason)
+        self._open_channel(connection)
+
+    def _fail_pending(self, confirm_channel, reason):
+        while confirm_channel.pending:
+            _, (future, _) = confirm_channel.pending.popitem(last=False)
+            future.set_exception(PublishError(f"Conexão perdida antes da confirmação: {str(reason)}"))
+            self.stats["failed"] += 1
+
+    def _on_confirm(self, confirm_channel, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        now = time.monotonic()
+        pending = confirm_channel.pending
+        # Com multiple=True a confirmação vale para todas as tags até delivery_tag
+        if method.multiple:
+            tags = list(itertools.takewhile(lambda tag: tag <= method.delivery_tag, pending))
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in pending else []
+        for tag in tags:
+            future, sent_at = pending.pop(tag)
+            latency = now - sent_at
+            self.stats["confirm_latency_total"] += latency
+            self.stats["confirm_latency_max"] = max(self.stats["confirm_latency_max"], latency)
+            RABBITMQ_CONFIRM_DURATION.observe(latency, "ack" if acked else "nack")
+            if acked:
+                self.stats["confirmed"] += 1
+            else:
+                self.stats["nacked"] += 1
+            future.set_result(acked)
+
+    def _publish_batch(self, bodies, futures):
+        if not self._channels:
+            for future in futures:
+                future.set_exception(PublishError("Nenhum canal disponível no RabbitMQ"))
+            return
+        confirm_channel = self._channels[next(self._round_robin) % len(self._channels)]
+        properties = pika.BasicProperties(content_type="application/json")
+        for body, future in zip(bodies, futures):
+            confirm_channel.pending[confirm_channel.next_tag] = (future, time.monotonic())
+            confirm_channel.next_tag += 1
+            confirm_channel.channel.basic_publish(
+                exchange="",
+                routing_key=self.queue_name,
+                body=body,
+                properties=properties,
+            )
+        self.stats["published"] += len(bodies)
+
+    # --- API pública (qualquer thread) ---
+
+    def publish_many(self, messages: list, timeout: float = PUBLISH_TIMEOUT_SECONDS) -> list:
+        """Publica as mensagens em lotes pipelined e espera as confirmações.
+
+        Retorna uma lista de booleanos na mesma ordem das mensagens: True se o
+        broker confirmou, False se rejeitou, expirou ou a conexão caiu.
+        """
+        if not messages:
+            return []
+        self.start()
+        started = time.monotonic()
+        deadline = started + timeout
+        if not self._ready.wait(timeout):
+            logger.error("RabbitMQ indisponível, nenhuma mensagem publicada")
+            return [False] * len(messages)
+
+        bodies = [json.dumps(message, default=str).encode() for message in messages]
+        futures = [Future() for _ in bodies]
+        batches = []
+        for start in range(0, len(bodies), self.confirm_batch_size):
+            end = start + self.confirm_batch_size
+            # Limita os lotes em voo para não acumular confirmações sem fim
+            if len(batches) >= self.max_inflight_batches:
+                self._wait(futures[batches[-self.max_inflight_batches]], deadline)
+            try:
+                self._connection.ioloop.add_callback_threadsafe(
+                    functools.partial(self._publish_batch, bodies[start:end], futures[start:end])
+                )
+            except Exception as e:
+                for future in futures[start:end]:
+                    future.set_exception(PublishError(str(e)))
+            batches.append(end - 1)
+
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(max(0.0, deadline - time.monotonic())))
+            except (PublishError, FutureTimeoutError) as e:
+                logger.error("Mensagem não confirmada pelo RabbitMQ: %s", str(e) or 'timeout')
+                results.append(False)
+        RABBITMQ_PUBLISH_DURATION.observe(time.monotonic() - started)
+        return results
+
+    def _wait(self, future, deadline):
+        try:
+            future.result(max(0.0, deadline - time.monotonic()))
+        except Exception:
+            pass
+
+    def queue_depth(self, timeout: float = 5.0) -> int:
+        """Número de mensagens prontas na fila (queue_declare passivo)."""
+        self.start()
+        if not self._ready.wait(timeout):
+            raise PublishError("RabbitMQ indisponível")
+        future = Future()
+
+        def declare():
+            if not self._channels:
+                future.set_exception(PublishError("Nenhum canal disponível no RabbitMQ"))
+                return
+            self._channels[0].channel.queue_declare(
+                queue=self.queue_name,
+                passive=True,
+                callback=lambda frame: future.set_result(frame.method.message_count),
+            )
+
+        self._connection.ioloop.add_callback_threadsafe(declare)
+        return future.result(timeout)
+
+    def metrics(self) -> dict:
+        answered = self.stats["confirmed"] + self.stats["nacked"]
+        return {
+            "connected": self._ready.is_set(),
+            "published": self.stats["published"],
+            "confirmed": self.stats["confirmed"],
+            "nacked": self.stats["nacked"],
+            "failed": self.stats["failed"],
+            "reconnects": self.stats["reconnects"],
+            "pending_confirms": sum(len(c.pending) for c in list(self._channels)),
+            "confirm_latency_avg_ms": (self.stats["confirm_latency_total"] / answered * 1000) if answered else 0.0,
+            "confirm_latency_max_ms": self.stats["confirm_latency_max"] * 1000,
+        }
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher() -> RabbitPublisher:
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = RabbitPublisher()
+            atexit.register(_publisher.close)
+        return _publisher
+
+
+def publish_many(messages: list) -> list:
+    # Adiciona timestamp às mensagens
+    timestamp = datetime.now().isoformat()
+    for message_data in messages:
+        message_data["timestamp"] = timestamp
+    return get_publisher().publish_many(messages)
+
+
+def publish_message(message_data):
+    if not publish_many([message_data])[0]:
+        raise PublishError("Mensagem não confirmada pelo RabbitMQ")
@@ -0,0 +1,172 @@
+"""Coleções do MongoDB em memória para os testes.
+
+FakeCollection tem a interface assíncrona do motor e SyncCollection a do
+pymongo, para os scripts de manutenção. Entendem só o que o código testado
+usa: igualdade, $in, $nin, $ne, $lt e $gt nas consultas; $set, $inc e $push
+com $each nas atualizações, com campos aninhados por ponto.
+"""
+from types import SimpleNamespace
+import pytest
+from pymongo.errors import BulkWriteError, WriteError
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$nin" in condition and value in condition["$nin"]:
+                return False
+            if "$ne" in condition and value == condition["$ne"]:
+                return False
+            if "$lt" in condition and not (value is not None and value < condition["$lt"]):
+                return False
+            if "$gt" in condition and not (value is not None and value > condition["$gt"]):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _parent(doc: dict, field: str):
+    # "progress.errors" -> (doc["progress"], "errors")
+    *path, name = field.split(".")
+    for key in path:
+        doc = doc.setdefault(key, {})
+    return doc, name
+
+
+def apply_update(doc: dict, update: dict):
+    for field, value in update.get("$set", {}).items():
+        parent, name = _parent(doc, field)
+        parent[name] = value
+    for field, amount in update.get("$inc", {}).items():
+        parent, name = _parent(doc, field)
+        parent[name] = parent.get(name, 0) + amount
+    for field, value in update.get("$push", {}).items():
+        parent, name = _parent(doc, field)
+        parent.setdefault(name, []).extend(value["$each"] if isinstance(value, dict) else [value])
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = {doc["_id"]: dict(doc) for doc in docs}
+        self.failing_ids = set()  # gravações nesses _id dão erro
+        self.down = False  # qualquer gravação dá erro
+        self.calls = []
+
+    def _update(self, query, update, upsert=False) -> int:
+        if self.down:
+            raise ConnectionError("MongoDB indisponível")
+        if query.get("_id") in self.failing_ids:
+            raise WriteError("Falha simulada")
+        doc = self.docs.get(query.get("_id"))
+        if doc is None and upsert:
+            doc = self.docs[query["_id"]] = {"_id": query["_id"]}
+        elif doc is None or not matches(doc, query):
+            return 0
+        apply_update(doc, update)
+        return 1
+
+    async def update_one(self, query, update, upsert=False):
+        self.calls.append(("update_one", query.get("_id")))
+        return SimpleNamespace(matched_count=self._update(query, update, upsert))
+
+    async def bulk_write(self, requests, ordered=True):
+        self.calls.append(("bulk_write", len(requests)))
+        if self.down:
+            raise ConnectionError("MongoDB indisponível")
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                self._update(request._filter, request._doc, request._upsert)
+            except WriteError as e:
+                errors.append({"index": index, "errmsg": str(e)})
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+        return SimpleNamespace(acknowledged=True)
+
+    async def insert_many(self, documents, ordered=True):
+        self.calls.append(("insert_many", len(documents)))
+        errors = []
+        for index, document in enumerate(documents):
+            if document["_id"] in self.docs:
+                errors.append({"index": index, "code": 11000, "errmsg": "E11000 duplicate key"})
+            else:
+                self.docs[document["_id"]] = dict(document)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    async def find_one(self, query, projection=None):
+        return next((doc for doc in self.docs.values() if matches(doc, query)), None)
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction=1):
+        self.docs.sort(key=lambda doc: doc.get(field), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count] if count else self.docs
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class SyncCollection:
+    def __init__(self, docs=(), name="fake"):
+        self.name = name
+        self.docs = {doc["_id"]: dict(doc) for doc in docs}
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+    def find(self, query=None, projection=None):
+        return Cursor([dict(doc) for doc in self.docs.values() if matches(doc, query or {})])
+
+    def find_one(self, query):
+        return next(iter(self.find(query)), None)
+
+    def insert_many(self, documents, ordered=True):
+        errors = []
+        for index, document in enumerate(documents):
+            if document["_id"] in self.docs:
+                errors.append({"index": index, "code": 11000, "errmsg": "E11000 duplicate key"})
+            else:
+                self.docs[document["_id"]] = dict(document)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def delete_many(self, query):
+        ids = [key for key, doc in self.docs.items() if matches(doc, query)]
+        for key in ids:
+            del self.docs[key]
+        return SimpleNamespace(deleted_count=len(ids))
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.find_one(query)
+        if doc is None and not upsert:
+            return SimpleNamespace(matched_count=0, modified_count=0)
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"]})
+        apply_update(doc, update)
+        return SimpleNamespace(matched_count=1, modified_count=1)
+
+    def bulk_write(self, requests, ordered=True):
+        results = [self.update_one(request._filter, request._doc, request._upsert) for request in requests]
+        return SimpleNamespace(matched_count=sum(result.matched_count for result in results),
+                               modified_count=sum(result.modified_count for result in results))
+
+
+@pytest.fixture
+def messages():
+    return FakeCollection()
+
+
+@pytest.fixture
+def message_stats():
+    return FakeCollection()
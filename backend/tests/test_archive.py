@@ -0,0 +1,54 @@
+import gzip
+from datetime import datetime
+from bson import json_util
+from app.models.message import MessageStatus
+from app.services.archive import CollectionTarget, FileTarget, archive_messages
+from tests.conftest import SyncCollection
+
+CUTOFF = datetime(2024, 1, 1)
+
+
+class ChangingMessages(SyncCollection):
+    """Uma mensagem volta a ficar pendente entre a leitura e a remoção."""
+
+    def __init__(self, docs, changes):
+        super().__init__(docs)
+        self.changes = changes
+
+    def delete_many(self, query):
+        for message_id in self.changes:
+            self.docs[message_id]["status"] = MessageStatus.PROCESSANDO
+        self.changes = ()
+        return super().delete_many(query)
+
+
+def old_messages():
+    return [{"_id": f"m{i}", "sender_id": "s1", "status": MessageStatus.ENVIADA, "send_at": datetime(2023, 1, i + 1)}
+            for i in range(3)]
+
+
+def test_file_target_writes_and_uncounts_only_removed_messages(tmp_path):
+    messages = ChangingMessages(old_messages(), changes=["m1"])
+    stats = SyncCollection([{"_id": "s1", "scheduled": 0, "sent": 3, "failed": 0, "version": 0}])
+    target = FileTarget(tmp_path)
+
+    assert archive_messages(messages, target, CUTOFF, max_rate=0, stats_collection=stats) == 2
+
+    with gzip.open(target.path, "rt") as archived:
+        assert [json_util.loads(line)["_id"] for line in archived] == ["m0", "m2"]
+    assert list(messages.docs) == ["m1"]
+    assert stats.docs["s1"]["sent"] == 1
+
+
+def test_collection_target_discards_copy_of_message_that_stayed():
+    messages = ChangingMessages(old_messages(), changes=["m1"])
+    archive = SyncCollection(name="messages_archive")
+    stats = SyncCollection([{"_id": "s1", "scheduled": 0, "sent": 3, "failed": 0, "version": 0}])
+
+    assert archive_messages(messages, CollectionTarget(archive), CUTOFF, max_rate=0, stats_collection=stats) == 2
+
+    assert sorted(archive.docs) == ["m0", "m2"]
+    assert list(messages.docs) == ["m1"]
+    # Na coleção de arquivo as mensagens continuam nos totais
+    assert stats.docs["s1"]["sent"] == 3
+    assert stats.docs["s1"]["version"] == 1
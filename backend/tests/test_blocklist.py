@@ -0,0 +1,93 @@
+import pytest
+from app.models.message import phone_number
+from app.services.blocklist import MAX_LOAD, PhoneIndex
+
+
+@pytest.mark.parametrize("phone, expected", [
+    ("11987654321", 5511987654321),
+    ("+55 (11) 98765-4321", 5511987654321),
+    ("1133334444", 551133334444),
+    # Até 11 dígitos é nacional, mesmo com DDD 55
+    ("55987654321", 5555987654321),
+    ("5533334444", 555533334444),
+    ("5511987654321", 5511987654321),
+    ("+44 20 7946 0958", 442079460958),
+    (11987654321, 5511987654321),
+])
+def test_phone_number_normalization(phone, expected):
+    assert phone_number(phone) == expected
+
+
+def test_phone_number_without_digits_is_invalid():
+    with pytest.raises(ValueError):
+        phone_number("sem número")
+
+
+def colliding(index: PhoneIndex, count: int, base: int = 5511900000000):
+    # Números que diferem da capacidade caem na mesma posição inicial
+    return [base + i * index.capacity for i in range(count)]
+
+
+def test_add_and_lookup():
+    index = PhoneIndex()
+    assert index.add(5511987654321)
+    assert not index.add(5511987654321)
+    assert 5511987654321 in index
+    assert 5511987654322 not in index
+    assert len(index) == 1
+
+
+def test_lookup_after_deletion_follows_probe_chain():
+    index = PhoneIndex()
+    first, second, third = colliding(index, 3)
+    for number in (first, second, third):
+        index.add(number)
+
+    assert index.discard(second)
+    assert not index.discard(second)
+    # O número depois do removido no mesmo caminho continua encontrável
+    assert third in index and first in index
+    assert second not in index
+    assert len(index) == 2
+
+
+def test_add_reuses_removed_slot_without_duplicating():
+    index = PhoneIndex()
+    first, second, third = colliding(index, 3)
+    for number in (first, second, third):
+        index.add(number)
+    index.discard(first)
+
+    # third já está mais adiante no caminho: não entra de novo no lugar do removido
+    assert not index.add(third)
+    assert index.add(first)
+    assert sorted(index) == sorted([first, second, third])
+    assert index._removed == 0
+
+
+def test_grows_past_max_load_and_keeps_numbers():
+    index = PhoneIndex()
+    capacity = index.capacity
+    numbers = [5511900000000 + i for i in range(int(capacity * MAX_LOAD) + 10)]
+    for number in numbers:
+        index.add(number)
+
+    assert index.capacity > capacity
+    assert index.load <= MAX_LOAD
+    assert len(index) == len(numbers)
+    assert all(number in index for number in numbers)
+    assert 5511800000000 not in index
+
+
+def test_removed_slots_count_towards_growth():
+    index = PhoneIndex()
+    capacity = index.capacity
+    for number in range(5511900000000, 5511900000000 + int(capacity * 0.6)):
+        index.add(number)
+        index.discard(number)
+    for number in range(5521900000000, 5521900000000 + int(capacity * 0.4)):
+        index.add(number)
+
+    assert len(index) == int(capacity * 0.4)
+    assert all(number in index for number in range(5521900000000, 5521900000000 + int(capacity * 0.4)))
+    assert 5511900000000 not in index
@@ -0,0 +1,29 @@
+import asyncio
+from datetime import datetime
+from app.models.campaign import CampaignStatus
+from app.services.campaigns import ingest_recipients
+from tests.conftest import FakeCollection
+
+
+async def body(text: str):
+    yield text.encode()
+
+
+def test_out_of_range_row_date_is_rejected_and_import_continues(messages, message_stats):
+    campaign = {"_id": "c1", "sender_id": "s1", "template": "Olá {nome}", "event_date": datetime(2024, 4, 10),
+                "reminder_days": 1}
+    campaigns = FakeCollection([campaign])
+    csv = ("phone,nome,event_date\n"
+           "11987654321,Ana,\n"
+           "11987654322,Bia,0001-01-01T00:00:00+01:00\n"
+           "11987654323,Caio,0001-01-01T00:00:00\n"
+           "11987654324,Davi,2024-05-01T12:00:00\n")
+
+    totals = asyncio.run(ingest_recipients(campaign, body(csv), "csv", messages, campaigns, message_stats))
+
+    assert totals["accepted"] == 2
+    assert totals["rejected"] == 2
+    assert sorted(messages.docs) == ["c1:1", "c1:4"]
+    assert campaigns.docs["c1"]["status"] == CampaignStatus.PRONTA
+    errors = campaigns.docs["c1"]["progress"]["errors"]
+    assert [error.split(":")[0] for error in errors] == ["linha 2", "linha 3"]
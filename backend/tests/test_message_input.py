@@ -0,0 +1,30 @@
+import pytest
+from pydantic import ValidationError
+from app.models.message import MAX_REMINDER_DAYS, MessageInput
+
+
+def message(**fields):
+    return MessageInput(**{"recipient_phone": "11987654321", "message": "Lembrete",
+                           "event_date": "2024-04-10T00:00:00", "reminder_days": 1, **fields})
+
+
+def error_fields(**fields):
+    with pytest.raises(ValidationError) as error:
+        message(**fields)
+    return [err["loc"][0] for err in error.value.errors()]
+
+
+def test_accepts_reminder_up_to_limit():
+    assert message(reminder_days=MAX_REMINDER_DAYS).reminder_days == MAX_REMINDER_DAYS
+
+
+@pytest.mark.parametrize("fields, field", [
+    ({"reminder_days": 10**9}, "reminder_days"),
+    ({"reminder_days": -1}, "reminder_days"),
+    ({"event_date": "0001-01-01T00:00:00", "reminder_days": 1}, "reminder_days"),
+    ({"event_date": "0001-01-01T00:00:00+01:00", "reminder_days": 0}, "event_date"),
+    ({"event_date": "9999-12-31T23:00:00-05:00", "reminder_days": 0}, "event_date"),
+])
+def test_out_of_range_dates_fail_validation(fields, field):
+    # Sem a validação, o cálculo de send_at levantava OverflowError (500)
+    assert error_fields(**fields) == [field]
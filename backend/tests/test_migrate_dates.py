@@ -0,0 +1,23 @@
+from datetime import datetime
+from mongodb_migrate_dates import MIGRATION_ID, migrate
+from tests.conftest import SyncCollection
+
+
+def test_out_of_range_dates_are_counted_as_invalid():
+    messages = SyncCollection([
+        {"_id": "a", "event_date": "2024-04-10T00:00:00", "reminder_days": 1},
+        # send_at cairia antes do ano 1
+        {"_id": "b", "event_date": "0001-01-01T00:00:00", "reminder_days": 1},
+        {"_id": "c", "event_date": "0001-01-01T00:00:00+01:00", "reminder_days": 0},
+        {"_id": "d", "event_date": "2024-04-11T00:00:00", "created_at": "2024-04-01T10:00:00",
+         "reminder_days": 0},
+    ])
+    migrations = SyncCollection()
+
+    counts = migrate(messages, migrations, batch_size=2, max_rate=0)
+
+    assert counts == {"scanned": 4, "converted": 2, "conflicts": 0, "invalid": 2}
+    assert messages.docs["a"]["send_at"] == datetime(2024, 4, 9)
+    assert messages.docs["d"]["created_at"] == datetime(2024, 4, 1, 10)
+    assert messages.docs["b"]["event_date"] == "0001-01-01T00:00:00"
+    assert migrations.docs[MIGRATION_ID]["last_id"] == "d"
@@ -0,0 +1,96 @@
+from rabbitmq_config import RabbitPublisher
+
+
+class FakeChannel:
+    def __init__(self, on_open_callback):
+        self.on_open_callback = on_open_callback
+        self.close_callbacks = []
+        self.declares = []
+
+    def add_on_close_callback(self, callback):
+        self.close_callbacks.append(callback)
+
+    def confirm_delivery(self, ack_nack_callback, callback):
+        self.on_confirm_mode = callback
+
+    def queue_declare(self, queue, callback, passive=False):
+        self.declares.append(callback)
+
+    def open(self):
+        self.on_open_callback(self)
+        self.on_confirm_mode(None)
+
+    def close(self, reason):
+        for callback in self.close_callbacks:
+            callback(self, reason)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.channels = []
+        self.is_open = True
+        self.closed = False
+
+    def channel(self, on_open_callback):
+        channel = FakeChannel(on_open_callback)
+        self.channels.append(channel)
+        return channel
+
+    def close(self):
+        self.closed = True
+
+
+def connect(pool_size=3):
+    publisher = RabbitPublisher(channel_pool_size=pool_size)
+    connection = publisher._connection = FakeConnection()
+    publisher._on_connection_open(connection)
+    return publisher, connection
+
+
+def declaring(connection):
+    return next(channel for channel in connection.channels if channel.declares)
+
+
+def test_ready_after_queue_is_declared_once():
+    publisher, connection = connect()
+    for channel in connection.channels:
+        channel.open()
+    declaring(connection).declares[0](None)
+
+    assert publisher._ready.is_set()
+    assert sum(len(channel.declares) for channel in connection.channels) == 1
+    assert len(publisher._channels) == 3
+
+
+def test_failed_declare_closes_connection_instead_of_waiting_forever():
+    publisher, connection = connect()
+    connection.channels[0].open()
+    # PRECONDITION_FAILED: o broker fecha o canal que declarou a fila
+    connection.channels[0].close("PRECONDITION_FAILED")
+    for channel in connection.channels[1:]:
+        channel.open()
+
+    assert connection.closed
+    assert not publisher._ready.is_set()
+    assert len(connection.channels) == 3  # nenhum canal de reposição
+
+
+def test_channel_refused_during_setup_forces_reconnect():
+    publisher, connection = connect()
+    connection.channels[0].close("CHANNEL_ERROR")
+
+    assert connection.closed
+
+
+def test_channel_lost_after_ready_is_replaced():
+    publisher, connection = connect(pool_size=2)
+    for channel in connection.channels:
+        channel.open()
+    declaring(connection).declares[0](None)
+
+    connection.channels[1].close("canal encerrado")
+    connection.channels[2].open()
+
+    assert not connection.closed
+    assert publisher._ready.is_set()
+    assert len(publisher._channels) == 2
@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+from app.core import sessions
+from app.core.sessions import CachedSessionBackend, MemorySessionBackend, SessionBackend
+
+
+class Stream:
+    def __init__(self, changes, error=None):
+        self.changes, self.error = list(changes), error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.changes:
+            return self.changes.pop(0)
+        if self.error is not None:
+            raise self.error
+        # Sem mais mudanças o stream fica aberto
+        await asyncio.Event().wait()
+
+
+class WatchedCollection:
+    def __init__(self, streams):
+        self.streams = list(streams)
+        self.opened = 0
+
+    def watch(self, pipeline):
+        self.opened += 1
+        stream = self.streams.pop(0)
+        if isinstance(stream, Exception):
+            raise stream
+        return stream
+
+
+def test_backend_missing_a_method_fails_on_creation():
+    class NoDelete(SessionBackend):
+        async def get(self, session_id):
+            return None
+
+        async def set(self, session_id, data, ttl_seconds):
+            pass
+
+    with pytest.raises(TypeError):
+        NoDelete()
+
+
+def watch(cached, until):
+    async def scenario():
+        task = asyncio.ensure_future(cached.watch_invalidations())
+        while not until():
+            await asyncio.sleep(0)
+        task.cancel()
+        return task
+    return asyncio.run(scenario())
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay):
+        await real_sleep(0)
+    monkeypatch.setattr(sessions.asyncio, "sleep", sleep)
+
+
+def test_watch_reconnects_after_error_and_drops_stale_cache():
+    memory = MemorySessionBackend()
+    memory.collection = WatchedCollection([
+        AutoReconnect("conexão perdida"),
+        Stream([{"documentKey": {"_id": "a"}}], error=AutoReconnect("conexão perdida")),
+        Stream([{"documentKey": {"_id": "b"}}]),
+    ])
+    cached = CachedSessionBackend(memory)
+    cached.cache.set("a", {"user": 1})
+    cached.cache.set("b", {"user": 2})
+    cached.cache.set("c", {"user": 3})
+
+    watch(cached, until=lambda: memory.collection.opened == 3 and cached.cache.get("b") is None)
+
+    assert cached.cache.get("a") is None
+    # Sessão sem evento também sai: o logout pode ter acontecido durante a queda
+    assert cached.cache.get("c") is None
+
+
+def test_watch_stops_when_change_streams_are_unsupported():
+    memory = MemorySessionBackend()
+    memory.collection = WatchedCollection([OperationFailure("sem replica set", code=40573)])
+    cached = CachedSessionBackend(memory)
+
+    asyncio.run(asyncio.wait_for(cached.watch_invalidations(), 1))
+
+    assert memory.collection.opened == 1
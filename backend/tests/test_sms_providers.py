@@ -0,0 +1,23 @@
+import pytest
+from app.services.sms_providers import FakeProvider, SmsProvider, to_e164
+
+
+@pytest.mark.parametrize("phone, expected", [
+    ("11987654321", "+5511987654321"),
+    ("(11) 98765-4321", "+5511987654321"),
+    ("+55 11 98765-4321", "+5511987654321"),
+    # DDD 55 (RS): continua sendo um número nacional
+    ("55987654321", "+5555987654321"),
+    ("5533334444", "+555533334444"),
+])
+def test_to_e164(phone, expected):
+    assert to_e164(phone) == expected
+
+
+def test_provider_without_send_fails_on_creation():
+    class Incomplete(SmsProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    assert isinstance(FakeProvider(), SmsProvider)
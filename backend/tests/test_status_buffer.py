@@ -0,0 +1,157 @@
+import asyncio
+from app.models.message import MessageStatus
+from app.services.message_stats import transition_delta
+from app.services.status_buffer import StatusBuffer
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_late_transition_after_final_does_not_count(messages, message_stats):
+    messages.docs["m1"] = {"_id": "m1", "sender_id": "s1", "status": MessageStatus.ENVIADA}
+    message_stats.docs["s1"] = {"_id": "s1", "scheduled": 0, "sent": 1, "failed": 0, "version": 3}
+
+    async def scenario():
+        buffer = StatusBuffer(messages, counters_collection=message_stats)
+        buffer.start()
+        # Reentrega atrasada: o envio já foi gravado
+        matched = await buffer.update("m1", MessageStatus.ENFILEIRADA, counters=(
+            "s1", transition_delta(MessageStatus.AGENDADA, MessageStatus.ENFILEIRADA)))
+        retried = await buffer.update("m1", MessageStatus.PROCESSANDO, counters=(
+            "s1", transition_delta(MessageStatus.ENFILEIRADA, MessageStatus.FALHOU)))
+        await buffer.close()
+        return matched, retried, buffer.stats
+
+    matched, retried, stats = run(scenario())
+    assert (matched, retried) == (0, 0)
+    assert messages.docs["m1"]["status"] == MessageStatus.ENVIADA
+    assert message_stats.docs["s1"] == {"_id": "s1", "scheduled": 0, "sent": 1, "failed": 0, "version": 3}
+    assert stats["discarded"] == 2
+
+
+def test_late_transition_in_same_batch_keeps_final_status(messages, message_stats):
+    messages.docs["m1"] = {"_id": "m1", "sender_id": "s1", "status": MessageStatus.ENFILEIRADA}
+    sent = transition_delta(MessageStatus.ENFILEIRADA, MessageStatus.ENVIADA)
+
+    async def scenario():
+        buffer = StatusBuffer(messages, counters_collection=message_stats)
+        # Sem o laço de gravação as duas transições caem no mesmo lote
+        first = asyncio.ensure_future(buffer.update("m1", MessageStatus.ENVIADA, counters=("s1", sent)))
+        late = asyncio.ensure_future(buffer.update("m1", MessageStatus.ENFILEIRADA, {"queued_at": 1}))
+        await asyncio.sleep(0)
+        await buffer.close()
+        return await first, await late
+
+    assert run(scenario()) == (1, 1)
+    assert messages.docs["m1"]["status"] == MessageStatus.ENVIADA
+    assert "queued_at" not in messages.docs["m1"]
+    assert message_stats.docs["s1"]["sent"] == 1
+    assert message_stats.docs["s1"]["scheduled"] == -1
+
+
+def test_transitions_of_same_message_are_coalesced(messages):
+    messages.docs["m1"] = {"_id": "m1", "status": MessageStatus.ENFILEIRADA}
+
+    async def scenario():
+        buffer = StatusBuffer(messages)
+        waiters = [
+            asyncio.ensure_future(buffer.update("m1", MessageStatus.PROCESSANDO, {"attempts": 1},
+                                                {"retry_history": "timeout"})),
+            asyncio.ensure_future(buffer.update("m1", MessageStatus.ENVIADA, {"provider_sid": "SM1"},
+                                                {"retry_history": "ok"})),
+        ]
+        await asyncio.sleep(0)
+        await buffer.close()
+        return await asyncio.gather(*waiters), buffer.stats
+
+    results, stats = run(scenario())
+    assert results == [1, 1]
+    doc = messages.docs["m1"]
+    assert doc["status"] == MessageStatus.ENVIADA
+    assert (doc["attempts"], doc["provider_sid"]) == (1, "SM1")
+    assert doc["retry_history"] == ["timeout", "ok"]
+    # Uma única gravação para as duas transições
+    assert messages.calls == [("bulk_write", 1)]
+    assert stats["updates"] == 2
+
+
+def test_bulk_write_error_fails_only_affected_waiters(messages, message_stats):
+    for message_id in ("m1", "m2"):
+        messages.docs[message_id] = {"_id": message_id, "status": MessageStatus.ENFILEIRADA}
+    messages.failing_ids.add("m2")
+    sent = transition_delta(MessageStatus.ENFILEIRADA, MessageStatus.ENVIADA)
+
+    async def scenario():
+        buffer = StatusBuffer(messages, counters_collection=message_stats)
+        waiters = [asyncio.ensure_future(buffer.update(message_id, MessageStatus.ENVIADA, counters=("s1", sent)))
+                   for message_id in ("m1", "m2")]
+        await asyncio.sleep(0)
+        await buffer.close()
+        return await asyncio.gather(*waiters, return_exceptions=True), buffer.stats
+
+    (ok, error), stats = run(scenario())
+    assert ok == 1
+    assert isinstance(error, Exception) and "Falha simulada" in str(error)
+    assert messages.docs["m2"]["status"] == MessageStatus.ENFILEIRADA
+    # Só a transição gravada entra nos totais
+    assert message_stats.docs["s1"]["sent"] == 1
+    assert stats["errors"] == 1
+
+
+def test_unavailable_database_fails_every_waiter(messages):
+    messages.docs["m1"] = {"_id": "m1", "status": MessageStatus.ENFILEIRADA}
+    messages.docs["m2"] = {"_id": "m2", "status": MessageStatus.ENFILEIRADA}
+    messages.down = True
+
+    async def scenario():
+        buffer = StatusBuffer(messages)
+        waiters = [asyncio.ensure_future(buffer.update("m1", MessageStatus.ENVIADA)),
+                   asyncio.ensure_future(buffer.update("m2", MessageStatus.PROCESSANDO))]
+        await asyncio.sleep(0)
+        await buffer.close()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    assert all(isinstance(result, ConnectionError) for result in run(scenario()))
+
+
+def test_guard_keeps_final_status_and_applies_to_pending(messages):
+    messages.docs["sent"] = {"_id": "sent", "status": MessageStatus.ENVIADA}
+    messages.docs["queued"] = {"_id": "queued", "status": MessageStatus.ENFILEIRADA}
+
+    async def scenario():
+        buffer = StatusBuffer(messages)
+        buffer.start()
+        results = await asyncio.gather(
+            buffer.update("sent", MessageStatus.PROCESSANDO, {"attempts": 2}),
+            buffer.update("queued", MessageStatus.PROCESSANDO, {"attempts": 2}),
+        )
+        await buffer.close()
+        return results
+
+    assert run(scenario()) == [0, 1]
+    assert messages.docs["sent"] == {"_id": "sent", "status": MessageStatus.ENVIADA}
+    assert messages.docs["queued"]["status"] == MessageStatus.PROCESSANDO
+
+
+def test_close_flushes_pending_and_rejects_new_updates(messages):
+    for index in range(5):
+        messages.docs[f"m{index}"] = {"_id": f"m{index}", "status": MessageStatus.ENFILEIRADA}
+
+    async def scenario():
+        # Intervalo longo: só o close grava
+        buffer = StatusBuffer(messages, batch_size=2, flush_interval_seconds=60)
+        buffer.start()
+        waiters = [asyncio.ensure_future(buffer.update(f"m{index}", MessageStatus.ENVIADA)) for index in range(5)]
+        await asyncio.sleep(0)
+        await buffer.close()
+        results = await asyncio.gather(*waiters)
+        try:
+            await buffer.update("m0", MessageStatus.FALHOU)
+        except RuntimeError:
+            return results, True
+        return results, False
+
+    results, rejected = run(scenario())
+    assert results == [1] * 5 and rejected
+    assert all(doc["status"] == MessageStatus.ENVIADA for doc in messages.docs.values())
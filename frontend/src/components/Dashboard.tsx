@@ -19,7 +19,7 @@ import { LocalizationProvider } from '@mui/x-date-pickers/LocalizationProvider';
 import { AdapterDateFns } from '@mui/x-date-pickers/AdapterDateFns';
 import { DatePicker } from '@mui/x-date-pickers/DatePicker';
 import ptBR from 'date-fns/locale/pt-BR';
-import { createMessage, getMessages, logout } from '../services/api';
+import { createMessage, getMessages, logout, subscribeMessageEvents } from '../services/api';
 import { format } from 'date-fns';
 import Header from './Header';
 import Footer from './Footer';
@@ -43,6 +43,8 @@ interface User {
 const Dashboard: React.FC = () => {
   const navigate = useNavigate();
   const [messages, setMessages] = useState<Message[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | undefined>();
+  const [loadingMore, setLoadingMore] = useState(false);
   const [newMessage, setNewMessage] = useState({
     recipient_phone: '',
     message: '',
@@ -84,16 +86,49 @@ const Dashboard: React.FC = () => {
     }
   }, [navigate]);
 
+  // Status atualizado pelo servidor, sem recarregar a lista a cada mudança
+  useEffect(() => {
+    if (!currentUser) return;
+    return subscribeMessageEvents(
+      // Mensagens novas aparecem na próxima carga da lista (ex.: após enviar)
+      (event) => setMessages((current) =>
+        current.map((msg) => (msg.id === event.id ? { ...msg, status: event.status } : msg))
+      ),
+      () => loadMessages()
+    );
+  }, [currentUser]);
+
+  // Recarrega só a primeira página; as demais voltam com "Carregar mais"
   const loadMessages = async () => {
     try {
-      const data = await getMessages();
-      setMessages(data);
+      const page = await getMessages();
+      setMessages(page.messages);
+      setNextCursor(page.nextCursor);
     } catch (err) {
       console.error('Erro ao carregar mensagens:', err);
       setError('Erro ao carregar mensagens');
     }
   };
 
+  const loadMoreMessages = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const page = await getMessages(nextCursor);
+      // Ignora as que já estão na tela (ex.: lista recarregada no meio tempo)
+      setMessages((current) => {
+        const known = new Set(current.map((msg) => msg.id));
+        return [...current, ...page.messages.filter((msg) => !known.has(msg.id))];
+      });
+      setNextCursor(page.nextCursor);
+    } catch (err) {
+      console.error('Erro ao carregar mensagens:', err);
+      setError('Erro ao carregar mensagens');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
     try {
@@ -254,6 +289,13 @@ const Dashboard: React.FC = () => {
                 </Grid>
               ))}
             </Grid>
+            {nextCursor && (
+              <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
+                <Button variant="outlined" onClick={loadMoreMessages} disabled={loadingMore}>
+                  {loadingMore ? 'Carregando...' : 'Carregar mais'}
+                </Button>
+              </Box>
+            )}
           </Box>
         </Box>
       </Container>
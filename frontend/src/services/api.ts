@@ -68,9 +68,52 @@ export const logout = async () => {
   }
 };
 
-export const getMessages = async () => {
-  const response = await api.get('/api/messages');
-  return response.data;
+// A API devolve o identificador em _id; a tela e os eventos usam id
+const withId = ({ _id, ...message }: any) => ({ id: _id, ...message });
+
+// Mensagens por página da lista; as seguintes vêm sob demanda ("Carregar mais")
+const MESSAGES_PAGE_SIZE = 100;
+
+export interface MessagesPage {
+  messages: any[];
+  nextCursor?: string;
+}
+
+// Uma página da listagem; nextCursor (cabeçalho X-Next-Cursor) busca a seguinte
+export const getMessages = async (after?: string): Promise<MessagesPage> => {
+  const response = await api.get('/api/messages', { params: { limit: MESSAGES_PAGE_SIZE, after } });
+  return {
+    messages: response.data.map(withId),
+    nextCursor: response.headers['x-next-cursor'] || undefined,
+  };
+};
+
+export interface MessageStatusEvent {
+  id: string;
+  status: string;
+  created: boolean;
+  error_code?: string;
+}
+
+// Mudanças de status por Server-Sent Events, no lugar de recarregar a lista.
+// onResync: a lista deve ser recarregada (conexão lenta ou reconexão). O
+// EventSource envia o cookie de sessão. Devolve a função que encerra.
+export const subscribeMessageEvents = (
+  onMessage: (event: MessageStatusEvent) => void,
+  onResync: () => void
+) => {
+  const baseURL = api.defaults.baseURL || '';
+  const source = new EventSource(`${baseURL}/api/messages/events`, { withCredentials: true });
+  let opened = false;
+  source.onopen = () => {
+    // Eventos perdidos enquanto a conexão estava fora
+    if (opened) onResync();
+    opened = true;
+  };
+  source.addEventListener('message', (e) => onMessage(JSON.parse((e as MessageEvent).data)));
+  source.addEventListener('resync', () => onResync());
+  source.addEventListener('unavailable', () => source.close());
+  return () => source.close();
 };
 
 export const createMessage = async (message: any) => {